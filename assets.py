@@ -0,0 +1,74 @@
+import pygame, weakref
+from collections import OrderedDict
+
+#--------------------------------------------------------
+# Shared image registry
+# - every image is decoded from disk and converted once, then shared by
+#   every sprite that asks for it
+# - variants (scaled / flipped) are made once per (path, size, flip, alpha)
+# - recently used surfaces are kept up to budget bytes, least recently used
+#   first out; a surface that is still on some sprite stays shared until the
+#   last sprite lets go of it
+# Surfaces handed out are shared, never draw on them
+#--------------------------------------------------------
+
+class AssetRegistry():
+    def __init__(self, budget = 64 * 1024 * 1024):
+        self.budget = budget
+        self.cache = OrderedDict() #key -> surface, least recently used first
+        self.cache_bytes = 0
+        self.live = weakref.WeakValueDictionary() #every surface still in use somewhere
+        self.loads = 0 #images decoded from disk
+        self.hits = 0
+
+    def image(self, path, size = None, flip = False, alpha = True):
+        key = (path, tuple(size) if size is not None else None, flip, alpha)
+        surface = self.cache.get(key)
+        if surface is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return surface
+        surface = self.live.get(key)
+        if surface is not None:
+            self.hits += 1
+        else:
+            surface = self.make(path, key[1], flip, alpha)
+        self.remember(key, surface)
+        return surface
+
+    def make(self, path, size, flip, alpha):
+        if size is None and not flip:
+            self.loads += 1
+            surface = pygame.image.load(path)
+            return surface.convert_alpha() if alpha else surface.convert()
+        surface = self.image(path, alpha = alpha)
+        if size is not None:
+            surface = pygame.transform.scale(surface, size)
+        if flip:
+            surface = pygame.transform.flip(surface, True, False)
+        return surface
+
+    def remember(self, key, surface):
+        self.cache[key] = surface
+        self.live[key] = surface
+        self.cache_bytes += surface_bytes(surface)
+        while self.cache_bytes > self.budget and len(self.cache) > 1:
+            old_key, old_surface = self.cache.popitem(last = False)
+            self.cache_bytes -= surface_bytes(old_surface)
+
+    def resident_bytes(self): #Memory held by every shared surface still alive
+        return sum(surface_bytes(surface) for surface in self.live.values())
+
+    def clear(self):
+        self.cache.clear()
+        self.cache_bytes = 0
+
+
+def surface_bytes(surface):
+    return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+
+assets = AssetRegistry()
+
+def load_image(path, size = None, flip = False, alpha = True):
+    return assets.image(path, size, flip, alpha)
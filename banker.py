@@ -8,18 +8,16 @@ class Banker(Player):
         #self.image = pygame.Surface((32,64))
         # self.image.fill('red')
 
-    def player_movement(self):
-        
-        keys = pygame.key.get_pressed()
+    def player_movement(self, inputs):
 
-        if keys[pygame.K_RIGHT]:
+        if inputs.is_held(pygame.K_RIGHT):
             self.direction.x = 1
         
-        elif keys[pygame.K_LEFT]:
+        elif inputs.is_held(pygame.K_LEFT):
             self.direction.x = -1
 
         else:
             self.direction.x = 0
 
-        if keys[pygame.K_UP] and self.is_on_ground == True :
+        if inputs.is_held(pygame.K_UP) and self.is_on_ground == True :
             self.jump()
\ No newline at end of file
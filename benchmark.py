@@ -0,0 +1,524 @@
+#--------------------------------------------------------
+# Performance benchmarks
+# Runs headless:
+#   python benchmark.py                      per level suite and micro benchmarks
+#   python benchmark.py suite --json out.json --baseline benchmark_baseline.json
+#   python benchmark.py menu | load | fill | large | bodies | all
+#   python benchmark.py replay recordings/<file>.btbr
+# With --baseline the run fails (exit code 1) when a timing or memory figure
+# is worse than the baseline by more than --tolerance
+#--------------------------------------------------------
+
+import os, io, sys, time, json, random, timeit, tracemalloc, argparse, contextlib
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+from settings import *
+
+pygame.init()
+screen = pygame.display.set_mode([80*16, 80*9])
+
+from level import Level
+from assets import assets
+from ui import Scene, button
+from inputs import InputState, game_keys
+from gameloop import FrameStats
+from levelcompiler import load_level
+
+shipped_levels = [
+    ("level_map_0", level_map_0, level0_param, "./imgs/stage1_lobby.png"),
+    ("level_map_1", level_map_1, level1_param, "./imgs/stage2_basement.png"),
+    ("level_map_3", level_map_3, level3_param, "./imgs/stage3_offices.png"),
+    ("level_map_4", level_map_4, level4_param, "./imgs/stage4_executive.png"),
+]
+
+
+#--------------------------------------------------------
+# Fill rate: full screen updates vs dirty rectangles
+#--------------------------------------------------------
+def run_frames(level, frames):
+    pixels = 0
+    start = time.perf_counter()
+    for frame in range(frames):
+        with contextlib.redirect_stdout(io.StringIO()): #The level prints whenever a player is spotted
+            level.run()
+        if level.dirty_rendering:
+            rects = level.get_dirty_rects()
+            pygame.display.update(rects)
+            pixels += sum(rect.width * rect.height for rect in rects)
+        else:
+            pygame.display.update()
+            pixels += screen.get_width() * screen.get_height()
+    elapsed = time.perf_counter() - start
+    return elapsed / frames * 1000, pixels // frames
+
+
+def bench_fill_rate(frames = 300):
+    print("fill rate over", frames, "frames")
+    print(f"{'level':<14}{'full ms':>10}{'dirty ms':>10}{'full px':>12}{'dirty px':>12}{'saved':>8}")
+    for name, layout, params, background in shipped_levels:
+        full_ms, full_px = run_frames(Level(layout, params, screen, background), frames)
+        dirty_ms, dirty_px = run_frames(Level(layout, params, screen, background, dirty_rendering = True), frames)
+        print(f"{name:<14}{full_ms:>10.3f}{dirty_ms:>10.3f}{full_px:>12}{dirty_px:>12}{1 - dirty_px / full_px:>8.1%}")
+
+
+#--------------------------------------------------------
+# Level load time and image memory
+#--------------------------------------------------------
+def bench_level_load(repeats = 5):
+    print("level load, first load then average of", repeats, "reloads and resets")
+    print(f"{'level':<14}{'first ms':>10}{'reload ms':>11}{'reset ms':>10}{'decodes':>9}{'images MB':>11}")
+    for name, layout, params, background in shipped_levels:
+        loads = assets.loads
+        start = time.perf_counter()
+        level = Level(layout, params, screen, background)
+        first = (time.perf_counter() - start) * 1000
+        decodes = assets.loads - loads
+        start = time.perf_counter()
+        for repeat in range(repeats):
+            level = Level(layout, params, screen, background)
+        reload = (time.perf_counter() - start) * 1000 / repeats
+        start = time.perf_counter()
+        for repeat in range(repeats):
+            for water in level.water: #Worst case, the static layer has to be repainted
+                water.clean(level.tiles)
+            level.reset()
+        reset = (time.perf_counter() - start) * 1000 / repeats
+        print(f"{name:<14}{first:>10.2f}{reload:>11.2f}{reset:>10.2f}{decodes:>9}{assets.resident_bytes() / 2**20:>11.2f}")
+
+
+#--------------------------------------------------------
+# Menu frame time: images loaded and scaled every frame vs cached
+#--------------------------------------------------------
+def menu_buttons():
+    width, height = screen.get_size()
+    return [button(width/2.807,height/1.6,20,100,'',None,"imgs/buttons/slice_start.png","imgs/buttons/hovering_slice_start.png"),
+            button(width/2.2,height/1.3,20,100,'',None,"imgs/buttons/slice_quit.png", "imgs/buttons/hovering_slice_quit.png"),
+            button(width/2.015748,height/1.15,20,100,'',None,"imgs/buttons/slice_audio.png", "imgs/buttons/hovering_slice_audio.png"),
+            button(width/2.4063063,height/1.15,20,100,'',None,"imgs/buttons/slice_cb.png", "imgs/buttons/hovering_slice_cb.png")]
+
+
+def uncached_menu_frame(background, buttons):
+    #What every menu frame used to do
+    size = screen.get_width() / 16
+    screen.blit(pygame.transform.scale(pygame.image.load(background), (size*16,size*9)), (0,0))
+    for menu_button in buttons:
+        scaled = []
+        for path in (menu_button.image, menu_button.hovering_image):
+            image = pygame.image.load(path)
+            rect_image = image.get_rect()
+            scaled.append(pygame.transform.scale(image, ((rect_image.width/(237.5*16))*size*16,(rect_image.height/(237.5*9))*size*9)))
+        screen.blit(scaled[0], (menu_button.x, menu_button.y))
+
+
+def time_frames(draw, frames, moving):
+    start = time.perf_counter()
+    for frame in range(frames):
+        pygame.mouse.set_pos((frame * 7 % screen.get_width(), frame * 3 % screen.get_height()) if moving else (0, 0))
+        draw()
+        pygame.display.update()
+    return (time.perf_counter() - start) / frames * 1000
+
+
+def bench_menu(frames = 200):
+    print("main menu frame time over", frames, "frames")
+    print(f"{'mouse':<10}{'before ms':>11}{'after ms':>10}")
+    buttons = menu_buttons()
+    menu = Scene(screen, "imgs/start_bare.png", buttons)
+    for moving in (False, True):
+        before = time_frames(lambda: uncached_menu_frame(menu.background, buttons), frames, moving)
+        after = time_frames(menu.update, frames, moving)
+        print(f"{'moving' if moving else 'still':<10}{before:>11.3f}{after:>10.3f}")
+
+
+#--------------------------------------------------------
+# Per level suite: scripted input for a fixed number of ticks on every map,
+# timing Level.run and each phase of it
+#--------------------------------------------------------
+def scripted_inputs(ticks, seed = 0):
+    #Random but repeatable key presses for both players, changing every 8 ticks
+    rng = random.Random(seed)
+    inputs = []
+    state = None
+    for tick in range(ticks):
+        if tick % 8 == 0:
+            held = [key for key in game_keys if rng.random() < 0.3]
+        state = InputState.from_keys(held, state)
+        inputs.append(state)
+    return inputs
+
+
+class PhaseTimer():
+    #Wraps methods on one object so every call adds its time to a phase for the current tick
+    def __init__(self):
+        self.current = {}
+        self.ticks = {}
+
+    def wrap(self, owner, attribute, phase):
+        function = getattr(owner, attribute)
+        current = self.current
+        current.setdefault(phase, 0.0)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            current[phase] += time.perf_counter() - start
+            return result
+        setattr(owner, attribute, timed)
+
+    def end_tick(self):
+        for phase, seconds in self.current.items():
+            self.ticks.setdefault(phase, []).append(seconds * 1000)
+            self.current[phase] = 0.0
+
+
+def instrument(level):
+    timer = PhaseTimer()
+    for attribute in ("collect_changes", "horizontal_movement_collision", "vertical_movement_collision",
+                      "obstacle_behavior", "lever_flip", "check_banker_on_water", "check_game_ended", "draw"):
+        timer.wrap(level, attribute, attribute)
+    timer.wrap(level.elevators, "update", "elevators")
+    timer.wrap(level.janitor, "update", "janitor")
+    timer.wrap(level.banker, "update", "banker")
+    for enemy in level.enemies:
+        timer.wrap(enemy, "update", "enemies")
+        timer.wrap(enemy, "detect_player", "detect_player")
+    return timer
+
+
+def percentiles(times):
+    stats = FrameStats(len(times))
+    for ms in times:
+        stats.add(ms)
+    return {"p50": round(stats.percentile(50), 4), "p95": round(stats.percentile(95), 4), "p99": round(stats.percentile(99), 4)}
+
+
+def bench_level(level_id, ticks = 600, seed = 0):
+    layout, params, background = levels[level_id]
+    inputs = scripted_inputs(ticks, seed)
+
+    tracemalloc.start() #Memory pass, tracing slows everything down so it isn't timed
+    level = Level(layout, params, screen, background)
+    for state in inputs[:120]:
+        if not level.run(state)[0]:
+            level.reset()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    loads = []
+    for repeat in range(5): #Median of a few loads, images are already decoded by now
+        start = time.perf_counter()
+        level = Level(layout, params, screen, background)
+        loads.append((time.perf_counter() - start) * 1000)
+    load_ms = sorted(loads)[2]
+
+    timer = instrument(level)
+    run_times = []
+    for state in inputs:
+        start = time.perf_counter()
+        keep_running = level.run(state)[0]
+        run_times.append((time.perf_counter() - start) * 1000)
+        timer.end_tick()
+        if not keep_running: #Start over so every level runs the same number of ticks
+            level.reset()
+    return {"load_ms": round(load_ms, 3), "run_ms": percentiles(run_times),
+            "phases_ms": dict((phase, percentiles(times)) for phase, times in timer.ticks.items()),
+            "peak_kb": round(peak / 1024), "images_mb": round(assets.resident_bytes() / 2**20, 2)}
+
+
+#--------------------------------------------------------
+# Large levels: a generated map much bigger than the screen, the camera
+# scrolling along with the players. Drawing should cost about the same as on
+# a shipped stage since only what is on screen gets drawn
+#--------------------------------------------------------
+def walking_inputs(ticks):
+    #Both players walk right then back left, jumping now and then, so the camera keeps scrolling
+    inputs = []
+    state = None
+    for tick in range(ticks):
+        held = [pygame.K_d, pygame.K_RIGHT] if tick % 600 < 400 else [pygame.K_a, pygame.K_LEFT]
+        if tick % 90 < 10:
+            held += [pygame.K_w, pygame.K_UP]
+        state = InputState.from_keys(held, state)
+        inputs.append(state)
+    return inputs
+
+
+def time_run(level, inputs):
+    #Step and draw times, and how far the camera travelled
+    step_times = []
+    draw_times = []
+    scrolled = 0
+    for state in inputs:
+        x, y = level.camera.offset()
+        start = time.perf_counter()
+        keep_running = level.run(state, draw = False)[0]
+        middle = time.perf_counter()
+        level.draw()
+        draw_times.append((time.perf_counter() - middle) * 1000)
+        step_times.append((middle - start) * 1000)
+        scrolled += abs(level.camera.offset()[0] - x) + abs(level.camera.offset()[1] - y)
+        if not keep_running:
+            level.reset()
+    return percentiles(step_times), percentiles(draw_times), scrolled
+
+
+def bench_large_map(size = 500, ticks = 1200):
+    from mapgen import generate_map
+    generated = generate_map(size, size)
+    print(f"generated {size}x{size} map against the lobby over {ticks} ticks, milliseconds")
+    print(f"{'level':<14}{'load':>9}{'step p50':>10}{'p95':>8}{'draw p50':>10}{'p95':>8}{'pages':>7}{'chunks':>8}{'scrolled':>10}")
+    inputs = walking_inputs(ticks)
+    for name, (layout, params, background) in (("lobby", levels["lobby"]), (f"{size}x{size}", generated + ("./imgs/stage1_lobby.png",))):
+        start = time.perf_counter()
+        level = Level(layout, params, screen, background)
+        load_ms = (time.perf_counter() - start) * 1000
+        with contextlib.redirect_stdout(io.StringIO()): #The level prints whenever a player is spotted
+            step, draw, scrolled = time_run(level, inputs)
+        print(f"{name:<14}{load_ms:>9.0f}{step['p50']:>10.3f}{step['p95']:>8.3f}{draw['p50']:>10.3f}{draw['p95']:>8.3f}"
+              f"{len(level.static_layer.pages):>7}{len(level.chunks.loaded):>8}{scrolled:>8}px")
+
+    print("load time by map size, streamed in 16x16 chunks, maps already compiled")
+    print(f"{'map':<14}{'load ms':>9}{'sprites':>9}{'chunks':>8}")
+    for cols in (64, 128, 256, 512, 1024):
+        layout, params = generate_map(cols, cols)
+        load_level(layout, params)
+        start = time.perf_counter()
+        level = Level(layout, params, None, None)
+        load_ms = (time.perf_counter() - start) * 1000
+        sprites = sum(len(group) for group in level.groups())
+        print(f"{cols}x{cols:<9}{load_ms:>9.1f}{sprites:>9}{len(level.chunks.loaded):>8}")
+
+
+def bench_patrol(ticks = 300):
+    #Roomba updates one sprite at a time against the NumPy patrol, for growing numbers of roombas
+    import patrol
+    from mapgen import generate_map
+    print(f"roomba patrol over {ticks} ticks, milliseconds per tick")
+    print(f"{'roombas':<10}{'one by one':>12}{'arrays':>10}")
+    vector_from_before = patrol.vector_from
+    for cols in (64, 128, 256, 512):
+        layout, params = generate_map(cols, cols)
+        times = []
+        for vector_from in (None, 0):
+            level = Level(layout, params, None, None)
+            level.chunks.load_all()
+            players = (level.janitor.sprite.rect, level.banker.sprite.rect)
+            patrol.vector_from = len(level.enemies) + 1 if vector_from is None else vector_from
+            start = time.perf_counter()
+            for tick in range(ticks):
+                level.patrol.update(level.enemies, players)
+            times.append((time.perf_counter() - start) / ticks * 1000)
+        patrol.vector_from = vector_from_before
+        print(f"{len(level.enemies):<10}{times[0]:>12.3f}{times[1]:>10.3f}")
+
+
+def bench_items(ticks = 300):
+    #Vertical collision pass with a growing number of items lying around, with resting items
+    #asleep and with every item kept awake the way they used to be
+    from item import JanitorItem
+    from mapgen import generate_map
+    layout, params = generate_map(64, 64)
+    print(f"vertical collision with resting items over {ticks} ticks, milliseconds per tick")
+    print(f"{'items':<10}{'awake':>10}{'asleep':>10}")
+    for count in (10, 100, 1000):
+        level = Level(layout, params, None, None)
+        rng = random.Random(0)
+        tiles = level.tiles.sprites()
+        for index in range(count):
+            level.items.add(JanitorItem(rng.choice(tiles).rect.move(0, -92).topleft, 46))
+        for tick in range(200): #Let them land
+            level.vertical_movement_collision()
+        times = []
+        for sleep in (False, True):
+            start = time.perf_counter()
+            for tick in range(ticks):
+                if not sleep:
+                    for item in level.items:
+                        item.sleeping = False
+                level.vertical_movement_collision()
+            times.append((time.perf_counter() - start) / ticks * 1000)
+        print(f"{count:<10}{times[0]:>10.3f}{times[1]:>10.3f}")
+
+
+def bench_bodies(ticks = 600):
+    #Collision passes with 2, 4 and 8 players walking back and forth and jumping on the test level
+    from player import Janitor, Banker
+    layout, params, background = levels["test"]
+    print(f"player collision over {ticks} ticks")
+    print(f"{'bodies':<10}{'ms/tick':>10}{'us/body':>10}")
+    for count in (2, 4, 8):
+        level = Level(layout, params, None, None)
+        bodies = level.players()
+        spawns = [body.rect.topleft for body in bodies]
+        while len(bodies) < count:
+            x, y = spawns[len(bodies) % 2]
+            bodies.append((Janitor if len(bodies) % 2 == 0 else Banker)((x + 46 * (len(bodies) // 2), y)))
+        start = time.perf_counter()
+        for tick in range(ticks):
+            for index, body in enumerate(bodies):
+                body.direction.x = 1 if (tick // 60 + index) % 2 else -1
+                if tick % 45 == index and body.is_on_ground:
+                    body.jump()
+            level.physics.move_x(bodies)
+            level.physics.move_y(bodies)
+        elapsed = (time.perf_counter() - start) / ticks * 1000
+        print(f"{count:<10}{elapsed:>10.3f}{elapsed * 1000 / count:>10.1f}")
+
+
+#--------------------------------------------------------
+# Recorded sessions: a replay file played back headless as a workload, the
+# same steps a player took instead of scripted input. Hashes in the recording
+# show whether it still plays out the same, otherwise the timings are for a
+# different session
+#--------------------------------------------------------
+def bench_replay(path):
+    from replay import Recording, ReplayError
+    recording = Recording.load(path)
+    if recording.level_id not in levels:
+        raise ReplayError(f"unknown level {recording.level_id!r}")
+    layout, params, background = levels[recording.level_id]
+    level = Level(layout, params, screen, background)
+    if level.compiled.key != recording.level_key:
+        raise ReplayError(f"level {recording.level_id!r} has changed since it was recorded")
+    random.seed(recording.seed)
+    step_times = []
+    draw_times = []
+    diverged = None
+    outcome = ""
+    with contextlib.redirect_stdout(io.StringIO()): #The level prints whenever a player is spotted
+        for index, state in enumerate(recording.inputs()):
+            start = time.perf_counter()
+            keep_running, outcome = level.step(state)
+            middle = time.perf_counter()
+            level.inputs = state
+            level.draw()
+            draw_times.append((time.perf_counter() - middle) * 1000)
+            step_times.append((middle - start) * 1000)
+            if diverged is None and recording.hashes is not None and level.state_hash() != recording.hashes[index]:
+                diverged = index
+            if not keep_running:
+                break
+    step, draw = percentiles(step_times), percentiles(draw_times)
+    print(f"replay {os.path.basename(path)}: {recording.level_id}, {len(step_times)}/{len(recording)} steps, outcome {outcome or 'none'}")
+    print(f"{'':<8}{'p50':>9}{'p95':>8}{'p99':>8}")
+    for name, times in (("step", step), ("draw", draw)):
+        print(f"{name:<8}{times['p50']:>9.3f}{times['p95']:>8.3f}{times['p99']:>8.3f}")
+    if diverged is not None:
+        print(f"diverged from the recording at step {diverged}")
+    return {"steps": len(step_times), "step_ms": step, "draw_ms": draw, "diverged": diverged}
+
+
+#--------------------------------------------------------
+# Micro benchmarks, median microseconds per call
+#--------------------------------------------------------
+def per_call_us(function, number):
+    times = timeit.repeat(function, number = number, repeat = 5)
+    return round(sorted(times)[2] / number * 1e6, 3)
+
+
+def bench_micro():
+    layout, params, background = levels["test"]
+    level = Level(layout, params, None, None)
+    enemy = level.enemies.sprites()[0]
+    in_sight = pygame.Rect(enemy.sight_rect.x + 100, enemy.rect.y, 22, 38) #Gets past the sight rect check
+    for state in scripted_inputs(30): #Get everyone off their spawn points
+        level.step(state)
+    return {"setup_level_us": per_call_us(lambda: level.setup_level(layout, params), 20),
+            "detect_player_us": per_call_us(lambda: enemy.detect_player(in_sight), 20000),
+            "water_hazard_us": per_call_us(level.check_banker_on_water, 20000),
+            "horizontal_collision_us": per_call_us(level.horizontal_movement_collision, 2000),
+            "vertical_collision_us": per_call_us(level.vertical_movement_collision, 2000)}
+
+
+def run_suite(ticks = 600, seed = 0):
+    results = {"ticks": ticks, "levels": {}, "micro_us": {}}
+    with contextlib.redirect_stdout(io.StringIO()): #The level prints whenever a player is spotted
+        for level_id in levels:
+            results["levels"][level_id] = bench_level(level_id, ticks, seed)
+        results["micro_us"] = bench_micro()
+    return results
+
+
+def print_suite(results):
+    print("per level over", results["ticks"], "ticks, milliseconds")
+    print(f"{'level':<14}{'load':>8}{'run p50':>9}{'p95':>8}{'p99':>8}{'peak KB':>9}")
+    for level_id, result in results["levels"].items():
+        run = result["run_ms"]
+        print(f"{level_id:<14}{result['load_ms']:>8.2f}{run['p50']:>9.3f}{run['p95']:>8.3f}{run['p99']:>8.3f}{result['peak_kb']:>9.0f}")
+        for phase, times in result["phases_ms"].items():
+            print(f"  {phase:<32}{times['p50']:>9.3f}{times['p95']:>8.3f}{times['p99']:>8.3f}")
+    for name, us in results["micro_us"].items():
+        print(f"{name:<32}{us:>10.2f} us")
+
+
+def gated_metrics(results):
+    #The figures compared with the baseline: load, p50 and p95 times, memory and micro benchmarks
+    metrics = {}
+    for level_id, result in results["levels"].items():
+        metrics[f"{level_id}.load_ms"] = result["load_ms"]
+        metrics[f"{level_id}.peak_kb"] = result["peak_kb"]
+        for percentile in ("p50", "p95"):
+            metrics[f"{level_id}.run_ms.{percentile}"] = result["run_ms"][percentile]
+            for phase, times in result["phases_ms"].items():
+                metrics[f"{level_id}.{phase}_ms.{percentile}"] = times[percentile]
+    for name, us in results["micro_us"].items():
+        metrics[name] = us
+    return metrics
+
+
+def compare(results, baseline, tolerance = 0.5):
+    #Returns the regressions as (metric, baseline, now). Tiny figures get some slack
+    #(0.05ms / 1us / 64KB) since timer noise alone is bigger than that
+    regressions = []
+    now = gated_metrics(results)
+    for metric, before in gated_metrics(baseline).items():
+        if metric not in now:
+            continue
+        slack = 0.05 if "_ms" in metric else 1.0 if metric.endswith("_us") else 64
+        if now[metric] > before * (1 + tolerance) + slack:
+            regressions.append((metric, before, now[metric]))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("which", nargs = "?", default = "suite", choices = ["suite", "menu", "load", "fill", "large", "bodies", "replay", "all"])
+    parser.add_argument("recording", nargs = "?", help = "recording to play back, for replay")
+    parser.add_argument("--ticks", type = int, default = 600)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--json", help = "write the suite results to this file")
+    parser.add_argument("--baseline", help = "fail if the suite is slower than this results file")
+    parser.add_argument("--tolerance", type = float, default = 0.5, help = "allowed slowdown, 0.5 = 50%%")
+    args = parser.parse_args()
+    if args.which == "replay" and args.recording is None:
+        parser.error("replay needs a recording")
+
+    if args.which in ("menu", "all"):
+        bench_menu()
+    if args.which in ("load", "all"):
+        bench_level_load()
+    if args.which in ("fill", "all"):
+        bench_fill_rate()
+    if args.which in ("large", "all"):
+        bench_large_map()
+        bench_patrol()
+        bench_items()
+    if args.which in ("bodies", "all"):
+        bench_bodies()
+    if args.which == "replay":
+        bench_replay(args.recording)
+    if args.which in ("suite", "all"):
+        results = run_suite(args.ticks, args.seed)
+        print_suite(results)
+        if args.json:
+            with open(args.json, "w") as file:
+                json.dump(results, file, indent = 1)
+        if args.baseline:
+            with open(args.baseline) as file:
+                regressions = compare(results, json.load(file), args.tolerance)
+            for metric, before, now in regressions:
+                print(f"REGRESSION {metric}: {before:.3f} -> {now:.3f}")
+            if regressions:
+                sys.exit(1)
+            print("no regressions against", args.baseline)
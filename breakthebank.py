@@ -2,10 +2,15 @@
 # Import and initialize the pygame library
 #--------------------------------------------------------
 
-import pygame, os, random, sys
+import pygame, os, random, sys, time
 from settings import *
 from tiles import Tile
 from level import Level
+from gameloop import FrameScheduler
+from ui import Scene, button
+from inputs import InputBus, no_input
+from replay import start_recording
+from profiler import profiler, scope, ProfilerOverlay
 from statemachine import StateMachine, State
 
 pygame.init()
@@ -72,6 +77,7 @@ class CurrentScene(StateMachine):
         self.current_level = ""
         self.current_level_parems = ""
         self.current_level_bg = ""
+        self.inputs = no_input # this frame's input snapshot, set by the main loop
         super().__init__()
         print("DEF INIT")
 
@@ -95,30 +101,32 @@ class CurrentScene(StateMachine):
             bgm_ch.play(lobbyMusic, loops=-1, fade_ms=100)
             self.musicON = False
             print("bgm_ch play lobbyMusic")
-        mainMenu.update()
-        for event in pygame.event.get():
-            mouse = pygame.mouse.get_pos()
-            if event.type == pygame.QUIT:
-                self.running = False
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if start_button.isOver(mouse):
-                    button_hover.play()
-                    self.select_stage = True
-                    print("TRIGGERED start game")
-                if audio_button.isOver(mouse):
-                    if self.audioTog is True:
-                        bgm_ch.set_volume(0.0)
-                        self.audioTog = False
-                    elif self.audioTog is False:
-                        bgm_ch.set_volume(0.3)
-                        self.audioTog = True
-                if quit_button.isOver(mouse):
-                    button_hover.play()
-                    sys.exit()
-                    pygame.quit()
-            if event.type == pygame.KEYDOWN: #temp to get coords
-                if event.key == pygame.K_RETURN:
-                    print(mouse)
+        mouse = self.inputs.mouse
+        with scope("menu draw"):
+            mainMenu.update(mouse)
+        with scope("menu buttons"):
+            for event in self.inputs.events:
+                if event.type == pygame.QUIT:
+                    self.running = False
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    if start_button.isOver(mouse):
+                        button_hover.play()
+                        self.select_stage = True
+                        print("TRIGGERED start game")
+                    if audio_button.isOver(mouse):
+                        if self.audioTog is True:
+                            bgm_ch.set_volume(0.0)
+                            self.audioTog = False
+                        elif self.audioTog is False:
+                            bgm_ch.set_volume(0.3)
+                            self.audioTog = True
+                    if quit_button.isOver(mouse):
+                        button_hover.play()
+                        sys.exit()
+                        pygame.quit()
+                if event.type == pygame.KEYDOWN: #temp to get coords
+                    if event.key == pygame.K_RETURN:
+                        print(mouse)
 
     #-------------STAGE SELECTION-------------
     def drawStageSelection(self):
@@ -126,59 +134,67 @@ class CurrentScene(StateMachine):
             bgm_ch.play(selectMusic, loops=-1, fade_ms=100)
             self.musicON = True
             print("bgm_ch play selectMusic")
-        stageSelection.update()
-        mouse = pygame.mouse.get_pos()
-        for event in pygame.event.get():
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if (stage_placeholderbutton_1.isOver(mouse) and 1<=levels_to_draw):
-                    button_hover.play()
-                    print("TRIGGERED stage selection -> in game")
-                    self.current_level = level_map_0
-                    self.current_level_parems = level0_param
-                    self.current_level_bg = "./imgs/stage1_lobby.png"
-                    self.level = Level(self.current_level, self.current_level_parems, screen, "./imgs/stage1_lobby.png")
-                    self.in_game = True
-                if (stage_placeholderbutton_2.isOver(mouse) and 2<=levels_to_draw):
-                    button_hover.play()
-                    print("TRIGGERED stage selection -> in game")
-                    self.current_level = level_map_1
-                    self.current_level_parems = level1_param
-                    self.current_level_bg = "./imgs/stage2_basement.png"
-                    self.level = Level(self.current_level, self.current_level_parems, screen, "./imgs/stage2_basement.png")
-                    self.in_game = True
-                if (stage_placeholderbutton_3.isOver(mouse) and 3<=levels_to_draw):
-                    button_hover.play() 
-                    print("TRIGGERED stage selection -> in game")
-                    self.current_level = level_map_3
-                    self.current_level_parems = level3_param
-                    self.current_level_bg =  "./imgs/stage3_offices.png"
-                    self.level = Level(self.current_level, self.current_level_parems, screen, "./imgs/stage3_offices.png")
-                    self.in_game = True
-                if (stage_placeholderbutton_4.isOver(mouse) and 4<=levels_to_draw):
-                    button_hover.play()
-                    print("TRIGGERED stage selection -> in game")
-                    self.current_level = level_map_4
-                    self.current_level_parems = level4_param
-                    self.current_level_bg =  "./imgs/stage4_executive.png"
-                    self.level = Level(self.current_level, self.current_level_parems, screen, "./imgs/stage4_executive.png")
-                    self.in_game = True
-                if (stage_placeholderbutton_5.isOver(mouse) and 5<=levels_to_draw):
-                    button_hover.play()
-                    print("TRIGGERED stage selection -> in game")
-                    self.current_level = level_map_1
-                    self.current_level_parems = level1_param
-                    self.level = Level(self.current_level, self.current_level_parems, screen, "./imgs/stage1_lobby.png")
-                    self.in_game = True
-                if (stage_placeholderbutton_6.isOver(mouse) and 6<=levels_to_draw):
-                    button_hover.play()
-                    print("TRIGGERED stage selection -> in game")
-                    self.current_level = level_map_1
-                    self.current_level_parems = level1_param
-                    self.level = Level(self.current_level, self.current_level_parems, screen, "./imgs/stage1_lobby.png")
-                    self.in_game = True
-                if quit_mainmenu_button.isOver(mouse):
-                    button_hover.play()
-                    self.main_menu = True
+        mouse = self.inputs.mouse
+        with scope("menu draw"):
+            stageSelection.update(mouse)
+        with scope("menu buttons"):
+            for event in self.inputs.events:
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    if (stage_placeholderbutton_1.isOver(mouse) and 1<=levels_to_draw):
+                        button_hover.play()
+                        print("TRIGGERED stage selection -> in game")
+                        self.current_level = level_map_0
+                        self.current_level_parems = level0_param
+                        self.current_level_bg = "./imgs/stage1_lobby.png"
+                        with scope("level build"):
+                            self.level = Level(self.current_level, self.current_level_parems, screen, "./imgs/stage1_lobby.png", dirty_rect_rendering)
+                        self.in_game = True
+                    if (stage_placeholderbutton_2.isOver(mouse) and 2<=levels_to_draw):
+                        button_hover.play()
+                        print("TRIGGERED stage selection -> in game")
+                        self.current_level = level_map_1
+                        self.current_level_parems = level1_param
+                        self.current_level_bg = "./imgs/stage2_basement.png"
+                        with scope("level build"):
+                            self.level = Level(self.current_level, self.current_level_parems, screen, "./imgs/stage2_basement.png", dirty_rect_rendering)
+                        self.in_game = True
+                    if (stage_placeholderbutton_3.isOver(mouse) and 3<=levels_to_draw):
+                        button_hover.play() 
+                        print("TRIGGERED stage selection -> in game")
+                        self.current_level = level_map_3
+                        self.current_level_parems = level3_param
+                        self.current_level_bg =  "./imgs/stage3_offices.png"
+                        with scope("level build"):
+                            self.level = Level(self.current_level, self.current_level_parems, screen, "./imgs/stage3_offices.png", dirty_rect_rendering)
+                        self.in_game = True
+                    if (stage_placeholderbutton_4.isOver(mouse) and 4<=levels_to_draw):
+                        button_hover.play()
+                        print("TRIGGERED stage selection -> in game")
+                        self.current_level = level_map_4
+                        self.current_level_parems = level4_param
+                        self.current_level_bg =  "./imgs/stage4_executive.png"
+                        with scope("level build"):
+                            self.level = Level(self.current_level, self.current_level_parems, screen, "./imgs/stage4_executive.png", dirty_rect_rendering)
+                        self.in_game = True
+                    if (stage_placeholderbutton_5.isOver(mouse) and 5<=levels_to_draw):
+                        button_hover.play()
+                        print("TRIGGERED stage selection -> in game")
+                        self.current_level = level_map_1
+                        self.current_level_parems = level1_param
+                        with scope("level build"):
+                            self.level = Level(self.current_level, self.current_level_parems, screen, "./imgs/stage1_lobby.png", dirty_rect_rendering)
+                        self.in_game = True
+                    if (stage_placeholderbutton_6.isOver(mouse) and 6<=levels_to_draw):
+                        button_hover.play()
+                        print("TRIGGERED stage selection -> in game")
+                        self.current_level = level_map_1
+                        self.current_level_parems = level1_param
+                        with scope("level build"):
+                            self.level = Level(self.current_level, self.current_level_parems, screen, "./imgs/stage1_lobby.png", dirty_rect_rendering)
+                        self.in_game = True
+                    if quit_mainmenu_button.isOver(mouse):
+                        button_hover.play()
+                        self.main_menu = True
 
 
     #-------------IN GAME-------------
@@ -193,10 +209,12 @@ class CurrentScene(StateMachine):
                 bgm_ch.play(officeMusic, loops=-1, fade_ms=100)
             self.musicON = False
             print("bgm_ch play menuMusic")
-        screen.fill('black')
-        
-        keep_running, outcome = self.level.run()
+        if record_sessions and self.level.recorder is None:
+            start_recording(self.level)
+        #The level paints the whole screen, no need to clear it first
+        keep_running, outcome = self.level.run(self.inputs, steps = scheduler.steps, alpha = scheduler.alpha if render_interpolation else None, draw = scheduler.render)
         if not keep_running:
+            self.save_recording()
             if outcome == "loss":
                 self.curr_screen = screen.copy()
                 self.death_menu = True 
@@ -205,17 +223,22 @@ class CurrentScene(StateMachine):
                 self.win_menu = True 
                 
 
-        mouse = pygame.mouse.get_pos()
-        for event in pygame.event.get():
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    # put physics stuff here to remember when unpausing
-                    esc_click.play()
-                    self.curr_screen = screen.copy()
-                    self.pause_menu = True
-                # if event.key == pygame.K_RETURN:
-                #     button_hover.play()
-                #     self.main_menu = True
+        with scope("menu buttons"):
+            for event in self.inputs.events:
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE:
+                        # put physics stuff here to remember when unpausing
+                        esc_click.play()
+                        self.save_recording()
+                        self.curr_screen = screen.copy()
+                        self.pause_menu = True
+                    # if event.key == pygame.K_RETURN:
+                    #     button_hover.play()
+                    #     self.main_menu = True
+
+    def save_recording(self):
+        if self.level.recorder is not None:
+            self.level.recorder.save(os.path.join(recordings_dir, self.level.recorder.name))
 
     #-------------PAUSE MENU-------------
     def drawPauseMenu(self):
@@ -223,35 +246,38 @@ class CurrentScene(StateMachine):
             bgm_ch.pause()
             self.musicON = True
             print("====pause menu stop music")
-        screen.blit(self.curr_screen,(0,0))
-        pauseMenu.update()
-        mouse = pygame.mouse.get_pos()
-        if tutorial_button.isOver(mouse):
-                screen.blit(tutorialMenu, (0,0))
-        for event in pygame.event.get():
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if continue_button.isOver(mouse):
-                    button_hover.play()
-                    self.in_game = True
-                if quit_button.isOver(mouse):
-                    button_hover.play()
-                    self.musicON = False
-                    self.select_stage = True
-                if restart_button.isOver(mouse):
-                    self.level = Level(self.current_level, self.current_level_parems, screen, self.current_level_bg)
-                    self.in_game = True
-                    self.musicON = True
-                if audio_button.isOver(mouse):
-                    if self.audioTog is True:
-                        bgm_ch.set_volume(0.0)
-                        self.audioTog = False
-                    elif self.audioTog is False:
-                        bgm_ch.set_volume(0.3)
-                        self.audioTog = True
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE: # go back to game
-                    esc_click.play()
-                    self.in_game = True
+        mouse = self.inputs.mouse
+        with scope("menu draw"):
+            screen.blit(self.curr_screen,(0,0))
+            pauseMenu.update(mouse)
+            if tutorial_button.isOver(mouse):
+                    screen.blit(tutorialMenu, (0,0))
+        with scope("menu buttons"):
+            for event in self.inputs.events:
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    if continue_button.isOver(mouse):
+                        button_hover.play()
+                        self.in_game = True
+                    if quit_button.isOver(mouse):
+                        button_hover.play()
+                        self.musicON = False
+                        self.select_stage = True
+                    if restart_button.isOver(mouse):
+                        with scope("level build"):
+                            self.level.reset()
+                        self.in_game = True
+                        self.musicON = True
+                    if audio_button.isOver(mouse):
+                        if self.audioTog is True:
+                            bgm_ch.set_volume(0.0)
+                            self.audioTog = False
+                        elif self.audioTog is False:
+                            bgm_ch.set_volume(0.3)
+                            self.audioTog = True
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE: # go back to game
+                        esc_click.play()
+                        self.in_game = True
 
 
     #-------------DEATH MENU-------------
@@ -260,188 +286,87 @@ class CurrentScene(StateMachine):
             bgm_ch.pause()
             self.musicON = True
             print("====pause menu stop music")
-        screen.blit(self.curr_screen,(0,0))
-        deathMenu.update()
-        mouse = pygame.mouse.get_pos()
-        for event in pygame.event.get():
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if audio_button.isOver(mouse):
-                    if self.audioTog is True:
-                        bgm_ch.set_volume(0.0)
-                        self.audioTog = False
-                    elif self.audioTog is False:
-                        bgm_ch.set_volume(0.3)
-                        self.audioTog = True
-                if quit_button.isOver(mouse):
-                    button_hover.play()
-                    self.musicON = False
-                    self.select_stage = True
-                if restart_button.isOver(mouse):
-                    self.level = Level(self.current_level, self.current_level_parems, screen, self.current_level_bg)
-                    self.in_game = True
-                    self.musicON = True
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE: # go back to game
-                    esc_click.play()
-                    self.select_stage = True
+        mouse = self.inputs.mouse
+        with scope("menu draw"):
+            screen.blit(self.curr_screen,(0,0))
+            deathMenu.update(mouse)
+        with scope("menu buttons"):
+            for event in self.inputs.events:
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    if audio_button.isOver(mouse):
+                        if self.audioTog is True:
+                            bgm_ch.set_volume(0.0)
+                            self.audioTog = False
+                        elif self.audioTog is False:
+                            bgm_ch.set_volume(0.3)
+                            self.audioTog = True
+                    if quit_button.isOver(mouse):
+                        button_hover.play()
+                        self.musicON = False
+                        self.select_stage = True
+                    if restart_button.isOver(mouse):
+                        with scope("level build"):
+                            self.level.reset()
+                        self.in_game = True
+                        self.musicON = True
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE: # go back to game
+                        esc_click.play()
+                        self.select_stage = True
 
     def drawWinMenu(self):
         if self.musicON is False:
             bgm_ch.pause()
             self.musicON = True
             print("====pause menu stop music")
-        screen.blit(self.curr_screen,(0,0))
-        winMenu.update()
-        mouse = pygame.mouse.get_pos()
-        for event in pygame.event.get():
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if audio_button.isOver(mouse):
-                    if self.audioTog is True:
-                        bgm_ch.set_volume(0.0)
-                        self.audioTog = False
-                    elif self.audioTog is False:
-                        bgm_ch.set_volume(0.3)
-                        self.audioTog = True
-                if continue_button.isOver(mouse):
-                    if self.current_level == level_map_0:
+        mouse = self.inputs.mouse
+        with scope("menu draw"):
+            screen.blit(self.curr_screen,(0,0))
+            winMenu.update(mouse)
+        with scope("menu buttons"):
+            for event in self.inputs.events:
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    if audio_button.isOver(mouse):
+                        if self.audioTog is True:
+                            bgm_ch.set_volume(0.0)
+                            self.audioTog = False
+                        elif self.audioTog is False:
+                            bgm_ch.set_volume(0.3)
+                            self.audioTog = True
+                    if continue_button.isOver(mouse):
+                        if self.current_level == level_map_0:
+                            button_hover.play()
+                            print("TRIGGERED stage selection -> in game")
+                            self.current_level = level_map_1
+                            self.current_level_parems = level1_param
+                            self.current_level_bg =  "./imgs/stage2_basement.png"
+                            with scope("level build"):
+                                self.level = Level(self.current_level, self.current_level_parems, screen, "./imgs/stage2_basement.png", dirty_rect_rendering)
+                            self.in_game = True
+                        elif self.current_level == level_map_1:
+                            button_hover.play()
+                            print("TRIGGERED stage selection -> in game")
+                            self.current_level = level_map_3
+                            self.current_level_parems = level3_param
+                            self.current_level_bg =  "./imgs/stage3_offices.png"
+                            with scope("level build"):
+                                self.level = Level(self.current_level, self.current_level_parems, screen, "./imgs/stage3_offices.png", dirty_rect_rendering)
+                            self.in_game = True
+                    if quit_button.isOver(mouse):
                         button_hover.play()
-                        print("TRIGGERED stage selection -> in game")
-                        self.current_level = level_map_1
-                        self.current_level_parems = level1_param
-                        self.current_level_bg =  "./imgs/stage2_basement.png"
-                        self.level = Level(self.current_level, self.current_level_parems, screen, "./imgs/stage2_basement.png")
+                        self.musicON = False
+                        self.select_stage = True
+                    if restart_button.isOver(mouse):
+                        with scope("level build"):
+                            self.level.reset()
                         self.in_game = True
-                    elif self.current_level == level_map_1:
-                        button_hover.play()
-                        print("TRIGGERED stage selection -> in game")
-                        self.current_level = level_map_3
-                        self.current_level_parems = level3_param
-                        self.current_level_bg =  "./imgs/stage3_offices.png"
-                        self.level = Level(self.current_level, self.current_level_parems, screen, "./imgs/stage3_offices.png")
-                        self.in_game = True
-                if quit_button.isOver(mouse):
-                    button_hover.play()
-                    self.musicON = False
-                    self.select_stage = True
-                if restart_button.isOver(mouse):
-                    self.level = Level(self.current_level, self.current_level_parems, screen, self.current_level_bg)
-                    self.in_game = True
-                    self.musicON = True
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE: # go back to game
-                    esc_click.play()
-                    self.select_stage = True
+                        self.musicON = True
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE: # go back to game
+                        esc_click.play()
+                        self.select_stage = True
 
 
-#--------------------------------------------------------
-# Define Drawing Scenes
-#--------------------------------------------------------
-
-
-class Scene():
-    def __init__(self, screen, background, buttonArray, transparency = False):
-        self.screen = screen
-        self.buttons = buttonArray
-        # self.states = stateArray
-        self.background = background
-        self.transparency = transparency
-
-    def update(self):
-        if self.transparency:
-            # screen.blit(self.screen,(0,0))
-            backgroundphoto = pygame.image.load(self.background)
-            backgroundphoto = pygame.transform.scale(backgroundphoto, (size*16,size*9))
-            backgroundphoto.set_alpha(250)
-            screen.blit(backgroundphoto, (0,0))
-            for individualButton in range(len(self.buttons)):
-                self.buttons[individualButton].draw(screen)
-        else:
-            # print(self.buttons)
-            backgroundphoto = pygame.image.load(self.background).convert()
-            backgroundphoto = pygame.transform.scale(backgroundphoto, (size*16,size*9))
-            screen.blit(backgroundphoto,(0,0))
-            for individualButton in range(len(self.buttons)):
-                self.buttons[individualButton].draw(self.screen)
-            
-
-#--------------------------------------------------------
-# Define buttons
-#--------------------------------------------------------
-class button():
-    def __init__(self, x,y,width,height, text='', color = None,image=None, hovering_image=None, amplifier=None):
-        self.color = color
-        self.x = x
-        self.y = y
-        self.width = width
-        self.height = height
-        self.text = text
-        self.image = image
-        self.hovering_image = hovering_image
-        self.amplifier = amplifier
-
-    def draw(self,win,outline=None):
-        #Call this method to draw the button on the screen
-        if self.color != None:
-            if outline:
-                pygame.draw.rect(win, outline, (self.x-2,self.y-2,self.width+4,self.height+4),0)
-                
-            pygame.draw.rect(win, self.color, (self.x,self.y,self.width,self.height),0)
-        
-        if self.text != '':
-            font = pygame.font.SysFont('comicsans', 60)
-            text = font.render(self.text, 1, (0,0,0))
-            win.blit(text, (self.x + (self.width/2 - text.get_width()/2), self.y + (self.height/2 - text.get_height()/2)))
-        
-        if self.image != None:
-            if self.amplifier == None:
-                if not self.isOver(pygame.mouse.get_pos()):
-                    image = pygame.image.load(self.image)
-                    rect_image = image.get_rect()
-                    
-                    image = pygame.transform.scale(image, ((rect_image.width/(237.5*16))*size*16,(rect_image.height/(237.5*9))*size*9))
-                    
-                else:
-                    image = pygame.image.load(self.hovering_image)
-                    rect_image = image.get_rect()
-                    image = pygame.transform.scale(image, ((rect_image.width/(237.5*16))*size*16,(rect_image.height/(237.5*9))*size*9))
-            else:
-                if not self.isOver(pygame.mouse.get_pos()):
-                    image = pygame.image.load(self.image)
-                    rect_image = image.get_rect()
-                    #print(rect_image)
-                    image = pygame.transform.scale(image, ((rect_image.width/(self.amplifier*16))*size*16,(rect_image.height/(self.amplifier*9))*size*9))
-                else:
-                    image = pygame.image.load(self.hovering_image)
-                    rect_image = image.get_rect()
-                    image = pygame.transform.scale(image, ((rect_image.width/(self.amplifier*16))*size*16,(rect_image.height/(self.amplifier*9))*size*9))
-            win.blit(image, (self.x, self.y))
-
-
-    def isOver(self, pos):
-        #Pos is the mouse position or a tuple of (x,y) coordinates
-        if self.image == None:
-            if pos[0] > self.x and pos[0] < self.x + self.width:
-                if pos[1] > self.y and pos[1] < self.y + self.height:
-                    return True
-                
-            return False
-        elif self.amplifier == None:
-            image = pygame.image.load(self.image)
-            rect_image = image.get_rect()
-            if pos[0] > self.x and pos[0] < self.x + (rect_image.width/(237.5*16))*size*16:
-                if pos[1] > self.y and pos[1] < self.y + (rect_image.height/(237.5*9))*size*9:
-                    return True
-            
-            return False
-        else:
-            image = pygame.image.load(self.image)
-            rect_image = image.get_rect()
-            if pos[0] > self.x and pos[0] < self.x + (rect_image.width/(self.amplifier*16))*size*16:
-                if pos[1] > self.y and pos[1] < self.y + (rect_image.height/(self.amplifier*9))*size*9:
-                    return True
-            
-            return False
-
 #--------------------------------------------------------
 # Load background music
 #--------------------------------------------------------
@@ -459,7 +384,10 @@ bgm_ch.play(lobbyMusic, loops = -1, fade_ms = 500)
 #--------------------------------------------------------
 # Set up the drawing window
 #--------------------------------------------------------
-screen = pygame.display.set_mode([size*16, size*9])
+if vsync:
+    screen = pygame.display.set_mode([size*16, size*9], pygame.SCALED, vsync = 1)
+else:
+    screen = pygame.display.set_mode([size*16, size*9])
 # screen = pygame.transform.scale(backgroundphoto,[859, 727])
 width = screen.get_width()
 height = screen.get_height()
@@ -531,17 +459,56 @@ main_menu_music = True
 #--------------------------------------------------------
 
 
+previous_scene = None
+scheduler = FrameScheduler(simulation_rate, fps_cap, vsync, max_simulation_steps, max_skipped_frames)
+input_bus = InputBus()
+overlay = ProfilerOverlay(profiler)
+if show_profiler:
+    overlay.toggle()
+stats_timer = 0
+
 while running:
-    timer = pygame.time.Clock()
-    timer.tick(60)
+    scheduler.tick() # waits for the next frame and works out how many fixed simulation steps to run
+    profiler.end_frame()
+    with scope("input"):
+        overallScreen.inputs = input_bus.poll() # the only place events and keys are read
+    if overallScreen.inputs.key_down(pygame.K_F3): # profiler overlay on / off
+        overlay.toggle()
+        if overallScreen.current_state == overallScreen.scene_in_game:
+            overallScreen.level.invalidate()
+    if overallScreen.inputs.key_down(pygame.K_F4): # save the profiler's recent history for chrome://tracing
+        profiler.export_chrome_trace(time.strftime("profile-%Y%m%d-%H%M%S.json"))
     
-    overallScreen.update()
+    scene = overallScreen.current_state
+    if scene == overallScreen.scene_in_game and (scene != previous_scene or overlay.visible):
+        overallScreen.level.invalidate() #a menu (or the overlay) was drawn over the level
+    with scope("scene"):
+        overallScreen.update()
+    if scheduler.steps > 0: # the level has seen this frame's key presses
+        input_bus.consume()
     if overallScreen.checkChange():
-        overallScreen.go_to_next_scene()
+        with scope("scene switch"):
+            overallScreen.go_to_next_scene()
 
     #-------------PAUSE MENU-------------
    
-    pygame.display.update()
+    with scope("present"):
+        if not scheduler.render: # running behind, skip showing this frame
+            pass
+        elif overlay.visible:
+            overlay.draw(screen, overallScreen.level if scene == overallScreen.scene_in_game else None)
+            pygame.display.update()
+        elif dirty_rect_rendering and scene == overallScreen.scene_in_game:
+            pygame.display.update(overallScreen.level.get_dirty_rects()) # only push the parts of the screen that changed
+        else:
+            pygame.display.update()
+    previous_scene = scene
+
+    if show_frame_stats:
+        stats_timer += scheduler.stats.times[-1]
+        if stats_timer >= 5000:
+            print(scheduler.stats.summary())
+            stats_timer = 0
                 #for finding location of button
                 # if event.key == pygame.K_RIGHT:
                 #     xIMG = xIMG+1
@@ -0,0 +1,54 @@
+import pygame
+
+#--------------------------------------------------------
+# Camera
+# The level lives in world coordinates (pixels from the map's top left) and
+# the camera's view is the part of the world on screen. It follows both
+# players: the view is centered between them and clamped to the level so it
+# never shows past an edge. When the players are further apart than the
+# screen the view stays centered between them and whoever is off screen is
+# shown by a dot at the screen edge.
+# An axis only scrolls when the level is bigger than the screen by more than
+# the margin, so levels that (nearly) fit the screen, like every shipped stage
+# with its border walls just past the screen edge, never move and draw exactly
+# as they always have.
+#--------------------------------------------------------
+
+class Camera():
+    def __init__(self, view_size, world_size, margin = 2 * 46):
+        self.view = pygame.Rect((0,0), view_size) #The visible part of the world
+        self.world = pygame.Rect((0,0), world_size)
+        self.scroll_x = world_size[0] - view_size[0] > margin
+        self.scroll_y = world_size[1] - view_size[1] > margin
+
+    def follow(self, rects):
+        #Center the view on the rects, returns True when the view moved
+        area = rects[0].unionall(rects[1:])
+        x, y = self.view.topleft
+        if self.scroll_x:
+            x = max(0, min(area.centerx - self.view.width // 2, self.world.width - self.view.width))
+        if self.scroll_y:
+            y = max(0, min(area.centery - self.view.height // 2, self.world.height - self.view.height))
+        if (x, y) == self.view.topleft:
+            return False
+        self.view.topleft = (x, y)
+        return True
+
+    def offset(self):
+        return self.view.topleft
+
+    def to_screen(self, rect):
+        return rect.move(-self.view.x, -self.view.y)
+
+    def to_world(self, pos):
+        return pos[0] + self.view.x, pos[1] + self.view.y
+
+    def visible(self, rect, margin = 0):
+        #Is any of the rect on screen, or within margin pixels of it
+        return self.view.inflate(margin * 2, margin * 2).colliderect(rect)
+
+    def off_screen_marker(self, rect):
+        #Screen position at the edge of the view pointing towards an off screen rect
+        x = max(0, min(rect.centerx - self.view.x, self.view.width - 1))
+        y = max(0, min(rect.centery - self.view.y, self.view.height - 1))
+        return x, y
@@ -1,10 +1,12 @@
 import pygame
+from assets import load_image
+from physics import fixed_scale
 
 #when player enters elevator and activates it, they cannot move until the elevator stops moving
 class Elevator(pygame.sprite.Sprite):
     def __init__(self, pos, distance, speed):
         super().__init__()
-        self.image = pygame.image.load("./imgs/lift.png")
+        self.image = load_image("./imgs/lift.png")
         #self.image = pygame.Surface((92, 23))
         #self.image.fill("black")
         self.rect = self.image.get_rect(topleft = pos)
@@ -15,15 +17,27 @@ class Elevator(pygame.sprite.Sprite):
         self.activated = False
         self.startX = pos[0]
         self.endX = self.startX + 100
+        self.riders = set() #Bodies standing on the platform, kept by the level's physics
         
     def move(self):
         if self.direction == 1:
-            self.rect.y -= self.speed
+            self.carry(-self.speed)
             self.posFromStart += self.speed
         elif self.direction == -1:
-            self.rect.y += self.speed
+            self.carry(self.speed)
             self.posFromStart -= self.speed
+
+    def carry(self, dy): #Move the platform and everyone on it
+        self.rect.y += dy
+        for rider in self.riders:
+            rider.rect.y += dy
+            rider.fixed_y += dy * fixed_scale
         
+    def patrol_area(self): #Everywhere the elevator can be between its stops
+        bottom = self.rect.bottom + self.posFromStart + self.speed
+        top = bottom - self.distance - self.speed * 2 - self.rect.height
+        return pygame.Rect(self.rect.x, top, self.rect.width, bottom - top)
+
     def reverse_dir(self):
         self.direction *= -1
         
@@ -1,4 +1,5 @@
 import pygame
+from bisect import bisect_right
 
 enemyr = pygame.image.load("./imgs/enemyr.png")
 enemyl = pygame.image.load("./imgs/enemyl.png")
@@ -33,9 +34,8 @@ class Enemy(pygame.sprite.Sprite):
 class Roomba(Enemy):
     def __init__(self, pos, distance, speed):
         super().__init__(pos, distance, speed)
-        self.sight_image = pygame.Surface((1000, 44))
-        self.sight_image.fill((50, 50, 50))
-        self.sight_rect = self.sight_image.get_rect(topleft = self.rect.topright)
+        self.sight_rect = pygame.Rect(self.rect.topright, (1000, 44))
+        self.blockers = [] #Sorted x positions of the tiles in the roomba's row
         
     def move(self):
         if self.direction == 1:
@@ -63,22 +63,25 @@ class Roomba(Enemy):
 
         return self.sight_rect
     
-    def detect_player(self, player_rect, tiles):
-        tiles_to_check = []
-        
+    def patrol_area(self): #Everywhere the roomba can be while it patrols
+        start = self.rect.x - self.posFromStart
+        return pygame.Rect(start - self.speed, self.rect.y, self.distance + self.speed * 2 + self.rect.width, self.rect.height)
+
+    def sight_band(self, width): #The strip of the level the roomba can ever see along
+        return pygame.Rect(0, self.sight_rect.top, width, self.sight_rect.height)
+
+    def set_blockers(self, tiles):
+        self.blockers = sorted(tile.rect.x for tile in tiles)
+
+    def detect_player(self, player_rect):
         if not pygame.Rect.colliderect(self.sight_rect, player_rect):
             return False
         
-        for tile in tiles.sprites(): #looking through all sprites
-            if tile.rect.colliderect(self.sight_rect): #if tile is colliding with the sight
-                #print(player_rect.x < tile.rect.x, tile.rect.x < self.sight_rect.midright[0])
-                tiles_to_check.append(tile)
-
+        return self.line_of_sight(self.rect.x, player_rect)
 
-        for index, tile in enumerate(tiles_to_check):
-            if player_rect.x < tile.rect.x and tile.rect.x < self.rect.x:
-                break
-            if player_rect.x > tile.rect.x and tile.rect.x > self.rect.x:
-                break
-            if index == len(tiles_to_check) - 1: return True
-        return False
\ No newline at end of file
+    def line_of_sight(self, x, player_rect):
+        #Seen from x unless a tile in the row sits between the player and the roomba
+        low = min(player_rect.x, x)
+        high = max(player_rect.x, x)
+        index = bisect_right(self.blockers, low)
+        return index == len(self.blockers) or self.blockers[index] >= high
@@ -0,0 +1,76 @@
+import pygame
+from collections import deque
+
+#--------------------------------------------------------
+# Frame pacing for the main loop
+# - the simulation advances in fixed steps (60 per second by default) no matter
+#   how fast frames are drawn, using an accumulator of elapsed time
+# - frames are capped with a single long-lived Clock (or left to vsync)
+# - when the game falls behind, rendering is skipped for a few frames and at
+#   most max_steps simulation steps run per frame
+#--------------------------------------------------------
+
+class FrameStats():
+    def __init__(self, window = 300):
+        self.times = deque(maxlen = window) #Last frame times in milliseconds
+
+    def add(self, ms):
+        self.times.append(ms)
+
+    def average(self):
+        if not self.times:
+            return 0.0
+        return sum(self.times) / len(self.times)
+
+    def percentile(self, percent):
+        if not self.times:
+            return 0.0
+        ordered = sorted(self.times)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index]
+
+    def summary(self):
+        return f"frame avg {self.average():.2f}ms p95 {self.percentile(95):.2f}ms p99 {self.percentile(99):.2f}ms"
+
+
+class FrameScheduler():
+    def __init__(self, step_rate = 60, fps_cap = 60, vsync = False, max_steps = 5, max_skipped_frames = 0):
+        self.clock = pygame.time.Clock()
+        self.step_ms = 1000 / step_rate
+        self.fps_cap = 0 if vsync else fps_cap #With vsync the display flip does the waiting
+        self.max_steps = max_steps
+        self.max_skipped_frames = max_skipped_frames
+        self.accumulator = 0.0
+        self.steps = 0 #Simulation steps to run this frame
+        self.alpha = 0.0 #How far between the last two simulation steps the next frame is drawn
+        self.render = True
+        self.skipped_frames = 0
+        self.dropped_steps = 0
+        self.stats = FrameStats()
+
+    def advance(self, elapsed_ms, work_ms = 0):
+        #Turn elapsed time into a number of simulation steps to run this frame
+        self.stats.add(elapsed_ms)
+        self.accumulator += elapsed_ms
+        steps = int(self.accumulator // self.step_ms)
+        if steps > self.max_steps: #Too far behind to catch up, drop the extra time
+            self.dropped_steps += steps - self.max_steps
+            steps = self.max_steps
+            self.accumulator = self.accumulator % self.step_ms
+        else:
+            self.accumulator -= steps * self.step_ms
+        self.alpha = self.accumulator / self.step_ms
+
+        budget = 1000 / self.fps_cap if self.fps_cap else self.step_ms
+        if work_ms > budget and self.skipped_frames < self.max_skipped_frames: #Last frame went over budget
+            self.render = False
+            self.skipped_frames += 1
+        else:
+            self.render = True
+            self.skipped_frames = 0
+        return steps
+
+    def tick(self):
+        elapsed = self.clock.tick(self.fps_cap)
+        self.steps = self.advance(elapsed, self.clock.get_rawtime()) #rawtime is the frame's time before waiting
+        return self.steps
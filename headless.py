@@ -0,0 +1,31 @@
+import os
+import pygame
+
+#--------------------------------------------------------
+# Run levels without a window, e.g. for bots, replays and tests.
+# Levels made here have no display surface, so only step() them.
+#--------------------------------------------------------
+
+def init_headless():
+    if not pygame.display.get_init():
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        pygame.display.init()
+    if pygame.display.get_surface() is None:
+        pygame.display.set_mode((1, 1)) #Images still need a display to convert() against
+
+
+def make_level(level_map, level_param):
+    init_headless()
+    from level import Level
+    return Level(level_map, level_param, None, None)
+
+
+def simulate(level, inputs):
+    #Step the level through a sequence of InputStates, stop early if it ends
+    ticks = 0
+    for state in inputs:
+        keep_running, outcome = level.step(state)
+        ticks += 1
+        if not keep_running:
+            return ticks, outcome
+    return ticks, ""
@@ -0,0 +1,63 @@
+import pygame
+
+#--------------------------------------------------------
+# Heads up display drawn over the level
+# - fonts are looked up once per process and shared
+# - each element keeps its last rendered surface and only renders again
+#   when the value it shows changes
+#--------------------------------------------------------
+
+fonts = {}
+
+def get_font(name, size):
+    font = fonts.get((name, size))
+    if font is None:
+        font = fonts[(name, size)] = pygame.font.SysFont(name, size)
+    return font
+
+
+class HudText():
+    #Text showing a value, e.g. the score or a timer
+    def __init__(self, position, font_name = 'timesnewroman', font_size = 40, color = 'Black', format = str):
+        self.position = position
+        self.font_name = font_name
+        self.font_size = font_size
+        self.color = color
+        self.format = format
+        self.text = None
+        self.image = None
+        self.renders = 0
+
+    def set(self, value):
+        text = self.format(value)
+        if text != self.text:
+            self.text = text
+            self.image = None #Rendered again the next time it is drawn
+
+    def get_image(self):
+        if self.image is None:
+            self.image = get_font(self.font_name, self.font_size).render(self.text, False, self.color)
+            self.renders += 1
+        return self.image
+
+    def draw(self, draw_sprite):
+        if self.text is None:
+            return
+        image = self.get_image()
+        draw_sprite(image, image.get_rect(topleft = self.position))
+
+
+class Hud():
+    def __init__(self):
+        self.elements = {}
+
+    def add(self, name, element):
+        self.elements[name] = element
+        return element
+
+    def set(self, name, value):
+        self.elements[name].set(value)
+
+    def draw(self, draw_sprite):
+        for element in self.elements.values():
+            element.draw(draw_sprite)
@@ -0,0 +1,72 @@
+import pygame
+from collections import namedtuple
+
+# Every key the level reacts to
+#  janitor: a/d move, w jump, s interact, f pick up, j drop
+#  banker: arrows move, up jump, down interact, / pick up, j drop
+game_keys = (pygame.K_a, pygame.K_d, pygame.K_w, pygame.K_s, pygame.K_f, pygame.K_j,
+             pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN, pygame.K_SLASH)
+
+# Immutable snapshot of the input for one tick. held is every key that is down,
+# pressed is the keys that went down this tick, events is everything else that
+# came out of the event queue this frame (clicks, escape, quit).
+class InputState(namedtuple("InputState", ["held", "pressed", "mouse", "events"], defaults = [()])):
+    __slots__ = ()
+
+    def is_held(self, key):
+        return key in self.held
+
+    def was_pressed(self, key):
+        return key in self.pressed
+
+    def key_down(self, key): #Any key, not just the game keys
+        return any(event.type == pygame.KEYDOWN and event.key == key for event in self.events)
+
+    def clicked(self):
+        return any(event.type == pygame.MOUSEBUTTONDOWN for event in self.events)
+
+    def quit(self):
+        return any(event.type == pygame.QUIT for event in self.events)
+
+    @classmethod
+    def from_keys(cls, held, previous = None, mouse = (0,0), events = ()):
+        held = frozenset(held)
+        pressed = held - previous.held if previous is not None else held
+        return cls(held, pressed, mouse, events)
+
+    @classmethod
+    def from_keyboard(cls, previous = None):
+        keys = pygame.key.get_pressed()
+        return cls.from_keys((key for key in game_keys if keys[key]), previous, pygame.mouse.get_pos())
+
+
+no_input = InputState(frozenset(), frozenset(), (0,0))
+
+
+#--------------------------------------------------------
+# Input bus
+# The one place that reads the event queue and the keyboard. poll() is called
+# once per frame and the snapshot it returns is handed to the scene, the level,
+# the players, levers and obstacles, so nothing else drains the queue.
+# A frame can run no simulation steps at all, so key presses are kept and
+# handed out again by every poll until consume() says a step has seen them.
+#--------------------------------------------------------
+class InputBus():
+    def __init__(self):
+        self.state = no_input
+        self.unconsumed = frozenset() #Presses no simulation step has seen yet
+
+    def poll(self):
+        events = tuple(pygame.event.get())
+        keys = pygame.key.get_pressed()
+        held = frozenset(key for key in game_keys if keys[key])
+        #A key that went down and up again between two polls still counts as pressed
+        tapped = frozenset(event.key for event in events if event.type == pygame.KEYDOWN and event.key in game_keys)
+        self.unconsumed |= (held - self.state.held) | tapped
+        state = InputState(held, self.unconsumed, pygame.mouse.get_pos(), events)
+        self.state = state
+        return state
+
+    def consume(self):
+        #Call once the frame ran at least one simulation step with the last poll
+        self.unconsumed = frozenset()
@@ -1,24 +1,35 @@
 import pygame, copy
+from assets import load_image
+from physics import fixed_scale, fall
 
 class Item(pygame.sprite.Sprite):
+    #Collision masks, see physics.py. Items only fall
+    collides_x = ()
+    collides_y = (("tiles", True, True),)
+
     def __init__(self, pos, size, img):
         super().__init__()
-        self.image = pygame.transform.scale(pygame.image.load(img), (45, 45)).convert_alpha()
+        self.img = img
+        self.image = load_image(img, (45, 45))
         # self.uncollected_image = pygame.image.load(img).convert_alpha()
         # self.collected_image = pygame.image.load(img).convert_alpha()
         self.uncollected_img = self.image
-        self.collected_img = pygame.transform.scale(self.image, (25, 25)).convert_alpha()
-        self.right_img = pygame.transform.flip(self.image, True, False)
+        self.collected_img = load_image(img, (25, 25))
+        self.right_img = load_image(img, (45, 45), flip = True)
         self.left_img = self.image
         
         self.rect = self.image.get_rect(topleft = pos)
         self.direction = pygame.math.Vector2(0,0)
+        self.fixed_y = self.rect.y * fixed_scale #Fixed point height and vertical speed, see physics.py
+        self.velocity_y = 0
         self.collected = False
-        self.gravity = 0.4
+        self.gravity = 400
+        self.is_on_ground = False
+        self.platform = None #Items don't ride elevators, their mask has none
+        self.sleeping = False #Resting on a tile, the physics skips it until it is picked up, dropped or its floor changes
         
     def apply_gravity(self):
-        self.direction.y += self.gravity
-        self.rect.y += self.direction.y
+        fall(self)
         
         
     def collect_item(self, pos):
@@ -26,20 +37,22 @@ class Item(pygame.sprite.Sprite):
         # self.image = self.collected_image
         
         self.image = self.collected_img
-        self.right_img = pygame.transform.flip(self.image, True, False)
+        self.right_img = load_image(self.img, (25, 25), flip = True)
         self.left_img = self.image
         self.rect = self.image.get_rect(topright = pos)
         self.gravity = 0
+        self.sleeping = False
     
     def drop_item(self, pos):
         self.collected = False
         # self.image = self.uncollected_image
         
         self.image = self.uncollected_img
-        self.right_img = pygame.transform.flip(self.image, True, False)
+        self.right_img = load_image(self.img, (45, 45), flip = True)
         self.left_img = self.image
         self.rect = self.image.get_rect(topleft = pos)
-        self.gravity = 0.4
+        self.gravity = 400
+        self.sleeping = False
         
     def update(self, pos, facingRight):   #only called if player is holding the item
         
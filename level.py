@@ -5,316 +5,268 @@ from enemy import Roomba
 from item import JanitorItem, BankerItem
 from exit import JanitorExit, BankerExit
 from obstacle import PointObstacle, InteractObstacle, InteractBox
-from water import Water
+from water import Water, WaterIndex
 from elevator import Elevator
+from spatial import SpatialGrid, IndexedGroup
+from staticlayer import StaticLayer
+from camera import Camera
+from streaming import LevelChunks
+from patrol import PatrolSystem
+from physics import PhysicsWorld
+from inputs import InputState, no_input
+from assets import load_image
+from hud import Hud, HudText
+from levelcompiler import load_level
+from snapshot import take_snapshot, restore_snapshot
+from profiler import scope
+
+tile_images = {"X": "./imgs/floor1.png", "A": "./imgs/floor2.png", "Q": "./imgs/floor3.png"}
+
+# Profiler scopes for the phases of a frame, they cost next to nothing while the profiler is off
+step_scope = scope("step")
+streaming_scope = scope("chunk streaming")
+changes_scope = scope("static changes")
+elevators_scope = scope("elevators")
+patrol_scope = scope("patrol")
+players_scope = scope("players")
+physics_x_scope = scope("physics x")
+physics_y_scope = scope("physics y")
+interactions_scope = scope("interactions")
+end_scope = scope("end checks")
+record_scope = scope("record")
+draw_scope = scope("draw")
+camera_scope = scope("draw camera")
+static_scope = scope("draw static")
+sprites_scope = scope("draw sprites")
+hud_scope = scope("draw hud")
+
+def save_state(obj):
+    #Copy of an object's attributes that later changes to the object can't reach
+    state = {}
+    for name, value in vars(obj).items():
+        if name.startswith("_Sprite"): #Group membership, restored through the groups
+            continue
+        if isinstance(value, (pygame.Rect, pygame.math.Vector2)):
+            value = value.copy()
+        elif isinstance(value, (list, set)):
+            value = type(value)(value)
+        state[name] = value
+    return state
+
+def restore_state(obj, state):
+    for name, value in state.items():
+        if isinstance(value, (pygame.Rect, pygame.math.Vector2)):
+            value = value.copy()
+        elif isinstance(value, (list, set)):
+            value = type(value)(value)
+        setattr(obj, name, value)
 
 class Level:
-    def __init__(self, level_map, level_param, surface, bg_image):
+    def __init__(self, level_map, level_param, surface, bg_image, dirty_rendering = False):
         self.display_surface = surface
+        self.dirty_rendering = dirty_rendering #Only erase and redraw what moved instead of the whole screen
+        self.full_redraw = True
+        self.erased = []
+        self.drawn = []
         self.level_map = level_map
         self.level_param = level_param
-        self.bg_image = pygame.image.load(bg_image).convert_alpha()
+        self.inputs = no_input
+        self.previous_positions = {}
+        self.recorder = None #Gets every step's input when a session is being recorded
+        self.camera = None
         self.setup_level(level_map, level_param)
+        cols, rows = self.compiled.size()
+        self.world_size = (cols * self.tile_size, rows * self.tile_size)
+        for enemy in self.enemies:
+            self.update_sight(enemy)
+        self.static_changes = []
+        if surface is None: #Headless, the level is only ever stepped
+            self.bg_image = None
+            self.static_layer = None
+            self.camera = None
+        else:
+            self.bg_image = load_image(bg_image)
+            self.static_layer = StaticLayer(self.bg_image, self.grid, ["tiles", "water", "obstacles", "points", "levers", "exits"])
+            self.camera = Camera(surface.get_size(), self.world_size)
+            self.camera.follow([self.janitor.sprite.rect, self.banker.sprite.rect])
+            self.chunks.update() #What the camera shows on the first frame
+        self.grid.take_changes() #Everything built so far is already baked in
+        self.score = 0
+        self.hud = Hud()
+        self.hud.add("score", HudText((6, 6), 'timesnewroman', 40, 'Black'))
+        self.capture_initial_state()
+
+    def groups(self):
+        #Every sprite group in the level, in the order they were made
+        return [self.tiles, self.janitor, self.banker, self.enemies, self.items, self.points, self.obstacles,
+                self.levers, self.exits, self.elevators, self.water_tiles]
+
+    def capture_initial_state(self):
+        #Streamed chunks are not part of it, a restart just forgets them all
+        self.initial_groups = [(group, group.sprites()) for group in self.groups() if not self.chunks.owns(group)]
+        self.initial_sprites = [(sprite, save_state(sprite)) for group, sprites in self.initial_groups for sprite in sprites]
+        self.initial_water = [(water, water.active) for water in self.water] #Only the flag, a pool keeps its floor tiles for the next clean
+
+    def snapshot(self):
+        return take_snapshot(self)
+
+    def restore(self, snapshot):
+        restore_snapshot(self, snapshot)
+
+    def state_hash(self):
+        return take_snapshot(self).state_hash()
+
+    def reset(self):
+        #Put the level back the way it started, reusing every sprite and surface
+        if self.chunks.streaming:
+            self.chunks.clear()
+        for sprite, state in self.initial_sprites:
+            restore_state(sprite, state)
+        for water, active in self.initial_water:
+            water.active = active
+        self.water_index.rebuild(self.water)
+
+        changed_layers = set(layer for sprite, (layer, order, keys, rect) in self.grid.entries.items() if sprite.rect != rect) #e.g. a flipped lever
+        for group, sprites in self.initial_groups:
+            if group.sprites() != sprites:
+                if isinstance(group, IndexedGroup):
+                    changed_layers.add(group.layer)
+                else:
+                    group.empty()
+                    group.add(*sprites)
+        #Refill whole layers so the grid keeps the order a new level would have
+        refill = [(group, sprites) for group, sprites in self.initial_groups if isinstance(group, IndexedGroup) and group.layer in changed_layers]
+        for group, sprites in refill:
+            group.empty()
+        for group, sprites in refill:
+            group.add(*sprites)
+
+        if self.camera is not None:
+            self.camera.follow([self.janitor.sprite.rect, self.banker.sprite.rect])
+        self.chunks.update()
+        if self.grid.take_changes():
+            for enemy in self.enemies:
+                self.update_sight(enemy)
+            if self.static_layer is not None:
+                self.static_layer.bake()
+        self.static_changes = []
         self.score = 0
+        self.inputs = no_input
+        self.previous_positions = {}
+        self.recorder = None #A recording can't go on past a restart
+        self.patrol.invalidate()
+        self.invalidate()
 
     def setup_level(self, layout, level_param):
-        self.tiles = pygame.sprite.Group()
+        tile_size = 46
+        self.tile_size = tile_size
+        self.level_width = len(layout[0]) * tile_size
+        self.grid = SpatialGrid(tile_size) #Index of the static solids, queried by the collision passes
+        self.tiles = IndexedGroup(self.grid, "tiles")
         self.janitor = pygame.sprite.GroupSingle()
         self.banker = pygame.sprite.GroupSingle()
         self.enemies = pygame.sprite.Group()
         self.items = pygame.sprite.Group()
-        self.points = pygame.sprite.Group()
-        self.obstacles = pygame.sprite.Group()
-        self.levers = pygame.sprite.Group()
-        self.exits = pygame.sprite.Group()
+        self.points = IndexedGroup(self.grid, "points")
+        self.obstacles = IndexedGroup(self.grid, "obstacles")
+        self.levers = IndexedGroup(self.grid, "levers")
+        self.exits = IndexedGroup(self.grid, "exits")
         self.elevators = pygame.sprite.Group()
         self.water = []
-        tile_size = 46
-        currParam = 0
-        col_index = 0
-        row_index = 0
-        while row_index < len(layout):
-            # print(row_index)
-            # print(row)
-            row = layout[row_index]
-            col_index = 0
-            while col_index < len(row):
-                cell = layout[row_index][col_index]
-                #print(f'{row_index},{col_index}:{cell}')
-                x = col_index * tile_size
-                y = row_index * tile_size
-                
-                if cell == "X":    
-                    tile = Tile((x,y), "./imgs/floor1.png")
-                    self.tiles.add(tile)
-                    
-                if cell == "A":    
-                    tile = Tile((x,y), "./imgs/floor2.png")
-                    self.tiles.add(tile)
-
-                if cell == "Q":
-                    tile = Tile((x,y), "./imgs/floor3.png")
-                    self.tiles.add(tile)
-
-                if cell == "J":
-                    player_sprite = Janitor((x,y+8))
-                    self.janitor.add(player_sprite)
-                              
-                if cell == "B":
-                    banker_sprite = Banker((x,y+8))
-                    self.banker.add(banker_sprite)
-                    
-                if cell == "E":
-                    enemy_distance = level_param[currParam][0]
-                    enemy_speed = level_param[currParam][1]
-                    currParam += 1
-                    roomba_sprite = Roomba((x, y), enemy_distance, enemy_speed)
-                    self.enemies.add(roomba_sprite)
-                    
-                if cell == "F":
-                    janitor_item_sprite = JanitorItem((x, y+1), (64, 32))
-                    self.items.add(janitor_item_sprite)
-                
-                if cell == "G":
-                    banker_item_sprite = BankerItem((x, y+1), (64, 32))
-                    self.items.add(banker_item_sprite)
-                    
-                if cell == "C":
-                    point = PointObstacle((x,y), tile_size)
-                    self.points.add(point)
-                
-                if cell == "O":
-                    uniqueID = level_param[currParam][0]
-                    currParam += 1
-                    obstacle = InteractObstacle((x, y + tile_size), tile_size, tile_size * 2, uniqueID)
-                    self.obstacles.add(obstacle)   
-                           
-                if cell == "L":
-                    uniqueID = level_param[currParam][0]
-                    currParam += 1
-                    lever = InteractBox((x,y), uniqueID)
-                    self.levers.add(lever)
-                    
-                if cell == "N":
-                    janitor_exit = JanitorExit((x,y))
-                    self.exits.add(janitor_exit)
-                    
-                if cell == "M":
-                    banker_exit = BankerExit((x,y))
-                    self.exits.add(banker_exit)
-                    
-                if cell == "Z":
-                    elevator_distance = level_param[currParam][0]
-                    elevator_speed = level_param[currParam][1] 
-                    currParam += 1
-                    elevator = Elevator((x, y), elevator_distance, elevator_speed)
-                    self.elevators.add(elevator)
-                    
-                if cell == "W":
-                    water_tiles = pygame.sprite.Group()
-                    startX = x
-                    while col_index < len(row) and layout[row_index][col_index] == "W":
-                        x = col_index * tile_size
-                        y = row_index * tile_size
-                        water = Tile((x,y), "./imgs/water.png")
-                        water_tiles.add(water)
-                        col_index += 1
-                    col_index -= 1
-                    endX = x + 46
-                    water_object = Water(water_tiles, startX, endX, y)
-                    self.water.append(water_object)
-                    
-                col_index += 1
-            row_index += 1
-                    
-                    
-                    
-               
+        self.water_tiles = IndexedGroup(self.grid, "water") #The loaded tiles of the pools not cleaned yet
+        self.water_index = WaterIndex(tile_size) #The pools not cleaned yet, by row
+        #Roombas and elevators move, but only ever within their patrol, so they are
+        #indexed by the whole patrol to find the ones on screen
+        self.patrol_areas = SpatialGrid(tile_size * 8)
+        self.patrol = PatrolSystem() #Moves the roombas and has them look for the players
+        self.physics = PhysicsWorld(self.grid, tile_size, self.patrol_areas, ("elevators",)) #Moves the players and items
+        compiled = load_level(layout, level_param) #Parsed and checked once, then cached
+        self.compiled = compiled
+        self.chunks = LevelChunks(self, compiled) #Tiles, water tiles, coins, roombas and elevators
 
-    def horizontal_movement_collision(self):
-        janitor = self.janitor.sprite  
-        janitor.rect.x += janitor.direction.x * janitor.speed
-        banker = self.banker.sprite  
-        banker.rect.x += banker.direction.x * banker.speed
-        # for enemy in self.enemies.sprites():
-        #     enemy.rect.x += enemy.direction * enemy.speed
-
-        for sprite in self.tiles.sprites(): #Looking through all tiles on map (x axis)
-            if sprite.rect.colliderect(janitor.rect): #If janitor 1 collides with a tile
-                if janitor.direction.x < 0: #Moving right
-                    janitor.rect.left = sprite.rect.right
-                elif janitor.direction.x > 0: #Moving left
-                    janitor.rect.right = sprite.rect.left
-            if sprite.rect.colliderect(banker.rect): #If janitor 2 collides with a tile
-                if banker.direction.x < 0: #Moving right
-                    banker.rect.left = sprite.rect.right
-                elif banker.direction.x > 0: #Moving left
-                    banker.rect.right = sprite.rect.left
+        for kind, col, row, first, second in compiled.entities[~self.chunks.is_chunk_entity].tolist(): #The rest come with their chunk
+            self.add_entity(chr(kind), col, row, first, second)
 
-                    
-        for sprite in self.elevators.sprites(): #Looking through all tiles on map (x axis)
-            if sprite.rect.colliderect(janitor.rect): #If janitor 1 collides with a tile
-                if janitor.direction.x < 0: #Moving right
-                    janitor.rect.left = sprite.rect.right
-                elif janitor.direction.x > 0: #Moving left
-                    janitor.rect.right = sprite.rect.left
-            if sprite.rect.colliderect(banker.rect): #If janitor 2 collides with a tile
-                if banker.direction.x < 0: #Moving right
-                    banker.rect.left = sprite.rect.right
-                elif banker.direction.x > 0: #Moving left
-                    banker.rect.right = sprite.rect.left
-                    
-            # for enemy in self.enemies.sprites():
-            #     if sprite.rect.colliderect(enemy.rect): #if enemy collides with a tile
-            #         if enemy.direction < 0: #moving left
-            #             enemy.rect.left = sprite.rect.right
-            #         elif enemy.direction > 0: #moving right
-            #             enemy.rect.right = sprite.rect.left
-                    
-        for sprite in self.obstacles.sprites(): # Same as above but with obstacles
-            if sprite.rect.colliderect(janitor.rect):
-                if janitor.direction.x < 0:
-                    janitor.rect.left = sprite.rect.right
-                elif janitor.direction.x > 0: #Moving left
-                    janitor.rect.right = sprite.rect.left
-            if sprite.rect.colliderect(banker.rect): #If janitor 2 collides with an obstacle
-                if banker.direction.x < 0: #Moving right
-                    banker.rect.left = sprite.rect.right 
-                elif banker.direction.x > 0: #Moving left
-                    banker.rect.right = sprite.rect.left
-            
-        for sprite in self.levers.sprites(): # Looking through all levers on map (x axis)
-            if sprite.rect.colliderect(janitor.rect): #If janitor 1 collides with a lever
-                if janitor.direction.x < 0: #Moving right
-                    janitor.rect.left = sprite.rect.right
-                elif janitor.direction.x > 0: #Moving left
-                    janitor.rect.right = sprite.rect.left
-            if sprite.rect.colliderect(banker.rect): #If janitor 2 collides with a lever
-                if banker.direction.x < 0: #Moving right
-                    banker.rect.left = sprite.rect.right 
-                elif banker.direction.x > 0: #Moving left
-                    banker.rect.right = sprite.rect.left
-                    
-        for waterObject in self.water:
-            for waterTile in waterObject.tiles:
-                if waterTile.rect.colliderect(janitor.rect): #If janitor 1 collides with a lever
-                    if janitor.direction.x < 0: #Moving right
-                        janitor.rect.left = waterTile.rect.right
-                    elif janitor.direction.x > 0: #Moving left
-                        janitor.rect.right = waterTile.rect.left
-                if waterTile.rect.colliderect(banker.rect): #If janitor 2 collides with a lever
-                    if banker.direction.x < 0: #Moving right
-                        banker.rect.left = waterTile.rect.right 
-                    elif banker.direction.x > 0: #Moving left
-                        banker.rect.right = waterTile.rect.left
-                
+        for kind, col, row in compiled.exits.tolist():
+            if chr(kind) == "N":
+                self.exits.add(JanitorExit((col * tile_size, row * tile_size)))
+            else:
+                self.exits.add(BankerExit((col * tile_size, row * tile_size)))
 
-    def vertical_movement_collision(self):
-        janitor = self.janitor.sprite
-        janitor.apply_gravity()
-        banker = self.banker.sprite
-        banker.apply_gravity()
-        
-        banker_is_colliding_with_tile = False
-        janitor_is_colliding_with_tile = False
+        for row, start_col, end_col in compiled.water.tolist(): #The tiles come with the chunks they are in
+            self.water.append(Water(self.water_tiles, start_col * tile_size, end_col * tile_size, row * tile_size, self.water_index))
 
-        for item in self.items:
-            item.apply_gravity()
-        
-        for sprite in self.tiles.sprites(): #Looking through all tiles on map
-            if sprite.rect.colliderect(janitor.rect): #If janitor collides with a tile
-                janitor_is_colliding_with_tile = True
-                if janitor.direction.y > 0: #Moving up
-                    janitor.rect.bottom = sprite.rect.top
-                    janitor.direction.y = 0
-                    janitor.is_on_ground = True
-                elif janitor.direction.y < 0: #Moving down
-                    janitor.rect.top = sprite.rect.bottom
-                    janitor.direction.y = 0
-                    janitor.is_on_ground = False
-            if sprite.rect.colliderect(banker.rect): #If banker collides with a tile
-                banker_is_colliding_with_tile = True
-                if banker.direction.y > 0: #Moving up
-                    banker.rect.bottom = sprite.rect.top
-                    banker.direction.y = 0
-                    banker.is_on_ground = True
-                elif banker.direction.y < 0: #Moving down
-                    banker.rect.top = sprite.rect.bottom
-                    banker.direction.y = 0
-                    banker.is_on_ground = False
-
-
-            for item in self.items.sprites(): #Looking through all items (y axis)
-                if sprite.rect.colliderect(item.rect): #If item collides with a tile
-                    if item.direction.y > 0: #Moving up
-                        item.rect.bottom = sprite.rect.top
-                        item.direction.y = 0
-                    elif item.direction.y < 0: #Moving down
-                        item.rect.top = sprite.rect.bottom
-                        item.direction.y = 0
-                        
-        for waterObject in self.water:
-            for waterTile in waterObject.tiles:
-                if waterTile.rect.colliderect(janitor.rect): #If janitor collides with a tile
-                    janitor_is_colliding_with_tile = True
-                    if janitor.direction.y > 0: #Moving up
-                        janitor.rect.bottom = waterTile.rect.top
-                        janitor.direction.y = 0
-                        janitor.is_on_ground = True
-                    elif janitor.direction.y < 0: #Moving down
-                        janitor.rect.top = waterTile.rect.bottom
-                        janitor.direction.y = 0
-                        janitor.is_on_ground = False
-                if waterTile.rect.colliderect(banker.rect): #If banker collides with a tile
-                    banker_is_colliding_with_tile = True
-                    if banker.direction.y < 0: #Moving down
-                        banker.rect.top = waterTile.rect.bottom
-                        banker.direction.y = 0
-                        banker.is_on_ground = False
-                        
-        for sprite in self.elevators.sprites(): #Looking through all tiles on map
-            if sprite.rect.colliderect(janitor.rect): #If janitor collides with a tile
-                janitor_is_colliding_with_tile = True
-                if janitor.direction.y > 0: #Moving up
-                    janitor.rect.bottom = sprite.rect.top
-                    janitor.direction.y = 0
-                    janitor.is_on_ground = True
-                elif janitor.direction.y < 0: #Moving down
-                    janitor.rect.top = sprite.rect.bottom
-                    janitor.direction.y = 0
-                    janitor.is_on_ground = False
-            if sprite.rect.colliderect(banker.rect): #If banker collides with a tile
-                banker_is_colliding_with_tile = True
-                if banker.direction.y > 0: #Moving up
-                    banker.rect.bottom = sprite.rect.top
-                    banker.direction.y = 0
-                    banker.is_on_ground = True
-                elif banker.direction.y < 0: #Moving down
-                    banker.rect.top = sprite.rect.bottom
-                    banker.direction.y = 0
-                    banker.is_on_ground = False
-            
-                        
-        for sprite in self.obstacles.sprites(): #Looking through all obstacles (y axis)
-            if sprite.rect.colliderect(janitor.rect): #If janitor 1 collides with an obstacle
-                if janitor.direction.y > 0: #Moving up
-                    janitor.rect.bottom = sprite.rect.top
-                    janitor.direction.y = 0
-                elif janitor.direction.y < 0: #Moving down
-                    janitor.rect.top = sprite.rect.bottom
-                    janitor.direction.y = 0
-            if sprite.rect.colliderect(banker.rect): #If janitor 2 collides with an obstacle
-                if banker.direction.y > 0: #Moving up
-                    banker.rect.bottom = sprite.rect.top
-                    banker.direction.y = 0
-                elif banker.direction.y < 0: #Moving down
-                    banker.rect.top = sprite.rect.bottom
-                    banker.direction.y = 0
-        if janitor_is_colliding_with_tile == False:
-            janitor.is_on_ground = False
+        if self.chunks.streaming:
+            self.chunks.update() #Just the chunks around the players
+        else:
+            self.chunks.load_all()
+
+    def add_tile(self, cell, col, row):
+        tile = Tile((col * self.tile_size, row * self.tile_size), tile_images[cell])
+        self.tiles.add(tile)
+        return tile
+
+    def add_entity(self, cell, col, row, first, second):
+        tile_size = self.tile_size
+        x = col * tile_size
+        y = row * tile_size
 
-        if banker_is_colliding_with_tile == False:
-            banker.is_on_ground = False
+        if cell == "J":
+            sprite = Janitor((x,y+8))
+            self.janitor.add(sprite)
+        elif cell == "B":
+            sprite = Banker((x,y+8))
+            self.banker.add(sprite)
+        elif cell == "E":
+            sprite = Roomba((x, y), first, second)
+            self.enemies.add(sprite)
+            self.patrol_areas.insert(sprite, "enemies", sprite.patrol_area())
+        elif cell == "F":
+            sprite = JanitorItem((x, y+1), (64, 32))
+            self.items.add(sprite)
+        elif cell == "G":
+            sprite = BankerItem((x, y+1), (64, 32))
+            self.items.add(sprite)
+        elif cell == "C":
+            sprite = PointObstacle((x,y), tile_size)
+            self.points.add(sprite)
+        elif cell == "O":
+            sprite = InteractObstacle((x, y + tile_size), tile_size, tile_size * 2, first)
+            self.obstacles.add(sprite)
+        elif cell == "L":
+            sprite = InteractBox((x,y), first)
+            self.levers.add(sprite)
+        elif cell == "Z":
+            sprite = Elevator((x, y), first, second)
+            self.elevators.add(sprite)
+            self.patrol_areas.insert(sprite, "elevators", sprite.patrol_area())
+        return sprite
+
+    def nearby(self, rect, layer):
+        #Solids of one layer in the cells around rect. The query is padded by a cell
+        #so sprites the rect gets pushed into while resolving are still checked
+        return self.grid.query(rect.inflate(self.tile_size * 2, self.tile_size * 2), layer)
+
+    def active_items(self):
+        #Items the physics has to move. Resting ones sleep, and items lying in an evicted
+        #chunk have no floor to land on, they wait for it to load again
+        items = [item for item in self.items if not item.sleeping]
+        if not self.chunks.streaming:
+            return items
+        return [item for item in items if self.chunks.is_loaded(item.rect)]
+
+    def players(self):
+        return self.janitor.sprites() + self.banker.sprites()
+
+    def horizontal_movement_collision(self):
+        self.physics.move_x(self.players())
+
+    def vertical_movement_collision(self):
+        items = self.active_items()
+        self.physics.move_y(self.players() + items)
+        for item in items:
+            if item.is_on_ground and not item.collected: #Landed, held items follow their player
+                item.sleeping = True
 
 
     """
@@ -347,11 +299,13 @@ class Level:
     """
 
 
-    def obstacle_behavior(self):
+    def obstacle_behavior(self, inputs):
         janitor = self.janitor.sprite
         banker = self.banker.sprite
 
-        for sprite in self.points.sprites(): #Looking through all point locations
+        points = self.nearby(janitor.rect, "points")
+        points += [point for point in self.nearby(banker.rect, "points") if point not in points]
+        for sprite in points: #Looking through the point locations around the players
             if sprite.rect.colliderect(janitor.rect) or sprite.rect.colliderect(banker.rect): #If either player collides, remove
                 print('Point collection')
                 sprite.kill()
@@ -369,52 +323,42 @@ class Level:
                                 else:
                                     print('Player 1 does not have an item, cannot remove')"""
                 if sprite.rect.left == banker.rect.right or sprite.rect.right == banker.rect.left: #If player 2 is next to the obstacle
-                    for event in pygame.event.get():
-                        if event.type == pygame.KEYDOWN: #If a key is pressed
-                            if event.key == pygame.K_DOWN: #and it is player 2's interact button (/), remove
-                                if(len(banker.inventory) > 0):
-                                    print('Player 2 (Arrows) with key encountered door, removing')
-                                    sprite.kill()
-                                else:
-                                    print('Player 2 does not have an item, cannot remove')
+                    if inputs.was_pressed(pygame.K_DOWN): #and player 2 pressed their interact button (down), remove
+                        if(len(banker.inventory) > 0):
+                            print('Player 2 (Arrows) with key encountered door, removing')
+                            sprite.kill()
+                        else:
+                            print('Player 2 does not have an item, cannot remove')
 
-    def lever_flip(self):
+    def lever_flip(self, inputs):
         janitor = self.janitor.sprite
         banker = self.banker.sprite
 
         for sprite in self.levers.sprites(): #Looking through all levers
             if sprite.flipUse == 1: #If the lever hasn't been flipped (Player 1 always has priority over Player 2)
                 if sprite.rect.left == janitor.rect.right or sprite.rect.right == janitor.rect.left: #If player 1 is next to the lever
-                    for event in pygame.event.get():
-                        if event.type == pygame.KEYDOWN: #If a key is pressed
-                            if event.key == pygame.K_s: #and it is player 1's interact button (F)
-                                for spriteOb in self.obstacles.sprites():
-                                    if spriteOb.obstacleID == sprite.leverID: #delete the corresponding object to lever ID
-                                        print('Player 1 flipped lever, obstacle of id ' + str(spriteOb.obstacleID) + ' is removed')
-                                        spriteOb.kill()
-                                        break
-                                sprite.flipUse = 0 #Lever can no longer be used
-                                sprite.update() #Update lever sprite to being flipped
+                    if inputs.was_pressed(pygame.K_s): #and player 1 pressed their interact button
+                        for spriteOb in self.obstacles.sprites():
+                            if spriteOb.obstacleID == sprite.leverID: #delete the corresponding object to lever ID
+                                print('Player 1 flipped lever, obstacle of id ' + str(spriteOb.obstacleID) + ' is removed')
+                                spriteOb.kill()
+                                break
+                        sprite.flipUse = 0 #Lever can no longer be used
+                        sprite.update() #Update lever sprite to being flipped
+                        self.grid.update(sprite) #The flipped image has a different size
                 if sprite.rect.left == banker.rect.right or sprite.rect.right == banker.rect.left: #If player 2 is next to the lever
-                    for event in pygame.event.get():
-                        if event.type == pygame.KEYDOWN: #If a key is pressed
-                            if event.key == pygame.K_DOWN: #and it is player 2's interact button (/)
-                                for spriteOb in self.obstacles.sprites():
-                                    if spriteOb.obstacleID == sprite.leverID: #delete the corresponding object to lever ID
-                                        print('Player 2 flipped lever, obstacle of id ' + str(spriteOb.obstacleID) + ' is removed')
-                                        spriteOb.kill()
-                                        break
-                                sprite.flipUse = 0 #Lever can no longer be used
-                                sprite.update() #Update lever sprite to being flipped
+                    if inputs.was_pressed(pygame.K_DOWN): #and player 2 pressed their interact button
+                        for spriteOb in self.obstacles.sprites():
+                            if spriteOb.obstacleID == sprite.leverID: #delete the corresponding object to lever ID
+                                print('Player 2 flipped lever, obstacle of id ' + str(spriteOb.obstacleID) + ' is removed')
+                                spriteOb.kill()
+                                break
+                        sprite.flipUse = 0 #Lever can no longer be used
+                        sprite.update() #Update lever sprite to being flipped
+                        self.grid.update(sprite) #The flipped image has a different size
       
     def check_banker_on_water(self):
-        bankerRect = self.banker.sprite.rect
-        
-        for waterObject in self.water:
-            if waterObject.active:
-                for waterTile in waterObject.tiles:
-                    if (bankerRect.colliderect(waterTile.rect) and bankerRect.midbottom[1] < waterTile.rect.center[1]) or (bankerRect.midbottom[1] == waterObject.Y and bankerRect.bottomleft[0] < waterObject.endX - 10 and bankerRect.bottomright[0] > waterObject.startX + 10):
-                        return True
+        return self.water_index.over_water(self.banker.sprite.rect)
 
     def check_game_ended(self):
         janitor = self.janitor.sprite
@@ -432,57 +376,161 @@ class Level:
         return True
                     
 
-    def run(self):
-        self.display_surface.blit(self.bg_image, (0,0))
-        self.tiles.draw(self.display_surface)
-        
-        for water in self.water:
-            water.draw(self.display_surface)
-        
-        self.obstacles.draw(self.display_surface)
+    def invalidate(self): #Something else drew over the screen, redraw all of it next frame
+        self.full_redraw = True
 
-        self.points.draw(self.display_surface)
+    def draw_sprite(self, image, rect): #Screen coordinates, e.g. the HUD
+        self.drawn.append(self.display_surface.blit(image, rect))
 
-        self.levers.draw(self.display_surface)
-        
-        self.exits.draw(self.display_surface)
+    def draw_world(self, image, position): #World coordinates, skipped when it is off screen
+        x = position[0] - self.camera.view.x
+        y = position[1] - self.camera.view.y
+        if x < self.camera.view.width and y < self.camera.view.height and x + image.get_width() > 0 and y + image.get_height() > 0:
+            self.drawn.append(self.display_surface.blit(image, (x, y)))
+
+    def get_dirty_rects(self): #Screen areas that changed during the last run()
+        return self.erased + self.drawn
+
+    def update_sight(self, enemy): #Tiles blocking the roomba's view, only rebuilt when its row changes
+        band = enemy.sight_band(self.level_width)
+        enemy.set_blockers(tile for tile in self.grid.query(band, "tiles") if tile.rect.colliderect(band))
+
+    def collect_changes(self): #Static sprites added or removed since the last call
+        changes = self.grid.take_changes()
+        if changes:
+            for enemy in self.enemies:
+                band = enemy.sight_band(self.level_width)
+                if band.collidelist(changes) != -1:
+                    self.update_sight(enemy)
+            for item in self.items:
+                if item.sleeping and item.rect.move(0, 1).collidelist(changes) != -1: #The floor under it changed
+                    item.sleeping = False
+            if self.static_layer is not None:
+                self.static_changes.extend(changes)
+
+    def draw_static(self):
+        changes = self.static_changes
+        self.static_changes = []
+        self.static_layer.refresh(changes) #Repaint whatever changed since the last frame
+        offset = self.camera.offset()
+        if self.dirty_rendering and not self.full_redraw:
+            self.erased = self.drawn + [self.camera.to_screen(rect) for rect in changes]
+            for rect in self.erased: #Erase last frame's sprites and show the repainted areas
+                self.static_layer.draw_area(self.display_surface, rect, offset)
+        else:
+            self.erased = [self.display_surface.get_rect()]
+            self.static_layer.draw(self.display_surface, offset) #Background, tiles, water, obstacles, coins, levers and exits in a blit per page
+        self.full_redraw = False
+        self.drawn = []
+
+    def step(self, inputs):
+        #Advance the level one tick using the given input, without drawing anything
+        with streaming_scope:
+            self.chunks.update()
+        with changes_scope:
+            self.collect_changes()
         
-        self.elevators.update(self.banker.sprite, self.janitor.sprite)
-        self.elevators.draw(self.display_surface)
+        with elevators_scope:
+            self.elevators.update(self.banker.sprite, self.janitor.sprite)
         
-        for enemy in self.enemies:
-            sight_rect = enemy.update()
-            #pygame.draw.rect(self.display_surface, "white", sight_rect)   #comment out to not draw the sight rect
-            if enemy.detect_player(self.janitor.sprite.rect, self.tiles):
-                print(enemy.distance)
+        with patrol_scope:
+            spotted = self.patrol.update(self.enemies, (self.janitor.sprite.rect, self.banker.sprite.rect))
+            if spotted is not None:
+                enemy, player = spotted
+                print(enemy.distance if player == 0 else "detected")
                 return False, "loss"
-            if enemy.detect_player(self.banker.sprite.rect, self.tiles):
-                print("detected")
-                return False, "loss"
-        self.enemies.draw(self.display_surface)
         
-        self.janitor.update(self.items, self.water, self.tiles)
-        self.janitor.draw(self.display_surface)
+        with players_scope:
+            self.janitor.update(self.items, self.water_index, self.tiles, inputs)
+            self.banker.update(self.items, self.janitor.sprite, inputs)
         
-        self.banker.update(self.items, self.elevators, self.janitor.sprite)
-        self.banker.draw(self.display_surface)
+        with physics_x_scope:
+            self.horizontal_movement_collision()
+        with physics_y_scope:
+            self.vertical_movement_collision()
         
-        self.horizontal_movement_collision()
-        self.vertical_movement_collision()
+        with interactions_scope:
+            self.obstacle_behavior(inputs)
+            self.lever_flip(inputs)
         
-        self.obstacle_behavior()
-        self.lever_flip()
+        with end_scope:
+            if self.check_banker_on_water():
+                return False, "loss"
+            if self.check_game_ended():
+                 return False, "win"                      
+        return True, ""
+
+    def moving_sprites(self):
+        return self.elevators.sprites() + self.enemies.sprites() + self.janitor.sprites() + self.banker.sprites() + self.items.sprites()
+
+    def draw_group(self, group, alpha = None):
+        self.draw_sprites(group.sprites(), alpha)
+
+    def draw_sprites(self, sprites, alpha = None):
+        for sprite in sprites:
+            self.draw_world(sprite.image, self.draw_position(sprite, alpha))
 
-        textFont = pygame.font.SysFont('timesnewroman', 40)
-        scoreText = textFont.render(f'{self.score}', False, 'Black')
-        scoreRect = scoreText.get_rect(topleft = (6, 6))
-        self.display_surface.blit(scoreText, scoreRect)
+    def follow_players(self, alpha):
+        players = [pygame.Rect(self.draw_position(player, alpha)[:2], player.rect.size) for player in (self.janitor.sprite, self.banker.sprite)]
+        if self.camera.follow(players):
+            self.full_redraw = True #Everything on screen moved
+
+    def draw_markers(self):
+        #A dot at the screen edge towards a player the camera can't fit in
+        for player, color in ((self.janitor.sprite, "deepskyblue"), (self.banker.sprite, "gold")):
+            if not self.camera.visible(player.rect):
+                self.drawn.append(pygame.draw.circle(self.display_surface, color, self.camera.off_screen_marker(player.rect), 8))
+
+    def draw_position(self, sprite, alpha):
+        #Where to draw a sprite alpha of the way between its last two simulation steps
+        previous = self.previous_positions.get(sprite) if alpha is not None else None
+        if previous is None:
+            return sprite.rect
+        x = previous[0] + (sprite.rect.x - previous[0]) * alpha
+        y = previous[1] + (sprite.rect.y - previous[1]) * alpha
+        return (round(x), round(y))
+
+    def draw(self, alpha = None):
+        with camera_scope:
+            self.collect_changes()
+            self.follow_players(alpha)
+        with static_scope:
+            self.draw_static()
         
-        for item in self.items:
-            self.display_surface.blit(item.image, item.rect)
+        with sprites_scope:
+            self.draw_sprites(self.patrol_areas.query(self.camera.view, "elevators"), alpha)
+            #for enemy in self.enemies: pygame.draw.rect(self.display_surface, "white", enemy.sight_rect)   #uncomment to draw the sight rects
+            self.draw_sprites(self.patrol_areas.query(self.camera.view, "enemies"), alpha)
+            self.draw_group(self.janitor, alpha)
+            self.draw_group(self.banker, alpha)
+
+        with hud_scope:
+            self.draw_markers()
+            self.hud.set("score", self.score)
+            self.hud.draw(self.draw_sprite)
         
-        if self.check_banker_on_water():
-            return False, "loss"
-        if self.check_game_ended():
-             return False, "win"                      
-        return True, ""
+        with sprites_scope:
+            self.draw_group(self.items, alpha)
+
+    def run(self, inputs = None, steps = 1, alpha = None, draw = True):
+        #Run a frame: any number of fixed simulation steps, then draw once.
+        #Passing alpha draws the moving sprites interpolated between the last two steps
+        if inputs is None:
+            inputs = InputState.from_keyboard(self.inputs)
+        result = True, ""
+        for step in range(steps):
+            if alpha is not None:
+                self.previous_positions = {sprite: sprite.rect.topleft for sprite in self.moving_sprites()}
+            with step_scope:
+                result = self.step(inputs)
+            self.inputs = inputs
+            if self.recorder is not None:
+                with record_scope:
+                    self.recorder.record(inputs, self)
+            inputs = InputState.from_keys(inputs.held, inputs, inputs.mouse) #A key press only counts for the first step
+            if not result[0]:
+                break
+        if draw:
+            with draw_scope:
+                self.draw(alpha)
+        return result
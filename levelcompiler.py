@@ -0,0 +1,143 @@
+import os, hashlib
+import numpy as np
+
+#--------------------------------------------------------
+# Level compiler
+# Turns a settings.py map and its parameter list into arrays the level is
+# built from, so the ASCII map is only parsed (and checked) once:
+#  cells     - one byte per map cell, the map character
+#  entities  - one row per entity in map order: kind, col, row, param 1, param 2
+#              with the parameters already lined up with their entity
+#  water     - one row per pool: row, first col, last col + 1
+#  exits     - one row per exit: kind, col, row
+# Compiled levels are cached in memory and on disk, keyed by a hash of the
+# map and its parameters, so editing a map compiles it again.
+#--------------------------------------------------------
+
+format_version = 1
+cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".levelcache")
+
+tile_cells = "XAQ"
+entity_cells = "JBEFGCOLZ"
+exit_cells = "NM"
+known_cells = " " + tile_cells + entity_cells + exit_cells + "W"
+# How many parameters each entity takes from level_param, in map order
+param_counts = {"E": 2, "O": 1, "L": 1, "Z": 2}
+no_param = -1
+
+
+class LevelError(ValueError):
+    pass
+
+
+class CompiledLevel():
+    def __init__(self, cells, entities, water, exits, key):
+        self.cells = cells
+        self.entities = entities
+        self.water = water
+        self.exits = exits
+        self.key = key
+
+    def tiles(self, area = None):
+        #(char, col, row) of every tile, left to right, top to bottom. area is
+        #(col, row, cols, rows) to only get the tiles in that part of the map
+        left, top = (0, 0) if area is None else area[:2]
+        cells = self.cells if area is None else self.cells[top:top + area[3], left:left + area[2]]
+        rows, cols = np.nonzero(np.isin(cells, [ord(cell) for cell in tile_cells]))
+        return [(chr(cells[row, col]), col + left, row + top) for row, col in zip(rows.tolist(), cols.tolist())]
+
+    def size(self):
+        return self.cells.shape[1], self.cells.shape[0] #cols, rows
+
+
+def level_key(layout, level_param):
+    text = repr((format_version, list(layout), [list(param) for param in level_param]))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def compile_level(layout, level_param, strict = False):
+    #Raises LevelError for maps the level can't be built from. strict also
+    #rejects maps that build but are probably mistakes (unused parameters,
+    #a second player start)
+    if not layout:
+        raise LevelError("empty level map")
+    width = max(len(row) for row in layout)
+    cells = np.full((len(layout), width), ord(" "), dtype = np.uint8)
+    entities = []
+    water = []
+    exits = []
+    currParam = 0
+    players = {"J": 0, "B": 0}
+    for row_index, row in enumerate(layout):
+        for col_index, cell in enumerate(row):
+            if cell not in known_cells:
+                raise LevelError(f"unknown cell {cell!r} at row {row_index}, col {col_index}")
+            cells[row_index, col_index] = ord(cell)
+            if cell in entity_cells:
+                params = [no_param, no_param]
+                count = param_counts.get(cell, 0)
+                if count:
+                    if currParam >= len(level_param):
+                        raise LevelError(f"no parameters left for {cell!r} at row {row_index}, col {col_index}")
+                    values = level_param[currParam]
+                    if len(values) < count:
+                        raise LevelError(f"{cell!r} at row {row_index}, col {col_index} needs {count} parameters, got {list(values)}")
+                    params[:count] = values[:count]
+                    currParam += 1
+                if cell in players:
+                    players[cell] += 1
+                entities.append([ord(cell), col_index, row_index] + params)
+            elif cell in exit_cells:
+                exits.append([ord(cell), col_index, row_index])
+            elif cell == "W" and (col_index == 0 or row[col_index - 1] != "W"):
+                end = col_index
+                while end < len(row) and row[end] == "W":
+                    end += 1
+                water.append([row_index, col_index, end])
+    for player, count in players.items():
+        if count == 0 or (strict and count > 1):
+            raise LevelError(f"level needs exactly one {player!r}, found {count}")
+    if strict and currParam != len(level_param):
+        raise LevelError(f"{len(level_param)} parameters given, {currParam} used")
+    return CompiledLevel(cells, np.array(entities, dtype = np.int32).reshape(-1, 5), np.array(water, dtype = np.int32).reshape(-1, 3),
+                         np.array(exits, dtype = np.int32).reshape(-1, 3), level_key(layout, level_param))
+
+
+compiled_levels = {}
+
+def load_level(layout, level_param, directory = None):
+    #Compiled form of a level, from memory, the disk cache or compiled now
+    key = level_key(layout, level_param)
+    compiled = compiled_levels.get(key)
+    if compiled is not None:
+        return compiled
+    directory = cache_dir if directory is None else directory
+    path = os.path.join(directory, key + ".npz")
+    try:
+        with np.load(path) as data:
+            compiled = CompiledLevel(data["cells"], data["entities"], data["water"], data["exits"], key)
+    except (OSError, KeyError, ValueError): #Not cached yet or unreadable, compile it again
+        compiled = compile_level(layout, level_param)
+        try:
+            os.makedirs(directory, exist_ok = True)
+            temporary = path + ".tmp.npz"
+            np.savez(temporary, cells = compiled.cells, entities = compiled.entities, water = compiled.water, exits = compiled.exits)
+            os.replace(temporary, path)
+        except OSError: #Read only install, just keep it in memory
+            pass
+    compiled_levels[key] = compiled
+    return compiled
+
+
+if __name__ == '__main__':
+    #Check every map in settings.py: python levelcompiler.py
+    import settings
+    maps = [("level_map_test", "leveltest_param"), ("level_map_test_gravity", "leveltest_param"), ("level_map", "level_param"),
+            ("level_map_0", "level0_param"), ("level_map_1", "level1_param"), ("level_map_2", "level2_param"),
+            ("level_map_3", "level3_param"), ("level_map_4", "level4_param")]
+    for name, param_name in maps:
+        try:
+            compile_level(getattr(settings, name), getattr(settings, param_name), strict = True)
+            print(f"{name}: ok")
+        except LevelError as error:
+            print(f"{name}: {error}")
@@ -0,0 +1,62 @@
+import random
+
+#--------------------------------------------------------
+# Generated levels for benchmarks and stress tests
+# Any size of map in the settings.py format: border walls, a floor every few
+# rows with the odd gap, water, coins, roombas and elevators on the upper
+# floors, and both players with their exits on the bottom floor, so the level
+# can be played for as long as a benchmark likes without anyone being spotted.
+#--------------------------------------------------------
+
+def generate_map(cols, rows, seed = 0, floor_gap = 5):
+    rng = random.Random(seed)
+    cells = [[" "] * cols for row in range(rows)]
+    for row in range(rows):
+        cells[row][0] = cells[row][cols - 1] = "X"
+    cells[0] = ["X"] * cols
+    cells[rows - 1] = ["X"] * cols
+    params = []
+    floors = list(range(floor_gap, rows - 1, floor_gap))
+    for floor in floors:
+        col = 1
+        while col < cols - 1:
+            if rng.random() < 0.04 and col < cols - 5: #A hole to fall through
+                col += 3
+                continue
+            cells[floor][col] = "X"
+            col += 1
+        for start in range(2, cols - 12, 40):
+            if rng.random() < 0.3:
+                for col in range(start, start + 6):
+                    cells[floor][col] = "W"
+
+    #Entities go left to right, top to bottom so params line up with the map order
+    for row in range(1, rows - 1):
+        ground = row + 1
+        if ground not in floors and ground != rows - 1:
+            continue
+        col = 2
+        while col < cols - 4:
+            below = cells[ground][col]
+            roll = rng.random()
+            if ground in floors and below == "X" and cells[ground][col + 1] == "X" and cells[ground][col + 2] == "X":
+                if roll < 0.03:
+                    cells[row][col] = "E"
+                    params.append([rng.choice([92, 138, 184]), rng.choice([1, 2])])
+                    col += 8
+                    continue
+                if roll < 0.04 and ground - floor_gap > 0:
+                    cells[row][col] = "Z"
+                    params.append([floor_gap - 1, 2])
+                    col += 4
+                    continue
+            if below in "XW" and roll < 0.12:
+                cells[row][col] = "C"
+            col += 1
+
+    bottom = rows - 2
+    cells[bottom][2] = "J"
+    cells[bottom][4] = "B"
+    cells[bottom][cols - 4] = "N"
+    cells[bottom][cols - 2] = "M"
+    return ["".join(row) for row in cells], params
@@ -0,0 +1,99 @@
+import numpy as np
+from enemy import enemyr, enemyl
+
+#--------------------------------------------------------
+# Roomba patrols
+# Moves every roomba and checks whether one of them sees a player, once per
+# step. With a handful of roombas each one simply updates itself. With more
+# than vector_from, positions, directions, speeds, distances and sight rects
+# live in NumPy arrays and the whole patrol moves, turns and looks for the
+# players in a few array operations. Only the roombas whose sight rect
+# touches a player check the tiles in between, one at a time.
+# After every step the results are written back to the Roomba sprites, so the
+# renderer, snapshots and everything else keep using the same Roomba API.
+# Anything that changes roombas other than through update() (restoring a
+# snapshot, restarting the level) calls invalidate() so the arrays are read
+# from the sprites again.
+#--------------------------------------------------------
+
+vector_from = 100 #About where the arrays start to win, see python benchmark.py large
+
+
+class PatrolSystem():
+    def __init__(self):
+        self.roombas = []
+        self.stale = True
+
+    def invalidate(self):
+        self.stale = True
+
+    def gather(self, roombas):
+        self.roombas = roombas
+        self.stale = False
+        self.x = np.array([roomba.rect.x for roomba in roombas], dtype = np.int64)
+        self.width = np.array([roomba.rect.width for roomba in roombas], dtype = np.int64)
+        self.position = np.array([roomba.posFromStart for roomba in roombas], dtype = np.int64)
+        self.direction = np.array([roomba.direction for roomba in roombas], dtype = np.int64)
+        self.speed = np.array([roomba.speed for roomba in roombas], dtype = np.int64)
+        self.distance = np.array([roomba.distance for roomba in roombas], dtype = np.int64)
+        self.sight_x = np.array([roomba.sight_rect.x for roomba in roombas], dtype = np.int64)
+        self.sight_y = np.array([roomba.sight_rect.y for roomba in roombas], dtype = np.int64)
+        self.sight_width = np.array([roomba.sight_rect.width for roomba in roombas], dtype = np.int64)
+        self.sight_height = np.array([roomba.sight_rect.height for roomba in roombas], dtype = np.int64)
+        self.facing = np.array([1 if roomba.image is enemyr else -1 if roomba.image is enemyl else 0 for roomba in roombas], dtype = np.int64)
+
+    def update(self, group, players):
+        #Move every roomba one step. Returns (roomba, player index) for the first
+        #roomba, in group order, that sees a player, or None. Like the one at a
+        #time loop, the roombas after that one don't move on that step
+        roombas = group.sprites()
+        if len(roombas) < vector_from:
+            for roomba in roombas:
+                roomba.update()
+                for index, player in enumerate(players):
+                    if roomba.detect_player(player):
+                        return roomba, index
+            return None
+        if self.stale or roombas != self.roombas:
+            self.gather(roombas)
+
+        step = self.direction * self.speed
+        x = self.x + step
+        sight_x = self.sight_x + step
+        position = self.position + step
+        facing = self.direction.copy() #move() picks the image before turning
+        turn = (position > self.distance) | (position < 0)
+        direction = np.where(turn, -self.direction, self.direction)
+        sight_x = np.where(turn, np.where(direction == 1, x + self.width, x - self.sight_width), sight_x)
+
+        spotted = None
+        for index, player in enumerate(players):
+            seen = np.flatnonzero((sight_x < player.right) & (sight_x + self.sight_width > player.left) &
+                                  (self.sight_y < player.bottom) & (self.sight_y + self.sight_height > player.top))
+            for roomba_index in seen.tolist():
+                if spotted is not None and roomba_index > spotted[0]:
+                    break
+                if roombas[roomba_index].line_of_sight(int(x[roomba_index]), player) and (spotted is None or roomba_index < spotted[0]):
+                    spotted = (roomba_index, index)
+                    break
+
+        end = len(roombas) if spotted is None else spotted[0] + 1
+        self.x[:end] = x[:end]
+        self.sight_x[:end] = sight_x[:end]
+        self.position[:end] = position[:end]
+        self.direction[:end] = direction[:end]
+        self.write_back(roombas, facing, end)
+        if spotted is not None:
+            return roombas[spotted[0]], spotted[1]
+        return None
+
+    def write_back(self, roombas, facing, end):
+        for roomba, x, sight_x, position, direction in zip(roombas[:end], self.x[:end].tolist(), self.sight_x[:end].tolist(),
+                                                           self.position[:end].tolist(), self.direction[:end].tolist()):
+            roomba.rect.x = x
+            roomba.sight_rect.x = sight_x
+            roomba.posFromStart = position
+            roomba.direction = direction
+        for index in np.flatnonzero(self.facing[:end] != facing[:end]).tolist(): #Only the ones that turned around
+            roombas[index].image = enemyr if facing[index] == 1 else enemyl
+        self.facing[:end] = facing[:end]
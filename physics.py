@@ -0,0 +1,171 @@
+import pygame
+
+fixed_scale = 1000 #Fixed point units in a pixel
+
+#--------------------------------------------------------
+# Kinematic bodies
+# Players and items are bodies: sprites with a rect and a speed that the
+# level moves one axis at a time and pushes back out of the solids they run
+# into. What a body collides with is its mask, a class attribute per axis:
+#  collides_x - layers that stop it sideways
+#  collides_y - (layer, land, ground) per layer in the order they are checked.
+#               land: it can stand on top of the layer, otherwise it is only
+#               stopped from below (the banker and water). ground: standing on
+#               it counts as being on the ground (obstacles don't)
+# Layers are the static grid's layers plus the moving solids, like elevators,
+# which are looked up in their own grid by the whole area they move in.
+# A body standing on a moving solid is one of its riders (platform.riders,
+# body.platform) and moves with it in the same tick. Riders are worked out
+# again from where the bodies ended up after every vertical pass, so they join
+# when they land and leave when they jump or walk off.
+# Vertical motion is fixed point: velocity_y and gravity are integers in
+# thousandths of a pixel per tick and fixed_y is the exact height of the body,
+# the rect is fixed_y rounded to the nearest pixel (so a body standing on the
+# floor sinks into it by a pixel every tick and is pushed out onto it again).
+# Integer math is exact, so a run plays out the same on every machine,
+# whatever the order it is stepped in. Whatever moves a rect directly (a push
+# out, carrying an item, a snapshot) makes the rect the exact position again.
+# Every body goes through the same code, one pass per axis, so a level can
+# have any number of players and items and each one costs the same.
+# A body that moves further than the thinnest solid in one go (a long fall, a
+# fast jump) could pass straight through a floor or an elevator between two
+# ticks. Those moves are swept: the body is stopped just inside the first
+# solid it crossed on the way, then pushed out of it like any other overlap.
+# Solids it already overlapped when it set off count too, as long as they are
+# ahead of it. Only the level moves bodies sideways, so the whole move is swept.
+#--------------------------------------------------------
+
+class PhysicsWorld():
+    def __init__(self, grid, tile_size, moving_grid, moving_layers):
+        self.grid = grid
+        self.padding = tile_size * 2 #Query a cell around the body, for solids it gets pushed into while resolving
+        self.moving_grid = moving_grid #Moving solids, indexed by the area they move in
+        self.moving_layers = moving_layers
+        self.sweep_from = tile_size // 4 #Thinner than any solid (levers are 15px wide, elevators 23px tall)
+
+    def solids(self, rect, layer):
+        grid = self.moving_grid if layer in self.moving_layers else self.grid
+        return grid.query(rect.inflate(self.padding, self.padding), layer)
+
+    def move_x(self, bodies):
+        for body in bodies:
+            left = body.rect.left
+            body.rect.x += body.direction.x * body.speed
+            if abs(body.rect.left - left) >= self.sweep_from:
+                self.sweep_x(body, left)
+            for layer in body.collides_x:
+                for sprite in self.solids(body.rect, layer):
+                    push_out_x(body, sprite)
+
+    def move_y(self, bodies):
+        for body in bodies:
+            top = body.rect.top
+            body.apply_gravity()
+            if abs(body.rect.top - top) >= self.sweep_from:
+                self.sweep_y(body, top)
+            on_something = False
+            for layer, land, ground in body.collides_y:
+                for sprite in self.solids(body.rect, layer):
+                    if push_out_y(body, sprite, land, ground) and ground:
+                        on_something = True
+            if not on_something:
+                body.is_on_ground = False
+            self.update_platform(body)
+
+    def update_platform(self, body):
+        #Join the riders of the moving solid the body stands on, leave the one it was on
+        platform = None
+        rect = body.rect
+        for layer, land, ground in body.collides_y:
+            if land and layer in self.moving_layers:
+                for sprite in self.solids(rect, layer):
+                    if sprite.rect.top == rect.bottom and sprite.rect.left < rect.right and sprite.rect.right > rect.left:
+                        platform = sprite
+        if platform is not body.platform:
+            if body.platform is not None:
+                body.platform.riders.discard(body)
+            if platform is not None:
+                platform.riders.add(body)
+            body.platform = platform
+
+    def find_platforms(self, bodies, platforms):
+        #Riders from scratch, e.g. after a snapshot put everyone somewhere else
+        for platform in platforms:
+            platform.riders.clear()
+        for body in bodies:
+            body.platform = None
+            self.update_platform(body)
+
+    def sweep_x(self, body, left):
+        #The body moved sideways from left to where it is now, stop it 1px into the first solid on the way
+        #(or the one it started in, if it is ahead)
+        rect = body.rect
+        start = pygame.Rect(left, rect.top, rect.width, rect.height)
+        area = rect.union(start)
+        limit = rect.left
+        for layer in body.collides_x:
+            for sprite in self.solids(area, layer):
+                solid = sprite.rect
+                if solid.top < rect.bottom and solid.bottom > rect.top:
+                    if rect.left > left and start.left < solid.left < limit + rect.width:
+                        limit = solid.left + 1 - rect.width
+                    elif rect.left < left and limit < solid.right < start.right:
+                        limit = solid.right - 1
+        rect.left = limit
+
+    def sweep_y(self, body, top):
+        #The same going up or down. Downwards only the layers it can land on stop it
+        rect = body.rect
+        start = pygame.Rect(rect.left, top, rect.width, rect.height)
+        area = rect.union(start)
+        limit = rect.top
+        for layer, land, ground in body.collides_y:
+            if rect.top > top and not land:
+                continue
+            for sprite in self.solids(area, layer):
+                solid = sprite.rect
+                if solid.left < rect.right and solid.right > rect.left:
+                    if rect.top > top and start.top < solid.top < limit + rect.height:
+                        limit = solid.top + 1 - rect.height
+                    elif rect.top < top and limit < solid.bottom < start.bottom:
+                        limit = solid.bottom - 1
+        rect.top = limit
+
+
+def push_out_x(body, sprite):
+    if sprite.rect.colliderect(body.rect): #If the body collides with a solid
+        if body.direction.x < 0: #Moving left
+            body.rect.left = sprite.rect.right
+        elif body.direction.x > 0: #Moving right
+            body.rect.right = sprite.rect.left
+
+
+def push_out_y(body, sprite, land = True, ground = True):
+    if not sprite.rect.colliderect(body.rect):
+        return False
+    if body.velocity_y > 0 and land: #Moving down
+        body.rect.bottom = sprite.rect.top
+        body.velocity_y = 0
+        body.fixed_y = body.rect.y * fixed_scale
+        if ground:
+            body.is_on_ground = True
+    elif body.velocity_y < 0: #Moving up
+        body.rect.top = sprite.rect.bottom
+        body.velocity_y = 0
+        body.fixed_y = body.rect.y * fixed_scale
+        if ground:
+            body.is_on_ground = False
+    return True
+
+
+def fall(body):
+    #One tick of gravity
+    if body.rect.y != to_pixels(body.fixed_y): #The rect was moved, start from there
+        body.fixed_y = body.rect.y * fixed_scale
+    body.velocity_y += body.gravity
+    body.fixed_y += body.velocity_y
+    body.rect.y = to_pixels(body.fixed_y)
+
+
+def to_pixels(fixed):
+    return (fixed + fixed_scale // 2) // fixed_scale
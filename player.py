@@ -1,5 +1,6 @@
 import pygame
 from item import Item, JanitorItem, BankerItem
+from physics import fixed_scale, fall
 
 bankerr1 = pygame.image.load('imgs/banker_sprite/banker_walk/r1.png'); bankerr2 = pygame.image.load('imgs/banker_sprite/banker_walk/r2.png'); bankerr3 = pygame.image.load('imgs/banker_sprite/banker_walk/r3.png'); bankerr4 = pygame.image.load('imgs/banker_sprite/banker_walk/r4.png')
 bankerr5 = pygame.image.load('imgs/banker_sprite/banker_walk/r5.png')
@@ -58,6 +59,10 @@ for index, janitor in enumerate(janitorleft):
     janitorleft[index] = pygame.transform.scale_by(janitor, 0.48)
     
 class Player(pygame.sprite.Sprite):
+    #Collision masks, see physics.py
+    collides_x = ("tiles", "elevators", "obstacles", "levers", "water")
+    collides_y = (("tiles", True, True), ("water", True, True), ("elevators", True, True), ("obstacles", True, False))
+
     def __init__(self, pos):
         super().__init__()
         
@@ -65,25 +70,27 @@ class Player(pygame.sprite.Sprite):
         self.rect = self.image.get_rect(topleft = pos)
         #player movement
         
-        self.direction = pygame.math.Vector2(0,0)
-        self.speed = 4
-        self.gravity = 0.8
-        self.jump_speed = -13
+        self.direction = pygame.math.Vector2(0,0) #Walking direction
+        self.speed = 8 #Pixels per tick, the level moves the player (see physics.py)
+        self.fixed_y = self.rect.y * fixed_scale #Fixed point height and vertical speed, see physics.py
+        self.velocity_y = 0
+        self.gravity = 800
+        self.jump_speed = -13000
         self.inventory = []
         self.counter = 0
         self.facingRight = True
         self.canMove = True
 
         self.is_on_ground = False
+        self.platform = None #Elevator the player is standing on, see physics.py
 
-    def player_movement(self):
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_d]:
+    def player_movement(self, inputs):
+        if inputs.is_held(pygame.K_d):
             self.image = bankerright[self.counter]
             self.counter = (self.counter + 1) % len(bankerright)
             self.direction.x = 1
             self.facingRight = True
-        elif keys[pygame.K_a]:
+        elif inputs.is_held(pygame.K_a):
             self.image = bankerleft[self.counter]
             self.counter = (self.counter + 1) % len(bankerleft)
             self.direction.x = -1
@@ -91,15 +98,14 @@ class Player(pygame.sprite.Sprite):
         else:
             self.direction.x = 0
 
-        if keys[pygame.K_w] and self.is_on_ground == True:
+        if inputs.is_held(pygame.K_w) and self.is_on_ground == True:
             self.jump()
 
     def apply_gravity(self):
-        self.direction.y += self.gravity
-        self.rect.y += self.direction.y
+        fall(self)
 
     def jump(self):
-        self.direction.y = self.jump_speed
+        self.velocity_y = self.jump_speed
         
     def pick_up_item(self, items):
         for item in items.sprites():
@@ -114,18 +120,16 @@ class Player(pygame.sprite.Sprite):
     
 
 
-    def update(self, items):
-        self.player_movement()
-        keys = pygame.key.get_pressed()
+    def update(self, items, inputs):
+        self.player_movement(inputs)
         
         if (len(self.inventory)) > 0:
             self.inventory[0].update(self.rect.center, self.facingRight)
 
-        if keys[pygame.K_f]:
+        if inputs.is_held(pygame.K_f):
             self.pick_up_item(items)
-        if keys[pygame.K_j]:
+        if inputs.is_held(pygame.K_j):
             self.drop_item()
-        self.rect.x += self.direction.x * self.speed
         
 class Janitor(Player):
     def __init__(self, pos):
@@ -133,14 +137,13 @@ class Janitor(Player):
         self.image = janitorright[0]
         self.rect = self.image.get_rect(topleft = pos)
         
-    def player_movement(self):
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_d] and self.canMove:
+    def player_movement(self, inputs):
+        if inputs.is_held(pygame.K_d) and self.canMove:
             self.image = janitorright[self.counter]
             self.counter = (self.counter + 1) % len(janitorright)
             self.direction.x = 1
             self.facingRight = True
-        elif keys[pygame.K_a] and self.canMove:
+        elif inputs.is_held(pygame.K_a) and self.canMove:
             self.image = janitorleft[self.counter]
             self.counter = (self.counter + 1) % len(janitorleft)
             self.direction.x = -1
@@ -148,46 +151,44 @@ class Janitor(Player):
         else:
             self.direction.x = 0
 
-        if keys[pygame.K_w] and self.is_on_ground and self.canMove:
+        if inputs.is_held(pygame.K_w) and self.is_on_ground and self.canMove:
             self.jump()
             
-    def update(self, items, water, tiles):
-        self.player_movement()
-        keys = pygame.key.get_pressed()
+    def update(self, items, water, tiles, inputs):
+        self.player_movement(inputs)
         
         if (len(self.inventory)) > 0:
             self.inventory[0].update(self.rect.center, self.facingRight)
 
-        if keys[pygame.K_f]:
+        if inputs.is_held(pygame.K_f):
             self.pick_up_item(items)
-        if keys[pygame.K_j]:
+        if inputs.is_held(pygame.K_j):
             self.drop_item()
-        if keys[pygame.K_s] and len(self.inventory) > 0:
+        if inputs.is_held(pygame.K_s) and len(self.inventory) > 0:
             self.clean_water(water, tiles)
-
-        self.rect.x += self.direction.x * self.speed
     
-    def clean_water(self, waterObjects, tiles):
-        for waterObject in waterObjects:
-            for waterTile in waterObject.tiles.sprites():
-                if waterTile.rect.midtop[1] == self.rect.midbottom[1] and waterObject.startX <= self.rect.midbottom[0] and waterObject.endX >= self.rect.midbottom[0]:
-                    waterObject.clean(tiles)
+    def clean_water(self, water, tiles):
+        #Clean the pool the janitor is standing on, if any
+        waterObject = water.pool_at(self.rect.midbottom[0], self.rect.midbottom[1])
+        if waterObject is not None:
+            waterObject.clean(tiles)
                 
 class Banker(Player):
+    #The banker can't stand on water, only bump into it from below
+    collides_y = (("tiles", True, True), ("water", False, True), ("elevators", True, True), ("obstacles", True, False))
 
     def __init__(self, pos):
         super().__init__(pos)
         #self.image = pygame.Surface((32,64))
         # self.image.fill('red')
 
-    def player_movement(self):
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_RIGHT] and self.canMove:
+    def player_movement(self, inputs):
+        if inputs.is_held(pygame.K_RIGHT) and self.canMove:
             self.image = bankerright[self.counter]
             self.counter = (self.counter + 1) % len(bankerright)
             self.direction.x = 1
             self.facingRight = True
-        elif keys[pygame.K_LEFT] and self.canMove:
+        elif inputs.is_held(pygame.K_LEFT) and self.canMove:
             self.image = bankerleft[self.counter]
             self.counter = (self.counter + 1) % len(bankerleft)
             self.direction.x = -1
@@ -195,31 +196,28 @@ class Banker(Player):
         else:
             self.direction.x = 0
 
-        if keys[pygame.K_UP] and self.is_on_ground == True and self.canMove:
+        if inputs.is_held(pygame.K_UP) and self.is_on_ground == True and self.canMove:
             self.jump()
             
-    def update(self, items, elevators, janitor):
-        self.player_movement()
-        keys = pygame.key.get_pressed()
+    def update(self, items, janitor, inputs):
+        self.player_movement(inputs)
         
         if (len(self.inventory)) > 0:
             self.inventory[0].update(self.rect.center, self.facingRight)
 
-        if keys[pygame.K_SLASH]:
+        if inputs.is_held(pygame.K_SLASH):
             self.pick_up_item(items)
-        if keys[pygame.K_j]:
+        if inputs.is_held(pygame.K_j):
             self.drop_item()
-        if keys[pygame.K_DOWN] and len(self.inventory) > 0:
-            self.activate_elevator(elevators, janitor)
-
-        self.rect.x += self.direction.x * self.speed
+        if inputs.is_held(pygame.K_DOWN) and len(self.inventory) > 0:
+            self.activate_elevator(janitor)
         
-    def activate_elevator(self, elevators, janitor):
-        for elevator in elevators:
-            if self.rect.midbottom[1] == elevator.rect.midtop[1] and elevator.startX <= self.rect.midbottom[0] and elevator.endX >= self.rect.midbottom[0]:
-                self.canMove = False
-                if janitor.rect.midbottom[1] == elevator.rect.midtop[1] and elevator.startX <= janitor.rect.midbottom[0] and elevator.endX >= janitor.rect.midbottom[0]:
-                    janitor.canMove = False
-                elevator.activate()
+    def activate_elevator(self, janitor):
+        elevator = self.platform #The elevator under the banker, if any
+        if elevator is not None and elevator.startX <= self.rect.midbottom[0] and elevator.endX >= self.rect.midbottom[0]:
+            self.canMove = False
+            if janitor.platform is elevator and elevator.startX <= janitor.rect.midbottom[0] and elevator.endX >= janitor.rect.midbottom[0]:
+                janitor.canMove = False
+            elevator.activate()
                 
     
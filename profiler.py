@@ -0,0 +1,183 @@
+import json, time
+from array import array
+from collections import deque
+import pygame
+from hud import get_font
+
+#--------------------------------------------------------
+# Frame profiler
+# Named timing scopes around the phases of a frame:
+#     with scope("collision"):
+#         ...
+# While the profiler is disabled a scope only checks one flag. While it is
+# enabled every scope is written to a fixed size ring buffer (name, start,
+# duration), so old events are overwritten and memory never grows.
+# The buffer can be exported as Chrome trace events (chrome://tracing or
+# https://ui.perfetto.dev) and ProfilerOverlay draws per phase milliseconds,
+# a frame time graph and the collision rects over the game.
+#--------------------------------------------------------
+
+class Profiler():
+    def __init__(self, capacity = 1 << 16, frames = 240):
+        self.enabled = False
+        self.capacity = capacity
+        self.name_ids = {}
+        self.names = []
+        self.scopes = {}
+        self.event_names = array("H", [0]) * capacity
+        self.event_starts = array("d", [0.0]) * capacity
+        self.event_durations = array("d", [0.0]) * capacity
+        self.count = 0 #Events written so far, the ring position is count % capacity
+        self.frame_times = deque(maxlen = frames) #Milliseconds
+        self.frame_phases = deque(maxlen = 30) #Per phase milliseconds of the last frames
+        self.current_phases = {}
+        self.frame_start = None
+
+    def scope(self, name):
+        found = self.scopes.get(name)
+        if found is None:
+            self.name_ids[name] = len(self.names)
+            self.names.append(name)
+            found = self.scopes[name] = Scope(self, self.name_ids[name])
+        return found
+
+    def record(self, name_id, start, end):
+        index = self.count % self.capacity
+        self.event_names[index] = name_id
+        self.event_starts[index] = start
+        self.event_durations[index] = end - start
+        self.count += 1
+        name = self.names[name_id]
+        self.current_phases[name] = self.current_phases.get(name, 0.0) + (end - start) * 1000
+
+    def end_frame(self):
+        #Call once per frame, closes the frame started by the previous call
+        now = time.perf_counter()
+        if self.enabled and self.frame_start is not None:
+            self.frame_times.append((now - self.frame_start) * 1000)
+            self.frame_phases.append(self.current_phases)
+        self.current_phases = {}
+        self.frame_start = now
+
+    def phase_averages(self):
+        #Average milliseconds per frame of every phase over the last frames
+        totals = {}
+        for phases in self.frame_phases:
+            for name, ms in phases.items():
+                totals[name] = totals.get(name, 0.0) + ms
+        frames = max(1, len(self.frame_phases))
+        return dict((name, ms / frames) for name, ms in totals.items())
+
+    def events(self):
+        #(name, start seconds, duration seconds) from oldest to newest
+        count = min(self.count, self.capacity)
+        first = self.count - count
+        for position in range(first, self.count):
+            index = position % self.capacity
+            yield self.names[self.event_names[index]], self.event_starts[index], self.event_durations[index]
+
+    def chrome_trace(self):
+        events = list(self.events())
+        origin = min((start for name, start, duration in events), default = 0.0)
+        return {"traceEvents": [{"name": name, "ph": "X", "pid": 0, "tid": 0,
+                                 "ts": round((start - origin) * 1e6, 3), "dur": round(duration * 1e6, 3)}
+                                for name, start, duration in events],
+                "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path):
+        with open(path, "w") as file:
+            json.dump(self.chrome_trace(), file)
+
+    def clear(self):
+        self.count = 0
+        self.frame_times.clear()
+        self.frame_phases.clear()
+        self.current_phases = {}
+
+
+class Scope():
+    __slots__ = ("profiler", "name_id", "start")
+
+    def __init__(self, profiler, name_id):
+        self.profiler = profiler
+        self.name_id = name_id
+        self.start = None
+
+    def __enter__(self):
+        if self.profiler.enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *error):
+        if self.start is not None:
+            self.profiler.record(self.name_id, self.start, time.perf_counter())
+            self.start = None
+
+
+profiler = Profiler()
+
+def scope(name):
+    return profiler.scope(name)
+
+
+#--------------------------------------------------------
+# Overlay
+#--------------------------------------------------------
+class ProfilerOverlay():
+    def __init__(self, profiler, position = (10, 60), graph_size = (240, 60)):
+        self.profiler = profiler
+        self.position = position
+        self.graph_size = graph_size
+        self.visible = False
+
+    def toggle(self):
+        self.visible = not self.visible
+        self.profiler.enabled = self.visible
+        if not self.visible:
+            self.profiler.frame_times.clear()
+            self.profiler.frame_phases.clear()
+
+    def draw(self, surface, level = None):
+        if not self.visible:
+            return
+        if level is not None:
+            self.draw_collision_rects(surface, level)
+        font = get_font('consolas', 16)
+        x, y = self.position
+        width, height = self.graph_size
+        panel = pygame.Surface((width, height + 18 * (len(self.profiler.names) + 1) + 8), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 170))
+        surface.blit(panel, (x - 4, y - 4))
+
+        times = self.profiler.frame_times
+        if times:
+            average = sum(times) / len(times)
+            surface.blit(font.render(f"frame {average:.2f}ms  max {max(times):.2f}ms", True, "white"), (x, y))
+        y += 18
+        budget_y = y + height - height * (1000 / 60) / 50 #Graph is 0 to 50ms, line at one 60fps frame
+        for index, ms in enumerate(times):
+            bar = min(height, height * ms / 50)
+            color = "green" if ms <= 1000 / 60 else "red"
+            pygame.draw.line(surface, color, (x + index, y + height), (x + index, y + height - bar))
+        pygame.draw.line(surface, "yellow", (x, budget_y), (x + width, budget_y))
+        y += height + 4
+
+        for name, ms in sorted(self.profiler.phase_averages().items(), key = lambda phase: -phase[1]):
+            surface.blit(font.render(name, True, "white"), (x, y))
+            text = font.render(f"{ms:.3f}ms", True, "white")
+            surface.blit(text, (x + width - text.get_width(), y))
+            y += 18
+
+    def draw_collision_rects(self, surface, level):
+        to_screen = level.camera.to_screen #The level's rects are in world coordinates
+        for sprite in level.janitor.sprites() + level.banker.sprites():
+            pygame.draw.rect(surface, "green", to_screen(sprite.rect), 1)
+            for tile in level.nearby(sprite.rect, "tiles"): #What the collision passes look at
+                pygame.draw.rect(surface, "gray", to_screen(tile.rect), 1)
+        for sprite in level.items.sprites() + level.elevators.sprites() + level.obstacles.sprites() + level.levers.sprites():
+            pygame.draw.rect(surface, "cyan", to_screen(sprite.rect), 1)
+        for enemy in level.enemies:
+            pygame.draw.rect(surface, "red", to_screen(enemy.rect), 1)
+            pygame.draw.rect(surface, "orange", to_screen(enemy.sight_rect), 1)
+        for tile in level.water_tiles:
+            pygame.draw.rect(surface, "blue", to_screen(tile.rect), 1)
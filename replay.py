@@ -0,0 +1,177 @@
+import os, sys, struct, time, random
+from array import array
+from inputs import InputState, game_keys
+
+#--------------------------------------------------------
+# Recording and replaying play sessions
+# A recording is the level id, the seed and every simulation step's input for
+# both players, optionally with the level's state hash after each step so a
+# replay can say exactly when it stopped matching the original session.
+#
+# File layout (little endian):
+#   magic "BTBR", version u8, flags u8 (1 = has hashes)
+#   level id length u8, level id, compiled level key (20 bytes), seed u64
+#   step count u32, run count u32
+#   runs of identical steps: step count u16, held keys u16, pressed keys u16
+#   state hashes: u64 per step
+# Keys are stored as one bit each, in the order of inputs.game_keys.
+#--------------------------------------------------------
+
+magic = b"BTBR"
+version = 1
+has_hashes = 1
+
+
+class ReplayError(ValueError):
+    pass
+
+
+def key_mask(keys):
+    mask = 0
+    for bit, key in enumerate(game_keys):
+        if key in keys:
+            mask |= 1 << bit
+    return mask
+
+def mask_keys(mask):
+    return frozenset(key for bit, key in enumerate(game_keys) if mask >> bit & 1)
+
+
+class Recording():
+    def __init__(self, level_id, level_key, seed = 0, hashes = True):
+        self.level_id = level_id
+        self.level_key = level_key #Compiled level key, catches maps edited since recording
+        self.seed = seed
+        self.name = f"{level_id}-{time.strftime('%Y%m%d-%H%M%S')}.btbr" #File name to save it under
+        self.masks = array("I") #held | pressed << 16 for every step
+        self.hashes = array("Q") if hashes else None
+
+    def __len__(self):
+        return len(self.masks)
+
+    def record(self, inputs, level = None):
+        #Called after each simulation step with the input that step used
+        self.masks.append(key_mask(inputs.held) | key_mask(inputs.pressed) << 16)
+        if self.hashes is not None:
+            self.hashes.append(level.state_hash())
+
+    def inputs(self):
+        #InputState for every step, consecutive equal steps share one object
+        states = []
+        last_mask = None
+        for mask in self.masks:
+            if mask != last_mask:
+                state = InputState(mask_keys(mask & 0xffff), mask_keys(mask >> 16), (0,0))
+                last_mask = mask
+            states.append(state)
+        return states
+
+    def to_bytes(self):
+        runs = []
+        for mask in self.masks:
+            if runs and runs[-1][1] == mask and runs[-1][0] < 0xffff:
+                runs[-1][0] += 1
+            else:
+                runs.append([1, mask])
+        level_id = self.level_id.encode()
+        data = [magic, struct.pack("<BBB", version, has_hashes if self.hashes is not None else 0, len(level_id)), level_id,
+                bytes.fromhex(self.level_key), struct.pack("<QII", self.seed, len(self.masks), len(runs))]
+        data.extend(struct.pack("<HHH", count, mask & 0xffff, mask >> 16) for count, mask in runs)
+        if self.hashes is not None:
+            data.append(self.hashes.tobytes())
+        return b"".join(data)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:4] != magic:
+            raise ReplayError("not a recording")
+        file_version, flags, id_length = struct.unpack_from("<BBB", data, 4)
+        if file_version != version:
+            raise ReplayError(f"recording version {file_version}, expected {version}")
+        offset = 7
+        level_id = data[offset:offset + id_length].decode()
+        offset += id_length
+        level_key = data[offset:offset + 20].hex()
+        offset += 20
+        seed, steps, run_count = struct.unpack_from("<QII", data, offset)
+        offset += 16
+        recording = cls(level_id, level_key, seed, flags & has_hashes)
+        for count, held, pressed in struct.iter_unpack("<HHH", data[offset:offset + run_count * 6]):
+            recording.masks.extend([held | pressed << 16] * count)
+        offset += run_count * 6
+        if len(recording.masks) != steps:
+            raise ReplayError("recording is truncated")
+        if recording.hashes is not None:
+            recording.hashes.frombytes(data[offset:offset + steps * 8])
+            if len(recording.hashes) != steps:
+                raise ReplayError("recording is truncated")
+        return recording
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        with open(path, "wb") as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            return cls.from_bytes(file.read())
+
+
+def level_id(level_map, level_param):
+    #Id of a map in settings.levels, None if it isn't one of them
+    from settings import levels
+    for name, (layout, params, background) in levels.items():
+        if layout is level_map and params is level_param:
+            return name
+    return None
+
+
+def start_recording(level, seed = 0, hashes = True):
+    #Record every step the level takes from now on
+    name = level_id(level.level_map, level.level_param)
+    level.recorder = Recording(name if name is not None else "unknown", level.compiled.key, seed, hashes)
+    return level.recorder
+
+
+def replay(recording, check = True):
+    #Play a recording back headless as fast as possible.
+    #Returns (steps run, outcome, first step whose state hash differs or None)
+    from settings import levels
+    from headless import make_level
+    if recording.level_id not in levels:
+        raise ReplayError(f"unknown level {recording.level_id!r}")
+    layout, params, background = levels[recording.level_id]
+    level = make_level(layout, params)
+    if level.compiled.key != recording.level_key:
+        raise ReplayError(f"level {recording.level_id!r} has changed since it was recorded")
+    random.seed(recording.seed)
+    hashes = recording.hashes if check else None
+    steps = 0
+    outcome = ""
+    for state in recording.inputs():
+        keep_running, outcome = level.step(state)
+        level.inputs = state
+        if hashes is not None and level.state_hash() != hashes[steps]:
+            return steps + 1, outcome, steps
+        steps += 1
+        if not keep_running:
+            break
+    return steps, outcome, None
+
+
+if __name__ == '__main__':
+    #python replay.py recordings/<file>.btbr [--no-check]
+    import io, contextlib
+    recording = Recording.load(sys.argv[1])
+    check = "--no-check" not in sys.argv
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()): #The level prints whenever a player is spotted
+        steps, outcome, diverged = replay(recording, check)
+    elapsed = time.perf_counter() - start
+    print(f"{recording.level_id}: {steps}/{len(recording)} steps, outcome {outcome or 'none'}, {steps / elapsed:.0f} steps/s")
+    if diverged is not None:
+        print(f"diverged from the recording at step {diverged}")
+        sys.exit(1)
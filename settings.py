@@ -20,8 +20,28 @@
 #
 #  - put parameters in order of which the entity appears in the map (left to right, top to bottom)
 #  - level_param is a 2d array, each subarray contains the parameters for one entity
+#  - run python levelcompiler.py to check every map lines up with its parameters
 # -----------------------------------------------------------------------------------------------
 
+# Only redraw and push the parts of the screen that changed while in game
+# instead of the whole window every frame
+dirty_rect_rendering = False
+
+# Frame pacing: the game logic always runs at simulation_rate steps per second,
+# frames are capped at fps_cap (or synced to the monitor with vsync)
+simulation_rate = 60
+fps_cap = 60
+vsync = False
+render_interpolation = False # draw moving sprites between simulation steps, useful when fps_cap > simulation_rate
+max_simulation_steps = 5 # most steps to catch up on in one frame, the rest is dropped
+max_skipped_frames = 0 # frames that can go undrawn in a row when running behind
+show_frame_stats = False # print average, p95 and p99 frame times every 5 seconds
+show_profiler = False # start with the profiler overlay on, F3 toggles it, F4 saves a chrome trace
+
+# Record every play session to recordings_dir, play one back with python replay.py <file>
+record_sessions = False
+recordings_dir = "recordings"
+
 
 level_map_test = [
 'XXXXXXXXXXXXXXXXXXXXXXXXXXXX',
@@ -179,6 +199,17 @@ level_map_4 = [
 
 level4_param = [[1], [1], [2], [6, 2], [2], [11, 4]]
 
+# Every playable map by id: (map, parameters, background). Recordings and
+# benchmarks refer to levels by these ids
+levels = {
+    "test": (level_map_test, leveltest_param, "./imgs/stage1_lobby.png"),
+    "test_gravity": (level_map_test_gravity, leveltest_param, "./imgs/stage1_lobby.png"),
+    "lobby": (level_map_0, level0_param, "./imgs/stage1_lobby.png"),
+    "basement": (level_map_1, level1_param, "./imgs/stage2_basement.png"),
+    "offices": (level_map_3, level3_param, "./imgs/stage3_offices.png"),
+    "executive": (level_map_4, level4_param, "./imgs/stage4_executive.png"),
+}
+
 #11 rows
 # tile_size = 64
 # screen_width = 1280
@@ -0,0 +1,204 @@
+import hashlib, struct
+from array import array
+import pygame
+from inputs import game_keys, InputState
+from player import janitorright, janitorleft, bankerright, bankerleft
+from enemy import enemyr, enemyl
+from assets import load_image
+
+#--------------------------------------------------------
+# Level state snapshots
+# Everything that changes while a level is played, packed into two flat
+# arrays (ints and floats) in a fixed order: score and held keys, both players,
+# roombas, elevators, items, levers, then which coins / obstacles are still
+# there and which pools are still water. Sprites themselves are never copied,
+# images are stored as an index into a per level table of the surfaces the
+# sprites can show.
+# Taking or restoring one is a few dozen attribute reads / writes, so they are
+# cheap enough for checkpoints, rewind or search. A snapshot only fits the
+# level (map and parameters) it was taken from.
+#--------------------------------------------------------
+
+class LevelSnapshot():
+    __slots__ = ("key", "ints", "floats")
+
+    def __init__(self, key, ints, floats):
+        self.key = key #Compiled level key, which level this snapshot belongs to
+        self.ints = ints
+        self.floats = floats
+
+    def to_bytes(self):
+        key = self.key.encode()
+        header = struct.pack("<HII", len(key), len(self.ints), len(self.floats))
+        return header + key + self.ints.tobytes() + self.floats.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        key_length, int_count, float_count = struct.unpack_from("<HII", data)
+        offset = struct.calcsize("<HII")
+        key = bytes(data[offset:offset + key_length]).decode()
+        offset += key_length
+        ints = array("q")
+        ints.frombytes(data[offset:offset + int_count * ints.itemsize])
+        offset += int_count * ints.itemsize
+        floats = array("d")
+        floats.frombytes(data[offset:offset + float_count * floats.itemsize])
+        return cls(key, ints, floats)
+
+    def state_hash(self):
+        #64 bit hash of the state, equal snapshots always hash the same
+        digest = hashlib.blake2b(self.ints.tobytes(), digest_size = 8)
+        digest.update(self.floats.tobytes())
+        return int.from_bytes(digest.digest(), "little")
+
+    def __eq__(self, other):
+        return isinstance(other, LevelSnapshot) and self.key == other.key and self.ints == other.ints and self.floats == other.floats
+
+    def __hash__(self):
+        return self.state_hash()
+
+
+class SnapshotLayout():
+    #The sprites a level's snapshots describe and the images they can show
+    def __init__(self, level):
+        initial = dict((id(group), sprites) for group, sprites in level.initial_groups)
+        self.janitor = level.janitor.sprite
+        self.banker = level.banker.sprite
+        self.enemies = initial[id(level.enemies)]
+        self.elevators = initial[id(level.elevators)]
+        self.items = initial[id(level.items)]
+        self.item_index = dict((item, index) for index, item in enumerate(self.items))
+        self.levers = initial[id(level.levers)]
+        self.points = initial[id(level.points)]
+        self.obstacles = initial[id(level.obstacles)]
+        self.water = list(level.water)
+
+        self.images = []
+        self.image_index = {}
+        for image in janitorright + janitorleft + bankerright + bankerleft + [enemyr, enemyl, load_image("./imgs/leverdown.png")]:
+            self.image_id(image)
+        for sprite in [self.janitor, self.banker] + self.enemies + self.levers:
+            self.image_id(sprite.image)
+        for item in self.items:
+            for image in (item.uncollected_img, item.collected_img, load_image(item.img, (45, 45), flip = True), load_image(item.img, (25, 25), flip = True)):
+                self.image_id(image)
+
+    def image_id(self, image):
+        index = self.image_index.get(image)
+        if index is None: #Not seen before, e.g. a new sprite frame
+            index = self.image_index[image] = len(self.images)
+            self.images.append(image)
+        return index
+
+
+def get_layout(level):
+    if level.chunks.streaming:
+        raise ValueError("streamed levels are never all loaded at once, they can't be snapshotted")
+    layout = getattr(level, "snapshot_layout", None)
+    if layout is None:
+        layout = level.snapshot_layout = SnapshotLayout(level)
+    return layout
+
+
+def take_snapshot(level):
+    layout = get_layout(level)
+    image_id = layout.image_id
+    ints = array("q")
+    floats = array("d")
+    held = 0
+    for bit, key in enumerate(game_keys):
+        if key in level.inputs.held:
+            held |= 1 << bit
+    ints.extend((level.score, held))
+
+    for player in (layout.janitor, layout.banker):
+        rect = player.rect
+        item = layout.item_index[player.inventory[0]] if player.inventory else -1
+        ints.extend((rect.x, rect.y, rect.w, rect.h, player.fixed_y, player.velocity_y, player.counter, player.facingRight, player.canMove, player.is_on_ground, item, image_id(player.image)))
+        floats.append(player.direction.x)
+    for enemy in layout.enemies:
+        ints.extend((enemy.rect.x, enemy.rect.y, enemy.sight_rect.x, enemy.sight_rect.y, enemy.posFromStart, enemy.direction, image_id(enemy.image)))
+    for elevator in layout.elevators:
+        ints.extend((elevator.rect.x, elevator.rect.y, elevator.posFromStart, elevator.direction, elevator.activated))
+    for item in layout.items:
+        rect = item.rect
+        ints.extend((rect.x, rect.y, rect.w, rect.h, item.fixed_y, item.velocity_y, item.gravity, item.collected, item.sleeping, image_id(item.image)))
+        floats.append(item.direction.x)
+    for lever in layout.levers:
+        rect = lever.rect
+        ints.extend((rect.x, rect.y, rect.w, rect.h, lever.flipUse, image_id(lever.image)))
+    ints.extend(point.alive() for point in layout.points)
+    ints.extend(obstacle.alive() for obstacle in layout.obstacles)
+    ints.extend(water.active for water in layout.water)
+    return LevelSnapshot(level.compiled.key, ints, floats)
+
+
+def restore_snapshot(level, snapshot):
+    if snapshot.key != level.compiled.key:
+        raise ValueError("snapshot was taken from a different level")
+    layout = get_layout(level)
+    images = layout.images
+    ints = iter(snapshot.ints)
+    floats = iter(snapshot.floats)
+    level.score = next(ints)
+    held = next(ints)
+    level.inputs = InputState(frozenset(key for bit, key in enumerate(game_keys) if held >> bit & 1), frozenset(), (0,0))
+
+    for player in (layout.janitor, layout.banker):
+        player.rect.update(next(ints), next(ints), next(ints), next(ints))
+        player.fixed_y = next(ints)
+        player.velocity_y = next(ints)
+        player.counter = next(ints)
+        player.facingRight = bool(next(ints))
+        player.canMove = bool(next(ints))
+        player.is_on_ground = bool(next(ints))
+        item = next(ints)
+        player.inventory = [layout.items[item]] if item >= 0 else []
+        player.image = images[next(ints)]
+        player.direction.update(next(floats), 0)
+    for enemy in layout.enemies:
+        enemy.rect.topleft = next(ints), next(ints)
+        enemy.sight_rect.topleft = next(ints), next(ints)
+        enemy.posFromStart = next(ints)
+        enemy.direction = next(ints)
+        enemy.image = images[next(ints)]
+    for elevator in layout.elevators:
+        elevator.rect.topleft = next(ints), next(ints)
+        elevator.posFromStart = next(ints)
+        elevator.direction = next(ints)
+        elevator.activated = bool(next(ints))
+    for item in layout.items:
+        item.rect = pygame.Rect(next(ints), next(ints), next(ints), next(ints))
+        item.fixed_y = next(ints)
+        item.velocity_y = next(ints)
+        item.gravity = next(ints)
+        item.collected = bool(next(ints))
+        item.sleeping = bool(next(ints))
+        item.image = images[next(ints)]
+        size = (25, 25) if item.collected else (45, 45)
+        item.left_img = item.collected_img if item.collected else item.uncollected_img
+        item.right_img = load_image(item.img, size, flip = True)
+        item.direction.update(next(floats), 0)
+    for lever in layout.levers:
+        rect = pygame.Rect(next(ints), next(ints), next(ints), next(ints))
+        lever.flipUse = next(ints)
+        lever.image = images[next(ints)]
+        if rect != lever.rect:
+            lever.rect = rect
+            level.grid.update(lever)
+    for sprites, group in ((layout.points, level.points), (layout.obstacles, level.obstacles)):
+        for sprite in sprites:
+            if next(ints):
+                group.add(sprite)
+            else:
+                sprite.kill()
+    for water in layout.water:
+        if next(ints):
+            water.flood(level.tiles)
+        else:
+            water.clean(level.tiles)
+    level.physics.find_platforms([layout.janitor, layout.banker] + layout.items, layout.elevators)
+    #Sight lines and the static layer catch up from the grid changes on the next step / draw
+    level.patrol.invalidate()
+    level.previous_positions = {}
+    level.invalidate()
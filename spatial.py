@@ -0,0 +1,90 @@
+import pygame
+
+# Uniform grid over the level's tile cells. Every sprite is bucketed into each
+# cell its rect touches, so asking "what overlaps this rect" only has to look at
+# the handful of cells around the rect instead of every sprite in the level.
+class SpatialGrid():
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}    # (layer, col, row) -> sprites in that cell
+        self.entries = {}  # sprite -> (layer, insertion order, cell keys, indexed rect)
+        self.counter = 0
+        self.changes = []  # rects added or removed since the last take_changes()
+
+    def cell_range(self, rect):
+        size = self.cell_size
+        cols = range(rect.left // size, (rect.right - 1) // size + 1)
+        rows = range(rect.top // size, (rect.bottom - 1) // size + 1)
+        return cols, rows
+
+    def insert(self, sprite, layer, area = None): #area: index the sprite over this rect instead of its own
+        if sprite in self.entries:
+            self.remove(sprite)
+        rect = sprite.rect.copy() if area is None else area.copy()
+        cols, rows = self.cell_range(rect)
+        keys = [(layer, col, row) for row in rows for col in cols]
+        for key in keys:
+            self.cells.setdefault(key, []).append(sprite)
+        self.entries[sprite] = (layer, self.counter, keys, rect)
+        self.counter += 1
+        self.changes.append(rect)
+
+    def remove(self, sprite):
+        entry = self.entries.pop(sprite, None)
+        if entry is None:
+            return
+        for key in entry[2]:
+            bucket = self.cells[key]
+            bucket.remove(sprite)
+            if not bucket:
+                del self.cells[key]
+        self.changes.append(entry[3]) #Where the sprite was, its rect may have moved since
+
+    def update(self, sprite): #Re-bucket a sprite whose rect changed (e.g. a flipped lever)
+        entry = self.entries.get(sprite)
+        if entry is not None:
+            self.insert(sprite, entry[0])
+
+    def mark_changes(self):
+        return len(self.changes)
+
+    def squash_changes(self, mark, rect): #Report everything changed since mark as one rect, e.g. a whole chunk loading
+        if len(self.changes) > mark:
+            self.changes[mark:] = [rect]
+
+    def take_changes(self):
+        changes = self.changes
+        self.changes = []
+        return changes
+
+    def query(self, rect, layer):
+        found = set()
+        cols, rows = self.cell_range(rect)
+        cells = self.cells
+        for row in rows:
+            for col in cols:
+                bucket = cells.get((layer, col, row))
+                if bucket:
+                    found.update(bucket)
+        if len(found) < 2:
+            return list(found)
+        entries = self.entries
+        return sorted(found, key = lambda sprite: entries[sprite][1]) #Same order the sprites were added to their group
+
+
+# Sprite group that keeps a SpatialGrid in sync with its membership. Anything
+# added to the group is indexed and anything removed (including sprite.kill())
+# drops out of the grid, so Water.clean and obstacle kills need no extra code.
+class IndexedGroup(pygame.sprite.Group):
+    def __init__(self, grid, layer, *sprites):
+        self.grid = grid
+        self.layer = layer
+        super().__init__(*sprites)
+
+    def add_internal(self, sprite, layer = None):
+        super().add_internal(sprite, layer)
+        self.grid.insert(sprite, self.layer)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.grid.remove(sprite)
@@ -0,0 +1,78 @@
+import pygame
+
+# The background and every sprite that (almost) never changes, composited into
+# pages of the level. Each frame blits the few pages under the camera instead of
+# the background plus hundreds of tiles; when the level changes (a coin is taken,
+# water is cleaned, a lever is flipped, an obstacle is removed) only the changed
+# rects of the pages already made are repainted.
+# Pages are made the first time they come into view and the least recently
+# shown ones are dropped past max_pages, so memory depends on the screen size
+# and not on how big the level is. The background repeats across the level.
+class StaticLayer():
+    def __init__(self, background, grid, layers, page_size = 16 * 46, max_pages = 24):
+        self.background = background
+        self.grid = grid
+        self.layers = layers #Grid layers in the order they are drawn
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.pages = {} #(col, row) -> surface, in the order they were last shown
+
+    def bake(self): #Everything changed, pages are painted again when next shown
+        self.pages.clear()
+
+    def page_rect(self, col, row):
+        return pygame.Rect(col * self.page_size, row * self.page_size, self.page_size, self.page_size)
+
+    def page_range(self, rect):
+        size = self.page_size
+        cols = range(max(0, rect.left // size), (rect.right - 1) // size + 1)
+        rows = range(max(0, rect.top // size), (rect.bottom - 1) // size + 1)
+        return [(col, row) for row in rows for col in cols]
+
+    def page(self, col, row):
+        surface = self.pages.pop((col, row), None)
+        if surface is None:
+            surface = pygame.Surface((self.page_size, self.page_size)).convert()
+            self.paint(surface, self.page_rect(col, row), self.page_rect(col, row))
+            while len(self.pages) >= self.max_pages:
+                del self.pages[next(iter(self.pages))]
+        self.pages[(col, row)] = surface #Most recently shown last
+        return surface
+
+    def paint(self, surface, origin, rect): #Repaint rect (world coordinates) of the page at origin
+        surface.set_clip(rect.move(-origin.x, -origin.y))
+        surface.fill('black')
+        width, height = self.background.get_size()
+        for y in range(rect.top // height * height, rect.bottom, height):
+            for x in range(rect.left // width * width, rect.right, width):
+                surface.blit(self.background, (x - origin.x, y - origin.y))
+        for layer in self.layers:
+            for sprite in self.grid.query(rect, layer):
+                surface.blit(sprite.image, sprite.rect.move(-origin.x, -origin.y))
+        surface.set_clip(None)
+
+    def refresh(self, rects):
+        for rect in rects:
+            for key in self.page_range(rect):
+                surface = self.pages.get(key)
+                origin = self.page_rect(*key)
+                part = rect.clip(origin)
+                if surface is not None and part.width and part.height: #Pages not made yet are painted up to date anyway
+                    self.paint(surface, origin, part)
+
+    def draw(self, surface, offset = (0,0)):
+        self.draw_area(surface, surface.get_rect(), offset)
+
+    def draw_area(self, surface, rect, offset = (0,0)): #Copy one screen area of the layer, used to erase moving sprites
+        rect = rect.clip(surface.get_rect())
+        area = rect.move(offset)
+        for key in self.page_range(area):
+            origin = self.page_rect(*key)
+            part = area.clip(origin)
+            if part.width and part.height:
+                surface.blit(self.page(*key), (part.x - offset[0], part.y - offset[1]), part.move(-origin.x, -origin.y))
+
+    def area(self, rect): #Copy of a world rect of the layer
+        copy = pygame.Surface(rect.size).convert()
+        self.draw_area(copy, copy.get_rect(), rect.topleft)
+        return copy
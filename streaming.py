@@ -0,0 +1,183 @@
+import numpy as np
+import pygame
+from tiles import Tile
+
+#--------------------------------------------------------
+# Level streaming
+# Big maps are split into chunks of chunk_size x chunk_size cells and only the
+# chunks around the players and the camera are loaded: their tiles, water,
+# coins, roombas and elevators are sprites in the level's groups and grid.
+# Chunks left far enough behind are evicted. Their tiles are dropped (the
+# compiled map still has them) and what can change is kept in a small dormant
+# tuple per chunk: which coins are still there and where each roomba and
+# elevator is on its patrol. Loading the chunk again carries on from there,
+# nothing in a dormant chunk moves.
+# A pool can cross chunks, so the pools themselves (cleaned or not, and the
+# level's WaterIndex of them) live as long as the level and a chunk only
+# holds the water or floor tiles of its part of each pool.
+# Things that link across the map or are few anyway live as long as the
+# level: players, items, exits, obstacles and levers.
+# Maps no bigger than min_size cells a side are a single chunk that is loaded
+# with the level and never evicted, which is exactly a level without streaming.
+#--------------------------------------------------------
+
+chunk_cells = "ECZ" #Map entities that belong to the chunk they start in
+
+
+class Chunk():
+    __slots__ = ("tiles", "water", "coins", "enemies", "elevators")
+
+    def __init__(self):
+        self.tiles = []
+        self.water = [] #(pool, its water tiles in this chunk)
+        self.coins = []
+        self.enemies = []
+        self.elevators = []
+
+
+class LevelChunks():
+    def __init__(self, level, compiled, chunk_size = 16, radius = 2, min_size = 64):
+        cols, rows = compiled.size()
+        self.level = level
+        self.compiled = compiled
+        self.streaming = cols > min_size or rows > min_size
+        self.chunk_size = chunk_size if self.streaming else max(cols, rows)
+        self.radius = radius #Chunks around a player that are always loaded, one more before they are evicted
+        self.chunk_cols = -(-cols // self.chunk_size)
+        self.chunk_rows = -(-rows // self.chunk_size)
+        self.loaded = {} #(chunk col, chunk row) -> Chunk
+        self.dormant = {} #(chunk col, chunk row) -> (coins alive, roomba states, elevator states)
+        self.last_areas = None
+        #The chunk entities sorted by chunk (still in map order within one), found with a binary search on load
+        self.is_chunk_entity = np.isin(compiled.entities[:, 0], [ord(cell) for cell in chunk_cells])
+        entities = compiled.entities[self.is_chunk_entity]
+        keys = entities[:, 2] // self.chunk_size * self.chunk_cols + entities[:, 1] // self.chunk_size
+        order = np.argsort(keys, kind = "stable")
+        self.entities = entities[order]
+        self.entity_keys = keys[order]
+        #The part of every pool in each chunk: (pool index, first col, last col + 1)
+        self.water = {}
+        for pool, (row, start, end) in enumerate(compiled.water.tolist()):
+            for chunk_col in range(start // self.chunk_size, (end - 1) // self.chunk_size + 1):
+                first = max(start, chunk_col * self.chunk_size)
+                last = min(end, (chunk_col + 1) * self.chunk_size)
+                self.water.setdefault((chunk_col, row // self.chunk_size), []).append((pool, first, last))
+
+    def owns(self, group):
+        #Sprites of this group come and go with their chunk
+        level = self.level
+        return self.streaming and group in (level.tiles, level.water_tiles, level.points, level.enemies, level.elevators)
+
+    def chunk_rect(self, key):
+        size = self.chunk_size * self.level.tile_size
+        return pygame.Rect(key[0] * size, key[1] * size, size, size)
+
+    def around(self, rect, radius):
+        size = self.chunk_size * self.level.tile_size
+        cols = range(max(0, rect.left // size - radius), min(self.chunk_cols, (rect.right - 1) // size + radius + 1))
+        rows = range(max(0, rect.top // size - radius), min(self.chunk_rows, (rect.bottom - 1) // size + radius + 1))
+        return set((col, row) for row in rows for col in cols)
+
+    def is_loaded(self, rect):
+        size = self.chunk_size * self.level.tile_size
+        return (rect.centerx // size, rect.centery // size) in self.loaded
+
+    def load_all(self):
+        for row in range(self.chunk_rows):
+            for col in range(self.chunk_cols):
+                if (col, row) not in self.loaded:
+                    self.load((col, row))
+
+    def update(self):
+        #Load the chunks around the players and the camera, evict the ones far from all of them
+        if not self.streaming:
+            return
+        level = self.level
+        areas = [level.janitor.sprite.rect, level.banker.sprite.rect]
+        if level.camera is not None:
+            areas.append(level.camera.view)
+        size = self.chunk_size * level.tile_size
+        positions = [(rect.left // size, rect.top // size, rect.right // size, rect.bottom // size) for rect in areas]
+        if positions == self.last_areas: #Nobody crossed into another chunk
+            return
+        self.last_areas = positions
+        wanted = set()
+        keep = set()
+        for rect in areas:
+            wanted |= self.around(rect, self.radius)
+            keep |= self.around(rect, self.radius + 1)
+        for key in [key for key in self.loaded if key not in keep]:
+            self.evict(key)
+        for key in sorted(wanted - set(self.loaded), key = lambda key: (key[1], key[0])):
+            self.load(key)
+
+    def load(self, key):
+        level = self.level
+        size = self.chunk_size
+        mark = level.grid.mark_changes()
+        chunk = self.loaded[key] = Chunk()
+        for cell, col, row in self.compiled.tiles((key[0] * size, key[1] * size, size, size)):
+            chunk.tiles.append(level.add_tile(cell, col, row))
+        for pool, first, last in self.water.get(key, ()):
+            water = level.water[pool]
+            tiles = [Tile((col * level.tile_size, water.Y), "./imgs/water.png") for col in range(first, last)]
+            water.load(tiles, level.tiles)
+            chunk.water.append((water, tiles))
+        index = key[1] * self.chunk_cols + key[0]
+        start, end = np.searchsorted(self.entity_keys, [index, index + 1])
+        for kind, col, row, first, second in self.entities[start:end].tolist():
+            cell = chr(kind)
+            sprite = level.add_entity(cell, col, row, first, second)
+            if cell == "C":
+                chunk.coins.append(sprite)
+            elif cell == "E":
+                chunk.enemies.append(sprite)
+            else:
+                chunk.elevators.append(sprite)
+
+        state = self.dormant.pop(key, None)
+        if state is not None: #Carry on from where the chunk was evicted
+            coins, enemies, elevators = state
+            for coin, alive in zip(chunk.coins, coins):
+                if not alive:
+                    coin.kill()
+            for enemy, (x, posFromStart, direction, image) in zip(chunk.enemies, enemies):
+                enemy.rect.x = x
+                enemy.posFromStart = posFromStart
+                enemy.direction = direction
+                enemy.image = image
+                if direction == 1:
+                    enemy.sight_rect.topleft = enemy.rect.topright
+                else:
+                    enemy.sight_rect.topright = enemy.rect.topleft
+            for elevator, (y, posFromStart, direction, activated) in zip(chunk.elevators, elevators):
+                elevator.rect.y = y
+                elevator.posFromStart = posFromStart
+                elevator.direction = direction
+                elevator.activated = activated
+        for enemy in chunk.enemies:
+            level.update_sight(enemy)
+        if self.streaming:
+            level.grid.squash_changes(mark, self.chunk_rect(key))
+
+    def evict(self, key):
+        level = self.level
+        chunk = self.loaded.pop(key)
+        mark = level.grid.mark_changes()
+        self.dormant[key] = (tuple(coin.alive() for coin in chunk.coins),
+                             tuple((enemy.rect.x, enemy.posFromStart, enemy.direction, enemy.image) for enemy in chunk.enemies),
+                             tuple((elevator.rect.y, elevator.posFromStart, elevator.direction, elevator.activated) for elevator in chunk.elevators))
+        for sprites in (chunk.tiles, chunk.coins, chunk.enemies, chunk.elevators):
+            for sprite in sprites:
+                sprite.kill()
+                level.patrol_areas.remove(sprite)
+        for water, tiles in chunk.water:
+            water.unload(tiles)
+        level.grid.squash_changes(mark, self.chunk_rect(key))
+
+    def clear(self):
+        #Forget every chunk, loaded or dormant, e.g. to restart the level
+        for key in list(self.loaded):
+            self.evict(key)
+        self.dormant.clear()
+        self.last_areas = None
@@ -1,6 +1,19 @@
 import pygame
 from level import Level
 from settings import *
+from inputs import InputState, InputBus, no_input
+from headless import make_level, simulate
+from gameloop import FrameScheduler, FrameStats
+from assets import AssetRegistry
+from ui import Scene, button
+import tempfile, os, random
+import levelcompiler
+from levelcompiler import compile_level, load_level, LevelError
+from snapshot import LevelSnapshot
+from replay import Recording, start_recording, replay
+from profiler import Profiler
+from camera import Camera
+from mapgen import generate_map
 import unittest
 # import pynput
 # from pynput.keyboard import Key, Controller
@@ -295,6 +308,665 @@ class Test_items_banker_gravity(unittest.TestCase):
         
         
 
+class Test_spatial_grid(unittest.TestCase):
+
+    def test_QueryMatchesGroups(self):
+        self.level, self.screen = testArrange1()
+        janitor = self.level.janitor.sprite
+        area = janitor.rect.inflate(200, 200)
+        expected = [tile for tile in self.level.tiles.sprites() if tile.rect.colliderect(area)]
+        found = [tile for tile in self.level.grid.query(area, "tiles") if tile.rect.colliderect(area)]
+        self.assertEqual(found, expected)
+
+    def test_KilledObstacleLeavesGrid(self):
+        self.level, self.screen = testArrange1()
+        obstacle = self.level.obstacles.sprites()[0]
+        self.assertIn(obstacle, self.level.grid.query(obstacle.rect, "obstacles"))
+        obstacle.kill()
+        self.assertNotIn(obstacle, self.level.grid.query(obstacle.rect, "obstacles"))
+
+    def test_CleanedWaterBecomesTiles(self):
+        self.level, self.screen = testArrange1()
+        water = self.level.water[0]
+        area = pygame.Rect(water.startX, water.Y, water.endX - water.startX, 46)
+        water.clean(self.level.tiles)
+        self.assertEqual(self.level.grid.query(area, "water"), [])
+        self.assertEqual(len(self.level.grid.query(area, "tiles")), (water.endX - water.startX) // 46)
+
+
+class Test_item_sleep(unittest.TestCase):
+
+    def test_RestingItemSleepsUntilDropped(self):
+        level = make_level(level_map_test, leveltest_param)
+        item = level.items.sprites()[0]
+        simulate(level, [no_input] * 120)
+        self.assertTrue(item.sleeping)
+        rest = item.rect.copy()
+        simulate(level, [no_input] * 30)
+        self.assertEqual(item.rect, rest)
+        self.assertNotIn(item, level.active_items())
+        item.drop_item(rest.topleft)
+        self.assertFalse(item.sleeping)
+        simulate(level, [no_input] * 60)
+        self.assertEqual(item.rect, rest)
+        self.assertTrue(item.sleeping)
+
+    def test_RemovedFloorWakesItem(self):
+        level = make_level(level_map_test, leveltest_param)
+        item = level.items.sprites()[0]
+        simulate(level, [no_input] * 120)
+        rest = item.rect.copy()
+        for tile in level.grid.query(item.rect.move(0, 1), "tiles"):
+            tile.kill()
+        simulate(level, [no_input] * 2)
+        self.assertFalse(item.sleeping)
+        self.assertGreater(item.rect.y, rest.y)
+
+
+class Test_physics(unittest.TestCase):
+
+    def test_MasksPerBody(self):
+        #Any number of bodies, the janitor's mask lands on water and the banker's doesn't
+        from player import Janitor, Banker
+        level = make_level(level_map_test, leveltest_param)
+        water = level.water[0]
+        bodies = [Janitor((water.startX + 46 * index, water.Y - 100)) for index in range(2)]
+        bodies += [Banker((water.startX + 46 * index, water.Y - 100)) for index in range(2)]
+        for tick in range(60):
+            level.physics.move_y(bodies)
+        for body in bodies[:2]:
+            self.assertEqual(body.rect.bottom, water.Y)
+            self.assertTrue(body.is_on_ground)
+        for body in bodies[2:]:
+            self.assertGreater(body.rect.bottom, water.Y)
+
+
+class Test_swept_collision(unittest.TestCase):
+
+    def drop(self, sweep):
+        #Bodies dropped from the top of a tall map at several tiles a tick
+        from player import Janitor, Banker
+        from item import JanitorItem
+        layout, params = generate_map(24, 240, seed = 2)
+        level = make_level(layout, params)
+        level.chunks.load_all()
+        if not sweep:
+            level.physics.sweep_from = 10**6
+        bodies = [kind((col * 46, 46)) for col in range(1, 21, 2) for kind in (Janitor, Banker)]
+        bodies += [JanitorItem((col * 46, 46), 46) for col in range(1, 21, 2)]
+        for body in bodies:
+            body.velocity_y = 300 * 1000
+        level.physics.move_y(bodies)
+        landed = [body.is_on_ground and not any(tile.rect.colliderect(body.rect) for tile in level.nearby(body.rect, "tiles")) for body in bodies]
+        return bodies, landed
+
+    def test_FallingBodiesLandOnTheFirstFloor(self):
+        bodies, landed = self.drop(True)
+        self.assertTrue(all(landed))
+        self.assertTrue(all(body.rect.bottom < 10 * 46 for body in bodies)) #Floors are 5 rows apart, a hole and a pool at most on the way
+
+    def test_TunnelsWithoutSweeping(self):
+        bodies, landed = self.drop(False)
+        self.assertFalse(all(landed))
+
+    def test_FastWalkersStopAtWalls(self):
+        #Both players running into the side walls at most of a tile a tick
+        level = make_level(level_map_test, leveltest_param)
+        janitor, banker = level.janitor.sprite, level.banker.sprite
+        janitor.speed = banker.speed = 36
+        simulate(level, [InputState.from_keys((pygame.K_d, pygame.K_LEFT))] * 40)
+        self.assertTrue(0 < janitor.rect.right <= 27 * 46)
+        self.assertTrue(46 <= banker.rect.left < 28 * 46)
+        for body in (janitor, banker):
+            self.assertFalse(any(tile.rect.colliderect(body.rect) for tile in level.nearby(body.rect, "tiles")))
+
+    def test_FastWalkersStopAtLevers(self):
+        layout = ['XXXXXXXXXXXX',
+                  'X          X',
+                  'XJN L  M B X',
+                  'XXXXXXXXXXXX']
+        for start in range(0, 30, 3): #Every way the steps can line up with the lever
+            level = make_level(layout, [[1]])
+            banker = level.banker.sprite
+            lever = level.levers.sprites()[0]
+            banker.rect.x -= start
+            banker.speed = 30
+            simulate(level, [InputState.from_keys((pygame.K_LEFT,))] * 10)
+            self.assertEqual(banker.rect.left, lever.rect.right)
+
+
+class Test_elevator_riders(unittest.TestCase):
+
+    def setUp(self):
+        self.level = make_level(level_map_4, level4_param)
+        self.elevator = [elevator for elevator in self.level.elevators if elevator.speed == 4][0]
+        self.banker = self.level.banker.sprite
+        self.elevator.carry(-200) #Halfway up, on its way down
+        self.elevator.posFromStart = 200
+        self.elevator.direction = -1
+        self.banker.rect.midbottom = self.elevator.rect.midtop
+        simulate(self.level, [no_input])
+
+    def test_RidersMoveInTheSameTick(self):
+        self.assertIs(self.banker.platform, self.elevator)
+        self.assertIn(self.banker, self.elevator.riders)
+        self.banker.activate_elevator(self.level.janitor.sprite)
+        self.assertTrue(self.elevator.activated)
+        self.assertFalse(self.banker.canMove)
+        for tick in range(20):
+            self.level.elevators.update(self.banker, self.level.janitor.sprite)
+            self.assertEqual(self.banker.rect.bottom, self.elevator.rect.top)
+            simulate(self.level, [no_input])
+        self.assertLess(self.elevator.posFromStart, 200)
+
+    def test_JumpingOffLeavesThePlatform(self):
+        self.banker.jump()
+        simulate(self.level, [no_input])
+        self.assertIsNone(self.banker.platform)
+        self.assertEqual(self.elevator.riders, set())
+
+
+class Test_water(unittest.TestCase):
+
+    def over_water(self, level, rect):
+        #Every tile of every pool, the way the level used to check
+        for water in level.water:
+            if water.active:
+                for tile in water.water_tiles:
+                    if (rect.colliderect(tile.rect) and rect.bottom < tile.rect.centery) or (rect.bottom == water.Y and rect.left < water.endX - 10 and rect.right > water.startX + 10):
+                        return True
+        return False
+
+    def test_IndexMatchesTiles(self):
+        level = make_level(level_map_test, leveltest_param)
+        rng = random.Random(3)
+        water = level.water[0]
+        for attempt in range(3000):
+            rect = pygame.Rect(rng.randrange(water.startX - 80, water.endX + 80), rng.randrange(water.Y - 80, water.Y + 30), 22, 38)
+            rect.bottom = rng.choice([rect.bottom, water.Y, water.Y + rng.randrange(1, 30)])
+            self.assertEqual(level.water_index.over_water(rect), self.over_water(level, rect), rect)
+        level.water[1].clean(level.tiles)
+        self.assertEqual(len(level.water_index), len(level.water) - 1)
+        level.reset()
+        self.assertEqual(len(level.water_index), len(level.water))
+
+    def test_JanitorCleansPoolUnderFoot(self):
+        level = make_level(level_map_test, leveltest_param)
+        janitor = level.janitor.sprite
+        water = level.water[0]
+        janitor.rect.midbottom = (water.endX, water.Y)
+        janitor.clean_water(level.water_index, level.tiles)
+        self.assertFalse(water.active)
+        self.assertTrue(all(other.active for other in level.water[1:]))
+        level.banker.sprite.rect.midbottom = (water.startX + 46, water.Y)
+        self.assertFalse(level.check_banker_on_water())
+
+    def test_FloorReusedAfterReset(self):
+        level = make_level(level_map_test, leveltest_param)
+        water = level.water[0]
+        area = pygame.Rect(water.startX, water.Y, water.endX - water.startX, 46)
+        water.clean(level.tiles)
+        floor = level.grid.query(area, "tiles")
+        level.reset()
+        self.assertTrue(water.active)
+        self.assertEqual(level.grid.query(area, "tiles"), [])
+        water.clean(level.tiles)
+        self.assertEqual(len(floor), (water.endX - water.startX) // 46)
+        self.assertEqual(set(level.grid.query(area, "tiles")), set(floor))
+
+
+class Test_static_layer(unittest.TestCase):
+
+    def test_KilledCoinIsRepainted(self):
+        self.level, self.screen = testArrange1()
+        coin = self.level.points.sprites()[0]
+        self.level.static_layer.area(coin.rect) #Make the page before the coin goes
+        coin.kill()
+        self.level.static_layer.refresh(self.level.grid.take_changes())
+        patched = self.level.static_layer.area(coin.rect)
+        self.level.static_layer.bake()
+        baked = self.level.static_layer.area(coin.rect)
+        self.assertEqual(pygame.image.tobytes(patched, "RGB"), pygame.image.tobytes(baked, "RGB"))
+
+
+class Test_dirty_rendering(unittest.TestCase):
+
+    def test_MatchesFullRedraw(self):
+        self.level, self.screen = testArrange1()
+        full_surface = pygame.Surface(self.screen.get_size())
+        dirty_surface = pygame.Surface(self.screen.get_size())
+        full = Level(level_map_test, leveltest_param, full_surface, "./imgs/stage1_lobby.png")
+        dirty = Level(level_map_test, leveltest_param, dirty_surface, "./imgs/stage1_lobby.png", dirty_rendering = True)
+        c = 0
+        while c < 30:
+            full.run()
+            dirty.run()
+            c += 1
+        self.assertLess(len(dirty.get_dirty_rects()), 40)
+        self.assertEqual(pygame.image.tobytes(full_surface, "RGB"), pygame.image.tobytes(dirty_surface, "RGB"))
+
+
+class Test_enemy_sight(unittest.TestCase):
+
+    def test_TilesBlockSight(self):
+        self.level, self.screen = testArrange1()
+        roomba = self.level.enemies.sprites()[0]
+        player = pygame.Rect(roomba.rect.right + 200, roomba.rect.y, 32, 46)
+        self.assertTrue(roomba.detect_player(player))
+        wall = pygame.sprite.Sprite()
+        wall.rect = pygame.Rect(roomba.rect.right + 100, roomba.rect.y, 46, 46)
+        behind = pygame.sprite.Sprite()
+        behind.rect = pygame.Rect(roomba.rect.x - 100, roomba.rect.y, 46, 46)
+        roomba.set_blockers([behind])
+        self.assertTrue(roomba.detect_player(player))
+        roomba.set_blockers([behind, wall])
+        self.assertFalse(roomba.detect_player(player))
+
+    def test_RowWithoutTiles(self):
+        self.level, self.screen = testArrange1()
+        roomba = self.level.enemies.sprites()[0]
+        player = pygame.Rect(roomba.rect.right + 200, roomba.rect.y, 32, 46)
+        roomba.set_blockers([])
+        self.assertTrue(roomba.detect_player(player)) #Nothing in the way
+
+
+class Test_headless(unittest.TestCase):
+
+    def test_StepWithoutDisplay(self):
+        self.level = make_level(level_map_test, leveltest_param)
+        originalX = self.level.janitor.sprite.rect.x
+        ticks, outcome = simulate(self.level, [InputState.from_keys([pygame.K_d])] * 5)
+        self.assertEqual(ticks, 5)
+        self.assertGreater(self.level.janitor.sprite.rect.x, originalX)
+
+    def test_MatchesRun(self):
+        self.level, self.screen = testArrange1()
+        headless = make_level(level_map_test, leveltest_param)
+        c = 0
+        while c < 20:
+            self.level.run(no_input)
+            headless.step(no_input)
+            c += 1
+        self.assertEqual(headless.banker.sprite.rect, self.level.banker.sprite.rect)
+        self.assertEqual([enemy.rect for enemy in headless.enemies], [enemy.rect for enemy in self.level.enemies])
+
+
+class Test_frame_pacing(unittest.TestCase):
+
+    def test_FixedSteps(self):
+        scheduler = FrameScheduler(60, 60)
+        self.assertEqual(scheduler.advance(1000 / 60), 1)
+        self.assertEqual(scheduler.advance(5), 0)
+        self.assertEqual(scheduler.advance(30), 2)
+        self.assertAlmostEqual(scheduler.alpha, (5 + 30 - 2 * 1000 / 60) / (1000 / 60))
+
+    def test_CatchUpIsCapped(self):
+        scheduler = FrameScheduler(60, 60, max_steps = 5, max_skipped_frames = 1)
+        self.assertEqual(scheduler.advance(1000, work_ms = 1000), 5)
+        self.assertFalse(scheduler.render)
+        scheduler.advance(1000, work_ms = 1000)
+        self.assertTrue(scheduler.render)
+
+    def test_Percentiles(self):
+        stats = FrameStats()
+        for ms in range(1, 101):
+            stats.add(ms)
+        self.assertEqual(stats.average(), 50.5)
+        self.assertEqual(stats.percentile(95), 96)
+        self.assertEqual(stats.percentile(99), 100)
+
+
+class Test_assets(unittest.TestCase):
+
+    def test_TilesShareOneSurface(self):
+        self.level, self.screen = testArrange1()
+        images = set(id(tile.image) for tile in self.level.tiles.sprites())
+        self.assertEqual(len(images), 1)
+
+    def test_DecodeOnceAndEvict(self):
+        testArrange1()
+        registry = AssetRegistry(budget = 46 * 46 * 4 * 3)
+        floor = registry.image("./imgs/floor1.png", (46, 46))
+        self.assertIs(registry.image("./imgs/floor1.png", (46, 46)), floor)
+        registry.image("./imgs/floor1.png", (46, 46), flip = True)
+        self.assertEqual(registry.loads, 1)
+        self.assertLessEqual(registry.cache_bytes, registry.budget)
+        self.assertIs(registry.image("./imgs/floor1.png", (46, 46)), floor) #Still in use, still shared
+
+
+class Test_menu_ui(unittest.TestCase):
+
+    def test_ButtonImagesScaledOnce(self):
+        self.level, self.screen = testArrange1()
+        start = button(100, 100, 20, 100, '', None, "imgs/buttons/slice_start.png", "imgs/buttons/hovering_slice_start.png")
+        start.draw(self.screen)
+        normal = start.normal_surface
+        start.draw(self.screen)
+        self.assertIs(start.normal_surface, normal)
+        self.assertTrue(start.isOver((101, 101)))
+        self.assertFalse(start.isOver((99, 101)))
+
+    def test_ButtonsShareImages(self):
+        self.level, self.screen = testArrange1()
+        first = button(100, 100, 20, 100, '', None, "imgs/buttons/slice_start.png", "imgs/buttons/hovering_slice_start.png")
+        second = button(100, 300, 20, 100, '', None, "imgs/buttons/slice_start.png", "imgs/buttons/hovering_slice_start.png")
+        first.draw(self.screen)
+        second.draw(self.screen)
+        self.assertIs(first.normal_surface, second.normal_surface)
+        self.assertIs(first.hover_surface, second.hover_surface)
+
+    def test_SceneBackgroundCached(self):
+        self.level, self.screen = testArrange1()
+        menu = Scene(self.screen, "imgs/start_bare.png", [])
+        menu.update()
+        background = menu.backgroundphoto
+        menu.update()
+        self.assertIs(menu.backgroundphoto, background)
+        self.assertEqual(background.get_size(), self.screen.get_size())
+
+
+class Test_input_bus(unittest.TestCase):
+
+    def test_PollOncePerFrame(self):
+        self.level, self.screen = testArrange1()
+        bus = InputBus()
+        pygame.event.clear()
+        pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key = pygame.K_s, mod = 0, unicode = 's', scancode = 0))
+        pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key = pygame.K_ESCAPE, mod = 0, unicode = '', scancode = 0))
+        inputs = bus.poll()
+        self.assertTrue(inputs.was_pressed(pygame.K_s)) #Tapped between two polls still counts
+        self.assertTrue(inputs.key_down(pygame.K_ESCAPE))
+        bus.consume()
+        inputs = bus.poll()
+        self.assertFalse(inputs.was_pressed(pygame.K_s))
+        self.assertEqual(inputs.events, ())
+
+    def test_PressOnFrameWithoutSteps(self):
+        self.level, self.screen = testArrange1()
+        bus = InputBus()
+        pygame.event.clear()
+        pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key = pygame.K_s, mod = 0, unicode = 's', scancode = 0))
+        self.level.run(bus.poll(), steps = 0)
+        inputs = bus.poll() #Next frame, the key is already up again
+        self.level.run(inputs, steps = 1)
+        bus.consume()
+        self.assertTrue(self.level.inputs.was_pressed(pygame.K_s))
+        self.assertFalse(bus.poll().was_pressed(pygame.K_s))
+
+
+class Test_level_compiler(unittest.TestCase):
+
+    def test_ParamsLinedUp(self):
+        compiled = compile_level(level_map_test, leveltest_param)
+        roomba = [entity for entity in compiled.entities.tolist() if entity[0] == ord("E")][0]
+        self.assertEqual(roomba[3:], [350, 2])
+        self.assertEqual(len(compiled.exits), 2)
+        self.assertEqual(compiled.water.tolist(), [[15, 11, 13], [15, 16, 20]])
+
+    def test_MiscountCaughtAtCompileTime(self):
+        with self.assertRaises(LevelError):
+            compile_level(level_map_test, leveltest_param[:2])
+        with self.assertRaises(LevelError):
+            compile_level(level_map_test, leveltest_param + [[1]], strict = True)
+
+    def test_DiskCache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            compiled = load_level(level_map_test, leveltest_param, directory)
+            levelcompiler.compiled_levels.clear()
+            cached = load_level(level_map_test, leveltest_param, directory)
+            self.assertIsNot(cached, compiled)
+            self.assertTrue((cached.cells == compiled.cells).all())
+            self.assertEqual(cached.entities.tolist(), compiled.entities.tolist())
+            self.assertEqual(cached.water.tolist(), compiled.water.tolist())
+
+
+class Test_level_reset(unittest.TestCase):
+
+    def level_state(self, level):
+        return ([tuple(sprite.rect) for group in level.groups() for sprite in group], level.score,
+                [water.active for water in level.water], [lever.flipUse for lever in level.levers])
+
+    def test_ResetMatchesNewLevel(self):
+        self.level, self.screen = testArrange1()
+        fresh = self.level_state(self.level)
+        background = self.level.bg_image
+        tiles = self.level.tiles.sprites()
+        for water in self.level.water:
+            water.clean(self.level.tiles)
+        self.level.points.sprites()[0].kill()
+        self.level.score += 100
+        for step in range(30):
+            self.level.run(InputState.from_keys([pygame.K_d, pygame.K_RIGHT]))
+        self.assertNotEqual(self.level_state(self.level), fresh)
+        self.level.reset()
+        self.assertEqual(self.level_state(self.level), fresh)
+        self.assertIs(self.level.bg_image, background)
+        self.assertEqual(self.level.tiles.sprites(), tiles)
+
+
+class Test_snapshot(unittest.TestCase):
+
+    def test_RestoreRewindsTheLevel(self):
+        level = make_level(level_map_test, leveltest_param)
+        snapshot = level.snapshot()
+        start = level.state_hash()
+        points = len(level.points)
+        for water in level.water:
+            water.clean(level.tiles)
+        level.points.sprites()[0].kill()
+        simulate(level, [InputState.from_keys([pygame.K_d, pygame.K_RIGHT])] * 20)
+        self.assertNotEqual(level.state_hash(), start)
+        level.restore(snapshot)
+        self.assertEqual(level.state_hash(), start)
+        self.assertTrue(all(water.active for water in level.water))
+        self.assertEqual(len(level.points), points)
+
+    def test_Bytes(self):
+        level = make_level(level_map_test, leveltest_param)
+        simulate(level, [InputState.from_keys([pygame.K_a, pygame.K_UP])] * 10)
+        snapshot = level.snapshot()
+        copy = LevelSnapshot.from_bytes(snapshot.to_bytes())
+        self.assertEqual(copy, snapshot)
+        self.assertEqual(copy.state_hash(), snapshot.state_hash())
+
+
+class Test_replay(unittest.TestCase):
+
+    def record_session(self):
+        level = make_level(level_map_test, leveltest_param)
+        recording = start_recording(level)
+        for keys in ([pygame.K_d], [pygame.K_d, pygame.K_w], [], [pygame.K_LEFT, pygame.K_f], [pygame.K_UP]):
+            for step in range(25):
+                level.run(InputState.from_keys(keys, level.inputs), draw = False)
+        return level, recording
+
+    def test_ReplayMatchesSession(self):
+        level, recording = self.record_session()
+        self.assertEqual(recording.level_id, "test")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, recording.name)
+            recording.save(path)
+            loaded = Recording.load(path)
+        self.assertLess(len(loaded.to_bytes()), 125 * 8 + 200) #Inputs are run length packed, the hashes take the room
+        steps, outcome, diverged = replay(loaded)
+        self.assertEqual(steps, 125)
+        self.assertIsNone(diverged)
+        self.assertEqual(loaded.hashes[-1], level.state_hash())
+
+    def test_DivergenceFlagged(self):
+        level, recording = self.record_session()
+        recording.hashes[40] ^= 1
+        steps, outcome, diverged = replay(recording)
+        self.assertEqual(diverged, 40)
+
+
+class Test_profiler(unittest.TestCase):
+
+    def test_DisabledRecordsNothing(self):
+        profiler = Profiler(capacity = 8)
+        with profiler.scope("step"):
+            pass
+        self.assertEqual(profiler.count, 0)
+
+    def test_RingBufferAndChromeTrace(self):
+        profiler = Profiler(capacity = 8)
+        profiler.enabled = True
+        for frame in range(5):
+            with profiler.scope("step"):
+                with profiler.scope("collision"):
+                    pass
+            profiler.end_frame()
+        events = profiler.chrome_trace()["traceEvents"]
+        self.assertEqual(len(events), 8) #Oldest events overwritten
+        self.assertEqual(set(event["name"] for event in events), {"step", "collision"})
+        self.assertTrue(all(event["ph"] == "X" and event["dur"] >= 0 for event in events))
+        self.assertIn("step", profiler.phase_averages())
+
+    def test_LevelPhases(self):
+        from profiler import profiler
+        self.level, self.screen = testArrange1()
+        profiler.enabled = True
+        try:
+            self.level.run(no_input)
+            profiler.end_frame()
+            self.level.run(no_input)
+            profiler.end_frame()
+            phases = profiler.phase_averages()
+        finally:
+            profiler.enabled = False
+            profiler.clear()
+        for name in ("step", "chunk streaming", "patrol", "physics x", "physics y", "draw", "draw static", "draw sprites"):
+            self.assertIn(name, phases)
+
+
+class Test_hud(unittest.TestCase):
+
+    def test_ScoreRenderedOnlyWhenChanged(self):
+        self.level, self.screen = testArrange1()
+        score = self.level.hud.elements["score"]
+        for frame in range(3):
+            self.level.run()
+        self.assertEqual(score.renders, 1)
+        self.level.score += 100
+        self.level.run()
+        self.assertEqual(score.renders, 2)
+        self.assertEqual(score.text, "100")
+
+
+class Test_camera(unittest.TestCase):
+
+    def test_ShippedLevelsDontScroll(self):
+        self.level, self.screen = testArrange1()
+        self.level.janitor.sprite.rect.x = 1200
+        self.level.run()
+        self.assertEqual(self.level.camera.offset(), (0, 0))
+
+    def test_FollowsBothPlayers(self):
+        camera = Camera((1280, 720), (4600, 4600))
+        camera.follow([pygame.Rect(2000, 3000, 22, 38), pygame.Rect(2400, 3100, 30, 38)])
+        self.assertEqual(camera.view.center, (2215, 3069))
+        camera.follow([pygame.Rect(10, 4550, 22, 38), pygame.Rect(40, 4550, 30, 38)]) #Clamped to the level
+        self.assertEqual(camera.view.bottomleft, (0, 4600))
+        self.assertEqual(camera.to_world(camera.to_screen(pygame.Rect(300, 4000, 10, 10)).topleft), (300, 4000))
+
+    def test_LargeLevelDrawsOnlyTheView(self):
+        self.level, self.screen = testArrange1()
+        layout, params = generate_map(120, 80)
+        level = Level(layout, params, self.screen, "./imgs/stage1_lobby.png", dirty_rendering = True)
+        for frame in range(5):
+            level.run(InputState.from_keys([pygame.K_d, pygame.K_RIGHT], level.inputs))
+        banker = level.banker.sprite.rect
+        self.assertTrue(level.camera.visible(banker))
+        self.assertGreater(level.camera.offset()[1], 0)
+        self.assertLessEqual(len(level.static_layer.pages), 6)
+        for rect in level.drawn:
+            self.assertTrue(self.screen.get_rect().contains(rect))
+
+
+
+class Test_streaming(unittest.TestCase):
+
+    def setUp(self):
+        layout, params = generate_map(240, 40)
+        self.level = make_level(layout, params)
+
+    def move_players(self, x):
+        for player in (self.level.janitor.sprite, self.level.banker.sprite):
+            player.rect.x = x
+        self.level.chunks.update()
+
+    def test_OnlyChunksNearThePlayersAreLoaded(self):
+        chunks = self.level.chunks
+        self.assertTrue(chunks.streaming)
+        self.assertLess(len(chunks.loaded), chunks.chunk_cols * chunks.chunk_rows)
+        self.assertLess(len(self.level.tiles), sum(1 for cell in self.level.compiled.cells.flatten() if chr(cell) in "XAQ"))
+
+    def test_StateSurvivesEviction(self):
+        coin = self.level.points.sprites()[0]
+        key = (coin.rect.x // (16 * 46), coin.rect.y // (16 * 46))
+        coin_index = self.level.chunks.loaded[key].coins.index(coin)
+        coin.kill()
+        enemy = self.level.enemies.sprites()[0]
+        enemy_key = [key for key, chunk in self.level.chunks.loaded.items() if enemy in chunk.enemies][0]
+        enemy_index = self.level.chunks.loaded[enemy_key].enemies.index(enemy)
+        for tick in range(15):
+            enemy.update()
+        state = (enemy.rect.x, enemy.posFromStart, enemy.direction)
+        self.move_players(200 * 46)
+        self.assertNotIn(key, self.level.chunks.loaded)
+        self.move_players(3 * 46)
+        self.assertFalse(self.level.chunks.loaded[key].coins[coin_index].alive())
+        enemy = self.level.chunks.loaded[enemy_key].enemies[enemy_index]
+        self.assertEqual((enemy.rect.x, enemy.posFromStart, enemy.direction), state)
+
+    def test_ResetBringsBackEvictedCoins(self):
+        coins = len(self.level.points)
+        self.level.points.sprites()[0].kill()
+        self.move_players(200 * 46)
+        self.level.reset()
+        self.assertEqual(len(self.level.points), coins)
+
+    def test_WaterStreamsWithItsChunk(self):
+        self.assertTrue(any(not water.water_tiles for water in self.level.water)) #Far pools have no tiles yet
+        water = [water for water in self.level.water if water.water_tiles][0]
+        area = pygame.Rect(water.startX, water.Y, water.endX - water.startX, 46)
+        water.clean(self.level.tiles)
+        self.move_players(200 * 46)
+        self.assertEqual(water.water_tiles, [])
+        self.assertEqual(self.level.grid.query(area, "tiles"), [])
+        self.move_players(3 * 46)
+        self.assertFalse(water.active)
+        self.assertEqual(self.level.grid.query(area, "water"), [])
+        self.assertTrue(water.water_tiles)
+        self.assertEqual(len(self.level.grid.query(area, "tiles")), len(water.water_tiles))
+
+
+
+class Test_patrol(unittest.TestCase):
+
+    def test_ArraysMatchOneByOne(self):
+        import patrol
+        layout, params = generate_map(60, 200, seed = 3)
+        runs = []
+        vector_from_before = patrol.vector_from
+        for vector_from in (1000, 0):
+            patrol.vector_from = vector_from
+            level = make_level(layout, params)
+            level.chunks.load_all()
+            enemies = level.enemies.sprites()
+            seen = []
+            for tick in range(400):
+                target = enemies[tick % len(enemies)].rect
+                players = (pygame.Rect(target.x + (tick * 37) % 1200 - 600, target.y, 22, 38), pygame.Rect(0, 0, 30, 38))
+                spotted = level.patrol.update(level.enemies, players)
+                seen.append(None if spotted is None else (enemies.index(spotted[0]), spotted[1]))
+            runs.append((seen, [(enemy.rect.x, enemy.sight_rect.x, enemy.posFromStart, enemy.direction, enemy.image) for enemy in enemies]))
+        patrol.vector_from = vector_from_before
+        self.assertGreater(len(enemies), 20)
+        self.assertTrue(any(runs[0][0]))
+        self.assertEqual(runs[0], runs[1])
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -1,7 +1,8 @@
 import pygame
+from assets import load_image
 
 class Tile(pygame.sprite.Sprite):
     def __init__(self,pos,img):
         pygame.sprite.Sprite.__init__(self)
-        self.image = pygame.transform.scale(pygame.image.load(img), (46,46)).convert_alpha()
+        self.image = load_image(img, (46,46))
         self.rect = self.image.get_rect(topleft = pos)
\ No newline at end of file
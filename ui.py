@@ -0,0 +1,126 @@
+import pygame
+from assets import load_image
+from hud import get_font
+
+#--------------------------------------------------------
+# Menu scenes and buttons
+# Background and button images are scaled once per screen resolution and
+# kept, so drawing a menu frame never touches the disk
+#--------------------------------------------------------
+
+def screen_size():
+    return pygame.display.get_surface().get_size()
+
+
+#--------------------------------------------------------
+# Define Drawing Scenes
+#--------------------------------------------------------
+class Scene():
+    def __init__(self, screen, background, buttonArray, transparency = False):
+        self.screen = screen
+        self.buttons = buttonArray
+        # self.states = stateArray
+        self.background = background
+        self.transparency = transparency
+        self.backgroundphoto = None
+        self.resolution = None
+
+    def get_background(self):
+        resolution = screen_size()
+        if resolution != self.resolution:
+            self.resolution = resolution
+            if self.transparency:
+                self.backgroundphoto = load_image(self.background, resolution).copy() #own copy, set_alpha changes it
+                self.backgroundphoto.set_alpha(250)
+            else:
+                self.backgroundphoto = load_image(self.background, resolution, alpha = False)
+        return self.backgroundphoto
+
+    def update(self, mouse = None):
+        #mouse is the position from this frame's input snapshot
+        if mouse is None:
+            mouse = pygame.mouse.get_pos()
+        screen = pygame.display.get_surface()
+        screen.blit(self.get_background(), (0,0))
+        if self.transparency:
+            for individualButton in range(len(self.buttons)):
+                self.buttons[individualButton].draw(screen, mouse = mouse)
+        else:
+            for individualButton in range(len(self.buttons)):
+                self.buttons[individualButton].draw(self.screen, mouse = mouse)
+
+
+#--------------------------------------------------------
+# Define buttons
+#--------------------------------------------------------
+class button():
+    def __init__(self, x,y,width,height, text='', color = None,image=None, hovering_image=None, amplifier=None):
+        self.color = color
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.text = text
+        self.image = image
+        self.hovering_image = hovering_image
+        self.amplifier = amplifier
+        self.hovered = False
+        self.mouse = None #mouse position hover was last worked out for
+        self.resolution = None
+        self.text_surface = None
+
+    def layout(self):
+        #Scale the images and work out the clickable area for the current resolution
+        resolution = screen_size()
+        if resolution == self.resolution:
+            return
+        self.resolution = resolution
+        self.mouse = None
+        size = resolution[0] / 16
+        self.normal_surface = self.hover_surface = None
+        self.hit_width, self.hit_height = self.width, self.height
+        if self.image != None:
+            amplifier = 237.5 if self.amplifier == None else self.amplifier
+            #Buttons showing the same image share one decode and one scaled copy
+            rect_image = load_image(self.image).get_rect()
+            scaled = ((rect_image.width/(amplifier*16))*size*16,(rect_image.height/(amplifier*9))*size*9)
+            self.normal_surface = load_image(self.image, scaled)
+            rect_hover = load_image(self.hovering_image).get_rect()
+            scaled_hover = ((rect_hover.width/(amplifier*16))*size*16,(rect_hover.height/(amplifier*9))*size*9)
+            self.hover_surface = load_image(self.hovering_image, scaled_hover)
+            self.hit_width, self.hit_height = scaled
+
+    def draw(self,win,outline=None,mouse=None):
+        #Call this method to draw the button on the screen
+        if self.color != None:
+            if outline:
+                pygame.draw.rect(win, outline, (self.x-2,self.y-2,self.width+4,self.height+4),0)
+
+            pygame.draw.rect(win, self.color, (self.x,self.y,self.width,self.height),0)
+
+        if self.text != '':
+            if self.text_surface == None:
+                font = get_font('comicsans', 60)
+                self.text_surface = font.render(self.text, 1, (0,0,0))
+            text = self.text_surface
+            win.blit(text, (self.x + (self.width/2 - text.get_width()/2), self.y + (self.height/2 - text.get_height()/2)))
+
+        if self.image != None:
+            self.layout()
+            self.update_hover(pygame.mouse.get_pos() if mouse is None else mouse)
+            win.blit(self.hover_surface if self.hovered else self.normal_surface, (self.x, self.y))
+
+    def update_hover(self, pos):
+        if pos != self.mouse: #Only recheck when the mouse moved
+            self.mouse = pos
+            self.hovered = self.isOver(pos)
+        return self.hovered
+
+    def isOver(self, pos):
+        #Pos is the mouse position or a tuple of (x,y) coordinates
+        self.layout()
+        if pos[0] > self.x and pos[0] < self.x + self.hit_width:
+            if pos[1] > self.y and pos[1] < self.y + self.hit_height:
+                return True
+
+        return False
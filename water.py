@@ -1,24 +1,136 @@
 import pygame
+from bisect import bisect_left, bisect_right
 from tiles import Tile
 
 class Water():
-    def __init__(self, tiles, startX, endX, Y):
-        self.tiles = tiles
+    def __init__(self, tiles, startX, endX, Y, index = None):
+        self.tiles = tiles #The level's group of water tiles, the pool's own are water_tiles
         self.startX = startX
         self.endX = endX
         self.Y = Y
         self.active = True
+        self.water_tiles = [] #Of the loaded part of the pool, see streaming.py
+        self.floor_tiles = {} #Water tile -> floor laid over it, made the first time the pool is cleaned and reused
+        self.index = index #WaterIndex of the level's active pools
+        if index is not None:
+            index.add(self)
     
     def draw(self, surface):
-        self.tiles.draw(surface)
+        if self.active:
+            for tile in self.water_tiles:
+                surface.blit(tile.image, tile.rect)
         
     def clean(self, tilesGroup):
-        for water in self.tiles.sprites():
-            tile = Tile((water.rect.topleft[0],water.rect.topleft[1]), "./imgs/floor1.png")
-            tilesGroup.add(tile)
-            water.kill()
+        #Swap the whole pool to floor in one go, the floor tiles share the one floor image
+        if not self.active:
+            return
+        tilesGroup.add(self.floors(self.water_tiles))
+        self.tiles.remove(self.water_tiles)
         self.active = False
-        
-    
-        
-    
\ No newline at end of file
+        if self.index is not None:
+            self.index.remove(self)
+
+    def flood(self, tilesGroup):
+        #Undo clean()
+        if self.active:
+            return
+        tilesGroup.remove(self.floors(self.water_tiles))
+        self.tiles.add(self.water_tiles)
+        self.active = True
+        if self.index is not None:
+            self.index.add(self)
+
+    def floors(self, water_tiles):
+        floors = []
+        for water in water_tiles:
+            floor = self.floor_tiles.get(water)
+            if floor is None:
+                floor = self.floor_tiles[water] = Tile(water.rect.topleft, "./imgs/floor1.png")
+            floors.append(floor)
+        return floors
+
+    def load(self, water_tiles, tilesGroup):
+        #Part of the pool came into a loaded chunk, as water or as floor if it was cleaned
+        self.water_tiles.extend(water_tiles)
+        if self.active:
+            self.tiles.add(water_tiles)
+        else:
+            tilesGroup.add(self.floors(water_tiles))
+
+    def unload(self, water_tiles):
+        #The chunk holding part of the pool was evicted
+        for water in water_tiles:
+            self.water_tiles.remove(water)
+            water.kill()
+            floor = self.floor_tiles.pop(water, None)
+            if floor is not None:
+                floor.kill()
+
+
+#--------------------------------------------------------
+# Active water by row
+# Every pool is one span of a row, so the pools still active are kept per row
+# as sorted spans (pools in a row never touch, the level compiler joins
+# neighbouring water cells into one pool). Finding the pool under a foot
+# position is a dict lookup and a binary search, and a cleaned pool is taken
+# out, so once every pool is clean the hazard check is a single empty test.
+#--------------------------------------------------------
+class WaterIndex():
+    def __init__(self, tile_size):
+        self.tile_size = tile_size
+        self.rows = {} #y -> ([startX], [endX], [pool]) sorted by x
+
+    def __len__(self):
+        return sum(len(pools) for starts, ends, pools in self.rows.values())
+
+    def add(self, pool):
+        starts, ends, pools = self.rows.setdefault(pool.Y, ([], [], []))
+        index = bisect_left(starts, pool.startX)
+        starts.insert(index, pool.startX)
+        ends.insert(index, pool.endX)
+        pools.insert(index, pool)
+
+    def remove(self, pool):
+        starts, ends, pools = self.rows[pool.Y]
+        index = pools.index(pool)
+        del starts[index], ends[index], pools[index]
+        if not pools:
+            del self.rows[pool.Y]
+
+    def rebuild(self, pools):
+        #After the pools were set straight back to a saved state
+        self.rows.clear()
+        for pool in pools:
+            if pool.active:
+                self.add(pool)
+
+    def pool_at(self, x, y):
+        #The active pool whose surface is at height y and reaches x (ends included)
+        row = self.rows.get(y)
+        if row is None:
+            return None
+        starts, ends, pools = row
+        index = bisect_left(ends, x)
+        if index < len(ends) and starts[index] <= x:
+            return pools[index]
+        return None
+
+    def over_water(self, rect):
+        #Are the rect's feet in the top half of an active pool, or standing on it
+        #more than 10px in from its ends
+        if not self.rows:
+            return False
+        bottom = rect.bottom
+        y = bottom - bottom % self.tile_size #The only row either can be true for
+        row = self.rows.get(y)
+        if row is None:
+            return False
+        if bottom == y:
+            inset = 10
+        elif bottom - y < self.tile_size // 2 and rect.top < y + self.tile_size:
+            inset = 0
+        else:
+            return False
+        starts, ends, pools = row
+        index = bisect_right(ends, rect.left + inset)
+        return index < len(ends) and starts[index] + inset < rect.right